@@ -12,8 +12,19 @@ from pathlib import Path
 import cv2
 from dotenv import load_dotenv
 from PIL import Image
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+from smart_cut import render_smart_cut_text
+from text_fanout import TEXT_FANOUT, render_text_batch
+from media_probe import prepare_concat_inputs
+from ffmpeg_runner import run_ffmpeg
+from encode_metrics import metrics_row
+from asset_cache import ensure_audio_track
+from render_graph import audio_encode_args
+from encoder_profiles import profile_for
+from generate_mask import ensure_mask
+from sheet_writeback import SheetWriteBuffer
+from sheets_client import backoff_delay
+from sheet_backend import open_worksheet
+from sheet_mirror import SHEET_MIRROR, SheetMirror
 
 # Constants
 FPS = 30
@@ -31,15 +42,10 @@ BATCH_SIZE = 3  # Read/process 4 rows at a time (customize as needed)
 START_DATA_ROW = 2  # Data starts at row 2 if row 1 is your header
 POLL_INTERVAL = 30  # Seconds to wait before rechecking 'Screenshot' cell
 MAX_POLL_RETRIES = 100  # Maximum number of retries to wait for 'Screenshot'
+TEXT_START = 0  # Company name is shown between these seconds of NeedTextOverlay.mp4
+TEXT_END = 15
 maxretries=500
-try:
-    result = subprocess.run(["python", "generate_mask.py"], capture_output=True, text=True, check=True)
-    print("generate_mask.py output:", result.stdout)
-    print("generate_mask.py error (if any):", result.stderr)
-except subprocess.CalledProcessError as e:
-    print(f"generate_mask.py failed with return code {e.returncode}")
-    print(f"Error output: {e.stderr}")
-    raise
+mask_geometry = ensure_mask()  # Cached by content: face detection only reruns when base.mp4 or the model changes
 
 # Load Environment Variables
 load_dotenv(dotenv_path="./.env")
@@ -49,10 +55,14 @@ CREDENTIALS_PATH = os.getenv("GOOGLE_CREDENTIALS")  # e.g., "service_account.jso
 
 # Logging Setup
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
-mask_height = os.getenv("MASK_HEIGHT")  # returns a string, e.g. "700"
-mask_width = os.getenv("MASK_WIDTH")    # returns a string, e.g. "393"
-mask_left = os.getenv("MASK_LEFT")      # returns a string, e.g. "10"
-mask_bottom = os.getenv("MASK_BOTTOM")  # returns a string, e.g. "10"
+mask_height = mask_geometry["MASK_HEIGHT"]  # a string, e.g. "700"
+mask_width = mask_geometry["MASK_WIDTH"]    # a string, e.g. "393"
+mask_left = mask_geometry["MASK_LEFT"]      # a string, e.g. "10"
+mask_bottom = mask_geometry["MASK_BOTTOM"]  # a string, e.g. "10"
+SMART_CUT_TEXT = os.getenv("SMART_CUT_TEXT", "true").lower() == "true"  # Re-encode only the part of the template that shows text
+STATIC_AUDIO_CACHE = os.getenv("STATIC_AUDIO_CACHE", "true").lower() == "true"  # Encode the template audio once, copy it per row
+template_audio = None  # Pre-encoded NeedTextOverlay.mp4 audio, set in main()
+ENCODER = profile_for(NEED_TO_OVERLAY_VIDEO_PATH)  # ENCODER_PROFILE, or this template's TEMPLATE_ENCODER_PROFILES entry
 # Ensure necessary directories exist
 for folder in [OUTPUT_DIR, FRAMES_DIR,CONCAT_DIR]:
     folder.mkdir(parents=True, exist_ok=True)
@@ -61,14 +71,11 @@ for folder in [OUTPUT_DIR, FRAMES_DIR,CONCAT_DIR]:
 
 def get_google_sheet():
     """
-    Returns a gspread worksheet object for the specified TAB_NAME in the .env config.
+    Returns the worksheet for the specified TAB_NAME in the .env config
+    (or the local stand-in when SHEET_BACKEND=local), wrapped in the
+    rate-limited, retrying SheetsClient.
     """
-    scope = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_PATH, scope)
-    client = gspread.authorize(creds)
-    spreadsheet = client.open_by_url(SHEET_URL)
-    worksheet = spreadsheet.worksheet(TAB_NAME)
-    return worksheet
+    return open_worksheet(CREDENTIALS_PATH, SHEET_URL, TAB_NAME)
 
 def ensure_directory_exists(path):
     path.mkdir(parents=True, exist_ok=True)
@@ -76,16 +83,19 @@ def ensure_directory_exists(path):
 def sanitize_filename(url):
     return "".join(c if c.isalnum() else "_" for c in url)
 
+def row_value(row_data, headers, column):
+    """Stripped cell of the named column, "" when the row is shorter."""
+    index = headers.index(column)
+    return row_data[index].strip() if index < len(row_data) else ""
 
-async def create_overlay_and_merge_videos(text_overlay_path, output_path,website_url,company_name):
 
-        # Step 3: Command to create text overlay video
-        # Absolute font file path (escaped backslashes)
+def company_drawtext(company_name):
+    # Absolute font file path (escaped backslashes)
     font_path = r"Roboto-Regular.ttf"
 
         # Define dynamic text overlays
     texts = [
-        (company_name, "black", 0, 15, "740", "842"),  # Example text
+        (company_name, "black", TEXT_START, TEXT_END, "740", "842"),  # Example text
     ]
 
     # Build the drawtext filter
@@ -96,20 +106,60 @@ async def create_overlay_and_merge_videos(text_overlay_path, output_path,website
         )
 
     # Combine all filters into a single filter_complex
-    filter_complex = f"[0:v]scale=1920:1080,format=yuv420p," + ",".join(drawtext_filters)
+    return ",".join(drawtext_filters)
+
+
+def text_codec_settings():
+    """Video (and, without the pre-encoded template audio, audio) encoder args of the text pass."""
+    text_codec_args = list(ENCODER.video_args)  # Codec, speed and quality of the selected profile
+    if template_audio is None:
+        text_codec_args += audio_encode_args(ENCODER)
+    return text_codec_args
+
+
+async def prerender_text_segments(jobs):
+    """
+    jobs is a list of (company_name, text_overlay_path) for a batch's rows.
+    Renders all their text segments from one decode of the template and
+    returns the set of paths that are ready.
+    """
+    if len(jobs) < 2:
+        return set()  # Nothing to share; the row renders it as usual
+    rendered = await render_text_batch(
+        NEED_TO_OVERLAY_VIDEO_PATH,
+        [(company_drawtext(company_name), text_overlay_path) for company_name, text_overlay_path in jobs],
+        text_codec_settings(),
+        TEXT_END,
+        template_audio,
+        SMART_CUT_TEXT,
+    )
+    return set(rendered)
+
+
+async def create_overlay_and_merge_videos(text_overlay_path, output_path,website_url,company_name,text_ready=False):
+
+        # Step 3: Command to create text overlay video
+    drawtext = company_drawtext(company_name)
+    filter_complex = f"[0:v]scale=1920:1080,format=yuv420p," + drawtext + " [vtext]"
+
+    text_codec_args = text_codec_settings()
+    if template_audio is not None:
+        text_audio_inputs = ["-i", str(template_audio)]  # Template audio, encoded once in main()
+        text_audio_args = ["-map", "1:a", "-c:a", "copy"]
+    else:
+        text_audio_inputs = []
+        text_audio_args = ["-map", "0:a"]
 
     # FFmpeg command
     textoverlay_command = [
         "ffmpeg",
         "-y",  # Overwrite output without prompting
         "-i",NEED_TO_OVERLAY_VIDEO_PATH,  # Input video file
+        *text_audio_inputs,
         "-filter_complex", filter_complex,  # Apply scaling, formatting, and text overlay
-        "-c:v", "libx264",  # Use H.264 codec for video encoding
-        "-preset", "slow",  # High-quality compression preset
-        "-crf", "16",  # High video quality (lower CRF = better quality)
-        "-c:a", "aac",  # Audio codec
-        "-b:a", "320k",  # High-quality audio bitrate
-        "-ar", "48000",  # Audio sample rate
+        "-map", "[vtext]",
+        *text_audio_args,
+        *text_codec_args,
         "-shortest",  # Stop when the shortest stream ends
         "-r", "30",  # Set frame rate to 30 FPS
         "-threads", "0",  # Use all available CPU threads
@@ -117,16 +167,26 @@ async def create_overlay_and_merge_videos(text_overlay_path, output_path,website
     ]
 
     # Run FFmpeg command
+    concat_list = f"{sanitize_filename(website_url)}.txt"
     try:
-        print("Processing video with text overlays...")
-        print("FFmpeg Command:", " ".join( textoverlay_command))  # Debugging
-        subprocess.run( textoverlay_command, check=True)
-        print(f"Processed video saved at: {text_overlay_path}")
-        concat_list = f"{sanitize_filename(website_url)}.txt"
+        smart_cut_done = text_ready  # Already rendered by the batch's fan-out
+        if SMART_CUT_TEXT and not smart_cut_done:
+            smart_cut_done = await render_smart_cut_text(
+                NEED_TO_OVERLAY_VIDEO_PATH, drawtext, text_codec_args, TEXT_END, text_overlay_path, template_audio
+            )
+        if not smart_cut_done:
+            logging.info("Processing video with text overlays...")
+            logging.debug(f"FFmpeg command: {' '.join(textoverlay_command)}")
+            await run_ffmpeg(textoverlay_command, stage="text")
+        logging.info(f"Processed video saved at: {text_overlay_path}")
+        # Refuse mismatched copy-concats up front; static parts are normalized once if needed
+        concat_inputs = await prepare_concat_inputs(
+            [(first_path, True), (text_overlay_path, False), (LAST_EXPLANATION_VIDEO_PATH, True)],
+            ENCODER,
+        )
         with open(concat_list, "w") as file:
-            file.write(f"file '{first_path}'\n")
-            file.write(f"file '{text_overlay_path}'\n")
-            file.write(f"file '{LAST_EXPLANATION_VIDEO_PATH}'\n")
+            for concat_input in concat_inputs:
+                file.write(f"file '{concat_input}'\n")
         
         # Step 4: Command to concatenate videos
         merge_command = [
@@ -140,7 +200,7 @@ async def create_overlay_and_merge_videos(text_overlay_path, output_path,website
 
         # Step 5: Run video merging
         try:
-            await asyncio.to_thread(subprocess.run, merge_command, check=True)
+            await run_ffmpeg(merge_command, stage="concat")
             logging.info(f"Merged video created: {output_path}")
 
         except subprocess.CalledProcessError as e:
@@ -163,21 +223,15 @@ async def create_overlay_and_merge_videos(text_overlay_path, output_path,website
             
 async def update_google_sheet_cell(worksheet, cell, value):
     """
-    Updates a single cell in the sheet with retries on network errors.
+    Updates a single cell in the sheet. Rate limiting and retries on quota
+    and network errors happen in SheetsClient.
     """
-    for attempt in range(maxretries):
-        try:
-            worksheet.update_acell(cell, value)
-            logging.info(f"Updated {cell} with value: {value}")
-            return
-        except Exception as e:
-            if attempt < maxretries-1:
-                wait_time = 30
-                logging.warning(f"Failed to update {cell}: {e}. Retrying in {wait_time} seconds... (Attempt {attempt + 1})")
-                await asyncio.sleep(wait_time)
-            else:
-                logging.error(f"Max retries reached. Unable to update {cell}. Error: {e}")
-                raise
+    try:
+        await asyncio.to_thread(worksheet.update_acell, cell, value)
+        logging.info(f"Updated {cell} with value: {value}")
+    except Exception as e:
+        logging.error(f"Unable to update {cell}. Error: {e}")
+        raise
        
 
 
@@ -186,7 +240,7 @@ async def update_google_sheet_cell(worksheet, cell, value):
 
 
 
-async def process_row(global_row_idx, row_data, headers, worksheet):
+async def process_row(global_row_idx, row_data, headers, worksheet, text_ready=False):
     """
     Generate a personal video for a single row.
     Poll until 'Screenshot' cell is populated if initially empty.
@@ -202,6 +256,7 @@ async def process_row(global_row_idx, row_data, headers, worksheet):
             company_name = row_data[companyname_index].strip() if companyname_index < len(row_data) else ""
 
             row_number_in_sheet = global_row_idx + 2  # +2 because data starts at row 2 in the sheet
+            metrics_row.set(row_number_in_sheet)  # Tags this row's ffmpeg metrics
 
             # --- Polling logic: wait until 'Screenshot' cell is non-empty ---
 
@@ -217,7 +272,7 @@ async def process_row(global_row_idx, row_data, headers, worksheet):
                 # Create the overlay video
                 logging.info(f"Row {row_number_in_sheet}: Creating video for {website_url}")
                 # await create_and_overlay_video(frames_subdir, video_path)
-                await create_overlay_and_merge_videos(text_overlay_path,video_path,website_url,company_name)
+                await create_overlay_and_merge_videos(text_overlay_path,video_path,website_url,company_name,text_ready)
                 
                 logging.info(f"SUCCCCCCCCCCCCCCCCRow {row_number_in_sheet}: Video created successfully for {website_url}")
                 return (row_number_in_sheet, str(video_path))
@@ -236,9 +291,9 @@ async def process_row(global_row_idx, row_data, headers, worksheet):
                     
         except Exception as e:
             if attempt < maxretries-1:
-                wait_time = 30
-                logging.warning(f"Failed to connect to Google Sheets. Retrying in {wait_time} seconds... (Attempt {attempt + 1})")
-                asyncio.sleep(wait_time)
+                wait_time = backoff_delay(attempt)  # Jittered, so rows that failed together do not retry together
+                logging.warning(f"Row attempt failed: {e}. Retrying in {wait_time:.1f} seconds... (Attempt {attempt + 1})")
+                await asyncio.sleep(wait_time)
             else:
                 logging.error("Max retries reached. Unable to connect to Google Sheets.")
                 raise           
@@ -359,18 +414,36 @@ def binary_search_first_empty(all_values, start, end, col_index):
 
 
 async def main():
+    global template_audio
+    if STATIC_AUDIO_CACHE:
+        try:
+            template_audio = await ensure_audio_track(NEED_TO_OVERLAY_VIDEO_PATH, audio_encode_args(ENCODER))
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+            logging.error(f"Could not pre-encode template audio, encoding it per row instead: {e}")
+
     worksheet = get_google_sheet()
     # Ensure 'Personal Video' column exists
     headers, personal_video_index = ensure_personal_video_column(worksheet)
 
-    # Determine total number of data rows (excluding header)
-    all_values = worksheet.get_all_values()
-    total_rows = len(all_values) - 1  # excluding header row
-    logging.info(f"Total data rows found: {total_rows}")
-    
-     # Update START_DATA_ROW to the first row with an empty 'Personal Video' column
     global START_DATA_ROW
-    START_DATA_ROW = binary_search_first_empty(all_values, START_DATA_ROW, total_rows, personal_video_index)
+    mirror = None
+    if SHEET_MIRROR:
+        # Local copy of the sheet: one read for every row, only changed rows are written
+        mirror = SheetMirror(worksheet, "Personal Video")
+        mirror.sync(headers)
+        total_rows = mirror.last_row() - 1  # excluding header row
+        logging.info(f"Total data rows found: {total_rows}")
+        first_pending = mirror.first_pending_row()
+        # Same 0-based index into all rows (header included) that the binary search returns
+        START_DATA_ROW = None if first_pending is None else first_pending - 1
+    else:
+        # Determine total number of data rows (excluding header)
+        all_values = worksheet.get_all_values()
+        total_rows = len(all_values) - 1  # excluding header row
+        logging.info(f"Total data rows found: {total_rows}")
+
+        # Update START_DATA_ROW to the first row with an empty 'Personal Video' column
+        START_DATA_ROW = binary_search_first_empty(all_values, START_DATA_ROW, total_rows, personal_video_index)
 
     if START_DATA_ROW is None:
         logging.info("No unprocessed rows found. All rows are already processed.")
@@ -378,77 +451,99 @@ async def main():
         logging.info(f"Updated START_DATA_ROW to: {START_DATA_ROW + 1}")  # Adjust for 1-based indexing
 
     start_row = START_DATA_ROW  # e.g., row 2
-    while True:
-        end_row = start_row + BATCH_SIZE - 1
-        range_str = f"A{start_row}:Z{end_row}"  # Adjust columns to match your sheet
-        logging.info(f"Reading batch rows {start_row} to {end_row}")
-        batch_data = worksheet.get_values(range_str)
-        if not batch_data:
-            logging.info("No more data to process. Exiting.")
-            break
-
-        tasks = []
-        row_number_mapping = []  # To keep track of row numbers for tasks
-        for row_idx_in_batch, row_data in enumerate(batch_data):
-            global_row_idx = (start_row - 2) + row_idx_in_batch  # 0-based index for entire data
-            row_number_in_sheet = global_row_idx + 2  # +2 because data starts at row 2
-
-            if not any(cell.strip() for cell in row_data):
-                logging.info(f"Skipping empty row at {row_number_in_sheet}")
-                continue
-
-            # Check if 'Personal Video' is already set
-            personal_video_value = ""
-            if personal_video_index < len(row_data):
-                personal_video_value = row_data[personal_video_index].strip()
-
-            if personal_video_value:
-                #logging.info(f"Skipping row {row_number_in_sheet}, 'Personal Video' already set.")
-                continue
-
-            # Append the task to process this row
-            tasks.append(process_row(global_row_idx, row_data, headers, worksheet))
-
-        if tasks:
-            # Execute tasks concurrently
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            # Update the sheet with personal video link or 'Error'
-            for result in results:
-                if isinstance(result, tuple) and len(result) == 2:
-                    row_number_in_sheet, value = result
-                    personal_video_letter = column_index_to_letter(personal_video_index)
-                    personal_video_cell = f"{personal_video_letter}{row_number_in_sheet}"
-
-                    if value == "Error":
-                        # Update the cell with 'Error'
-                        await update_google_sheet_cell(worksheet, personal_video_cell, "Error")
-                        logging.info(f"Row {row_number_in_sheet}: Set 'Personal Video' to 'Error'")
+    # Results are written in batches; the buffer flushes on size, on time and on the way out
+    async with SheetWriteBuffer(worksheet) as writeback:
+        while True:
+            end_row = start_row + BATCH_SIZE - 1
+            range_str = f"A{start_row}:Z{end_row}"  # Adjust columns to match your sheet
+            logging.info(f"Reading batch rows {start_row} to {end_row}")
+            if mirror:
+                # Re-sync once the mirror is older than SHEET_MIRROR_MAX_AGE; otherwise no request
+                mirror.refresh()
+                batch_data = mirror.rows(start_row, end_row)
+            else:
+                batch_data = worksheet.get_values(range_str)
+            if not batch_data:
+                logging.info("No more data to process. Exiting.")
+                break
+
+            tasks = []
+            row_number_mapping = []  # To keep track of row numbers for tasks
+            pending_rows = []
+            for row_idx_in_batch, row_data in enumerate(batch_data):
+                global_row_idx = (start_row - 2) + row_idx_in_batch  # 0-based index for entire data
+                row_number_in_sheet = global_row_idx + 2  # +2 because data starts at row 2
+
+                if not any(cell.strip() for cell in row_data):
+                    logging.info(f"Skipping empty row at {row_number_in_sheet}")
+                    continue
+
+                # Check if 'Personal Video' is already set
+                personal_video_value = ""
+                if personal_video_index < len(row_data):
+                    personal_video_value = row_data[personal_video_index].strip()
+
+                if personal_video_value:
+                    #logging.info(f"Skipping row {row_number_in_sheet}, 'Personal Video' already set.")
+                    continue
+
+                pending_rows.append((global_row_idx, row_data))
+
+            # One template decode for the whole batch's text segments
+            fanout_jobs = [
+                (row_value(row_data, headers, "Company Name"), OUTPUT_DIR / f"{sanitize_filename(row_value(row_data, headers, 'Website URL'))}_text.mp4")
+                for _, row_data in pending_rows
+            ]
+            text_ready = await prerender_text_segments(fanout_jobs) if TEXT_FANOUT else set()
+            for (global_row_idx, row_data), (_, text_overlay_path) in zip(pending_rows, fanout_jobs):
+                # Append the task to process this row
+                tasks.append(process_row(global_row_idx, row_data, headers, worksheet, text_overlay_path in text_ready))
+
+            if tasks:
+                # Execute tasks concurrently
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+
+                # Update the sheet with personal video link or 'Error'
+                for result in results:
+                    if isinstance(result, tuple) and len(result) == 2:
+                        row_number_in_sheet, value = result
+                        personal_video_letter = column_index_to_letter(personal_video_index)
+                        personal_video_cell = f"{personal_video_letter}{row_number_in_sheet}"
+                        if mirror:
+                            mirror.set_status(row_number_in_sheet, value)
+
+                        if value == "Error":
+                            # Update the cell with 'Error'
+                            await writeback.add(personal_video_cell, "Error")
+                            logging.info(f"Row {row_number_in_sheet}: Set 'Personal Video' to 'Error'")
+                        else:
+                            # Update the cell with the video path
+                            await writeback.add(personal_video_cell, value)
+                            logging.info(f"Row {row_number_in_sheet}: Set 'Personal Video' to video path")
+                    elif isinstance(result, Exception):
+                        # If the coroutine raised an exception, mark as 'Error'
+                        # Note: In this implementation, exceptions should be handled within process_row,
+                        # so this block might not be reached. Included for completeness.
+                        logging.error(f"Unexpected exception: {result}")
+                        # Optionally, you can attempt to determine the row number here if needed
                     else:
-                        # Update the cell with the video path
-                        await update_google_sheet_cell(worksheet, personal_video_cell, value)
-                        logging.info(f"Row {row_number_in_sheet}: Set 'Personal Video' to video path")
-                elif isinstance(result, Exception):
-                    # If the coroutine raised an exception, mark as 'Error'
-                    # Note: In this implementation, exceptions should be handled within process_row,
-                    # so this block might not be reached. Included for completeness.
-                    logging.error(f"Unexpected exception: {result}")
-                    # Optionally, you can attempt to determine the row number here if needed
-                else:
-                    # For any unexpected result types, mark as 'Error'
-                    logging.error(f"Unexpected result type: {result}")
-        else:
-            logging.info(f"No tasks to process in batch rows {start_row} to {end_row}")
+                        # For any unexpected result types, mark as 'Error'
+                        logging.error(f"Unexpected result type: {result}")
+            else:
+                logging.info(f"No tasks to process in batch rows {start_row} to {end_row}")
             
-        # Rest for 2 seconds before moving to the next batch
-        logging.info(f"Completed batch rows {start_row} to {end_row}. Resting for 2 seconds...")
-        await asyncio.sleep(1)
-
-        # Move to the next batch
-        start_row = end_row + 1
-        if (start_row - 1) > (total_rows + 1):
-            logging.info("We've processed up to or beyond the last row.")
-            break
+            # Rest for 2 seconds before moving to the next batch
+            logging.info(f"Completed batch rows {start_row} to {end_row}. Resting for 2 seconds...")
+            await asyncio.sleep(1)
+
+            # Move to the next batch
+            start_row = end_row + 1
+            if (start_row - 1) > (total_rows + 1):
+                logging.info("We've processed up to or beyond the last row.")
+                break
+
+    worksheet.log_stats()
+
 
 if __name__ == "__main__":
     asyncio.run(main())
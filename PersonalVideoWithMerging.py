@@ -9,12 +9,32 @@ import numpy as np
 import logging
 import shutil
 import subprocess
+import time
 from pathlib import Path
 import cv2
 from dotenv import load_dotenv
 from PIL import Image
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+from background import still_hold_input, still_hold_filter, still_hold_scale
+from frame_sink import pipe_input_args, peek_frame_size, stream_frames_to_ffmpeg
+from scroll_engine import plan_scroll, plan_scroll_for_image, scroll_offsets, scroll_filter, scroll_input, total_frames
+from screenshot_loader import ScreenshotStrips
+from render_graph import FONT_PATH, audio_encode_args, escape_drawtext, build_drawtext_filters, build_single_pass_command, first_segment_duration, static_audio_segments, write_audio_concat_list
+from asset_cache import ensure_audio_track, ensure_speaker_asset
+from segment_cache import SegmentCache, normalize_company_text
+from smart_cut import render_smart_cut_text
+from text_fanout import TEXT_FANOUT, render_text_batch
+from media_probe import prepare_concat_inputs, video_duration
+from ffmpeg_runner import default_scheduler, run_ffmpeg
+from chunked_render import CHUNK_GOP_FRAMES, chunk_ranges, output_frame_count, plan_chunk_count, render_chunked
+from encode_metrics import metrics_row
+from pyav_backend import PyAvRenderer
+from encoder_profiles import profile_for, x264_options
+from generate_mask import ensure_mask
+from sheet_writeback import SheetWriteBuffer
+from sheets_client import backoff_delay
+from sheet_backend import open_worksheet
+from sheet_mirror import SHEET_MIRROR, SheetMirror
+from screenshot_watcher import ScreenshotWatcher
 
 # Constants
 FPS = 30
@@ -31,15 +51,13 @@ BATCH_SIZE = 3  # Read/process 4 rows at a time (customize as needed)
 START_DATA_ROW = 2  # Data starts at row 2 if row 1 is your header
 POLL_INTERVAL = 30  # Seconds to wait before rechecking 'Screenshot' cell
 MAX_POLL_RETRIES = 100  # Maximum number of retries to wait for 'Screenshot'
+SCREENSHOT_WAIT_SECONDS = POLL_INTERVAL * MAX_POLL_RETRIES  # How long a row waits for its 'Screenshot' cell
+screenshot_watcher = None  # ScreenshotWatcher for the 'Screenshot' column, set in main()
+HOLD_SECONDS = 3  # Length of the static website hold at the start of the video
+TEXT_START = 0  # "Prepared For" text is shown between these seconds of NeedTextOverlay.mp4
+TEXT_END = 40
 maxretries=500
-try:
-    result = subprocess.run(["python", "generate_mask.py"], capture_output=True, text=True, check=True)
-    print("generate_mask.py output:", result.stdout)
-    print("generate_mask.py error (if any):", result.stderr)
-except subprocess.CalledProcessError as e:
-    print(f"generate_mask.py failed with return code {e.returncode}")
-    print(f"Error output: {e.stderr}")
-    raise
+mask_geometry = ensure_mask()  # Cached by content: face detection only reruns when base.mp4 or the model changes
 
 # Load Environment Variables
 load_dotenv(dotenv_path="./.env")
@@ -49,10 +67,23 @@ CREDENTIALS_PATH = os.getenv("GOOGLE_CREDENTIALS")  # e.g., "service_account.jso
 
 # Logging Setup
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
-mask_height = os.getenv("MASK_HEIGHT")  # returns a string, e.g. "700"
-mask_width = os.getenv("MASK_WIDTH")    # returns a string, e.g. "393"
-mask_left = os.getenv("MASK_LEFT")      # returns a string, e.g. "10"
-mask_bottom = os.getenv("MASK_BOTTOM")  # returns a string, e.g. "10"
+mask_height = mask_geometry["MASK_HEIGHT"]  # a string, e.g. "700"
+mask_width = mask_geometry["MASK_WIDTH"]    # a string, e.g. "393"
+mask_left = mask_geometry["MASK_LEFT"]      # a string, e.g. "10"
+mask_bottom = mask_geometry["MASK_BOTTOM"]  # a string, e.g. "10"
+BACKGROUND_MODE = os.getenv("BACKGROUND_MODE", "still")  # still (looped screenshot) | pipe (raw frames over stdin) | frames (PNG directory)
+SCROLL_BACKGROUND = os.getenv("SCROLL_BACKGROUND", "false").lower() == "true"  # hold -> scroll -> hold over the full-page screenshot
+RENDER_PIPELINE = os.getenv("RENDER_PIPELINE", "single")  # single (one ffmpeg pass) | three_step (overlay, text, concat-copy; the only one that uses TEXT_FANOUT) | chunked (single pass split across free slots)
+SPEAKER_ASSET_CACHE = os.getenv("SPEAKER_ASSET_CACHE", "true").lower() == "true"  # Pre-render the masked speaker once
+speaker_asset = None  # Set in main() when the cached speaker asset is available
+TEXT_SEGMENT_CACHE = os.getenv("TEXT_SEGMENT_CACHE", "true").lower() == "true"  # Reuse rendered "Prepared For" segments
+text_segment_cache = SegmentCache()
+SMART_CUT_TEXT = os.getenv("SMART_CUT_TEXT", "true").lower() == "true"  # Re-encode only the part of the template that shows text
+RENDER_BACKEND = os.getenv("RENDER_BACKEND", "ffmpeg")  # ffmpeg (subprocess per row, reference) | pyav (in-process, static inputs kept warm)
+pyav_renderer = None  # Set in main() when RENDER_BACKEND=pyav
+STATIC_AUDIO_CACHE = os.getenv("STATIC_AUDIO_CACHE", "true").lower() == "true"  # Encode static audio once, copy it per row
+static_audio = {}  # Static video path -> pre-encoded audio track, filled in main()
+ENCODER = profile_for(NEED_TO_OVERLAY_VIDEO_PATH)  # ENCODER_PROFILE, or this template's TEMPLATE_ENCODER_PROFILES entry
 # Ensure necessary directories exist
 for folder in [OUTPUT_DIR, FRAMES_DIR,CONCAT_DIR]:
     folder.mkdir(parents=True, exist_ok=True)
@@ -61,14 +92,11 @@ for folder in [OUTPUT_DIR, FRAMES_DIR,CONCAT_DIR]:
 
 def get_google_sheet():
     """
-    Returns a gspread worksheet object for the specified TAB_NAME in the .env config.
+    Returns the worksheet for the specified TAB_NAME in the .env config
+    (or the local stand-in when SHEET_BACKEND=local), wrapped in the
+    rate-limited, retrying SheetsClient.
     """
-    scope = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_PATH, scope)
-    client = gspread.authorize(creds)
-    spreadsheet = client.open_by_url(SHEET_URL)
-    worksheet = spreadsheet.worksheet(TAB_NAME)
-    return worksheet
+    return open_worksheet(CREDENTIALS_PATH, SHEET_URL, TAB_NAME)
 
 def ensure_directory_exists(path):
     path.mkdir(parents=True, exist_ok=True)
@@ -88,131 +116,408 @@ async def write_frame_async(frame, output_path):
     loop = asyncio.get_event_loop()
     await loop.run_in_executor(None, lambda: cv2.imwrite(str(output_path), frame))
 
-async def write_frames_parallel(frames, output_dir, base_name):
+async def write_frames_parallel(frames, output_dir, base_name, max_pending=16):
     tasks = []
+    written = 0
     for idx, frame in enumerate(frames):
         output_path = output_dir / f"{base_name}_{idx:04d}.png"
         tasks.append(write_frame_async(frame, output_path))
+        written += 1
+        if len(tasks) >= max_pending:
+            # Keep only a few frames in flight so memory stays bounded
+            await asyncio.gather(*tasks)
+            tasks = []
     await asyncio.gather(*tasks)
+    return written
 
-async def generate_frames(image_path, output_dir, base_name):
-    logging.info(f"Generating frames for image: {image_path}")
-    img = cv2.imread(str(image_path))
-    if img is None:
-        raise FileNotFoundError(f"Image not found at {image_path}")
+def load_screenshot(image_path):
+    """
+    Returns lazy strip access to the screenshot. Decoding is capped at
+    STRIP_MEMORY_MB, so very tall pages are decoded at reduced resolution.
+    """
+    img = ScreenshotStrips(image_path)
+    img.proxy()  # Decode now so a bad file fails before ffmpeg starts
+    return img
 
+def background_offsets(img):
+    """Top row of every background frame for a screenshot (img is a ScreenshotStrips)."""
     img_height, img_width, _ = img.shape
-    frames = []
-    hold_duration_frames = FPS * 3
+    hold_duration_frames = FPS * HOLD_SECONDS
     scroll_base_speed = SCROLL_STEP
     scroll_duration_frames = FPS
     hold_after_scroll_frames = FPS
 
-    top_frame = img[:1080, :, :]
-    frames.extend([top_frame] * hold_duration_frames)
+    if SCROLL_BACKGROUND:
+        plan = plan_scroll(img_height, FPS, hold_duration_frames, scroll_base_speed, scroll_duration_frames, hold_after_scroll_frames)
+        offsets = scroll_offsets(plan)
+    else:
+        offsets = np.zeros(hold_duration_frames, dtype=np.int64)  # Top of the page only
+    return offsets
+
+def iter_frames(img):
+    """
+    Yields the background frames for a screenshot one at a time.
+    img is a ScreenshotStrips; frames are produced lazily from its row windows.
+    """
+    yield from img.iter_windows(background_offsets(img))
+
+async def generate_frames(image_path, output_dir, base_name):
+    logging.info(f"Generating frames for image: {image_path}")
+    img = load_screenshot(image_path)
 
-   
     ensure_directory_exists(output_dir)
-    await write_frames_parallel(frames, output_dir, base_name)
-    logging.info(f"Generated and wrote {len(frames)} frames for image: {image_path}")
-    return len(frames)
+    frame_count = await write_frames_parallel(iter_frames(img), output_dir, base_name)
+    logging.info(f"Generated and wrote {frame_count} frames for image: {image_path}")
+    return frame_count
 
 
-async def create_overlay_and_merge_videos(frames_dir,first_path, text_overlay_path, output_path,website_url,company_name):
-    temp_frames_path = str(frames_dir / "frame_%04d.png")
-    
+def background_source(frames_dir, still_image_path=None, frames=None, frame_count=None):
+    """
+    Returns (ffmpeg input args, filter chain, frames, duration) for the website
+    background. frames is passed back because peeking at it consumes the first
+    frame. duration is in seconds, None when the frame count isn't known.
+    """
+    duration = frame_count / FPS if frame_count is not None else None
+    if still_image_path is not None and SCROLL_BACKGROUND:
+        # Scroll rendered by ffmpeg as a crop expression over the decoded screenshot
+        plan, scale = plan_scroll_for_image(still_image_path, FPS, FPS * HOLD_SECONDS, SCROLL_STEP, FPS, FPS)
+        background_input = scroll_input(still_image_path, FPS, scale)
+        background_filter = scroll_filter(plan, FPS, scale)
+        duration = total_frames(plan) / FPS
+    elif still_image_path is not None:
+        # Static hold: the screenshot goes to ffmpeg once as a looped still, at full resolution if it fits the budget
+        scale = still_hold_scale(still_image_path)
+        background_input = still_hold_input(still_image_path, HOLD_SECONDS, FPS, scale)
+        background_filter = still_hold_filter(HOLD_SECONDS, FPS, scale)
+        duration = HOLD_SECONDS
+    elif frames is not None:
+        # Raw frames streamed over stdin, nothing touches disk
+        frame_width, frame_height, frames = peek_frame_size(frames)
+        background_input = pipe_input_args(frame_width, frame_height, FPS)
+        background_filter = "scale=1920:1080,format=yuv420p"
+    else:
+        temp_frames_path = str(frames_dir / "frame_%04d.png")
+        background_input = ["-r", "30", "-i", temp_frames_path]  # Input frames
+        background_filter = "scale=1920:1080,format=yuv420p"
+    return background_input, background_filter, frames, duration
+
+def prepared_for_drawtext(company_name):
+    # Safe text overlay string
+    safe_text = escape_drawtext(f"Prepared For: {normalize_company_text(company_name)}")
+    texts = [
+        (safe_text, "black", TEXT_START, TEXT_END, "(w-text_w)/2", "900"),
+    ]
+    return build_drawtext_filters(texts)
+
+async def speaker_segment_duration(background_duration):
+    """
+    Segment 1's real length in seconds: the background, or the whole base.mp4
+    clip when the speaker talks for longer (the last background frame is held).
+    """
+    speaker_duration = await asyncio.to_thread(video_duration, BASE_VIDEO_ENCODED_PATH)
+    return first_segment_duration(background_duration, speaker_duration)
+
+async def write_static_audio_list(output_path, segment_duration):
+    """
+    Writes the concat list for the stream-copied soundtrack of a single-pass
+    render; segment_duration is segment 1's real length (see
+    speaker_segment_duration). Returns its path, or None when the static
+    tracks or durations aren't available (the render then encodes audio itself).
+    """
+    audio_paths = (BASE_VIDEO_ENCODED_PATH, NEED_TO_OVERLAY_VIDEO_PATH, LAST_EXPLANATION_VIDEO_PATH)
+    if segment_duration is None or not all(path in static_audio for path in audio_paths):
+        return None
+    speaker_duration = await asyncio.to_thread(video_duration, BASE_VIDEO_ENCODED_PATH)
+    if speaker_duration is None or segment_duration > speaker_duration + 1 / FPS:
+        return None  # Background outlasts the speaker; a copied track can't be padded with silence
+    template_duration = await asyncio.to_thread(video_duration, NEED_TO_OVERLAY_VIDEO_PATH)
+    audio_list_path = Path(output_path).with_name(f"{Path(output_path).stem}_audio.txt")
+    write_audio_concat_list(audio_list_path, static_audio_segments(
+        static_audio[BASE_VIDEO_ENCODED_PATH],
+        static_audio[NEED_TO_OVERLAY_VIDEO_PATH],
+        static_audio[LAST_EXPLANATION_VIDEO_PATH],
+        segment_duration,
+        template_duration,
+    ))
+    return audio_list_path
+
+async def create_single_pass_video(frames_dir, output_path, company_name, still_image_path=None, frames=None, frame_count=None):
+    """
+    Renders background + speaker, the text segment and the tail in one ffmpeg
+    invocation with a single encode and no intermediate files. When the static
+    audio tracks are ready the soundtrack is stream-copied from them.
+    """
+    background_input, background_filter, frames, duration = background_source(frames_dir, still_image_path, frames, frame_count)
+    segment_duration = await speaker_segment_duration(duration)
+    audio_list_path = await write_static_audio_list(output_path, segment_duration)
+    command = build_single_pass_command(
+        background_input,
+        background_filter,
+        BASE_VIDEO_ENCODED_PATH,
+        MASK_IMAGE_ENCODED_PATH,
+        mask_width,
+        mask_height,
+        mask_left,
+        mask_bottom,
+        NEED_TO_OVERLAY_VIDEO_PATH,
+        prepared_for_drawtext(company_name),
+        LAST_EXPLANATION_VIDEO_PATH,
+        output_path,
+        speaker_asset,
+        audio_list_path,
+        profile=ENCODER,
+        segment_duration=segment_duration,
+    )
+    started = time.perf_counter()
+    try:
+        if frames is not None:
+            await stream_frames_to_ffmpeg(command, frames, stage="single_pass")
+        else:
+            await run_ffmpeg(command, stage="single_pass")
+    except subprocess.CalledProcessError as e:
+        logging.error(f"FFmpeg single-pass render failed: {e}")
+        raise
+    finally:
+        if audio_list_path is not None and audio_list_path.exists():
+            audio_list_path.unlink()
+    logging.info(f"Single-pass video created: {output_path} in {time.perf_counter() - started:.1f}s")
+
+async def create_chunked_video(frames_dir, output_path, company_name, still_image_path=None, frames=None, frame_count=None):
+    """
+    Single-pass render split into GOP-aligned chunks that are encoded in
+    parallel on the free scheduler slots and stitched with copy-concat.
+    Falls back to create_single_pass_video when splitting can't help: only one
+    slot free (deep queue), piped frames (stdin can't be shared between
+    chunk processes), or no pre-encoded soundtrack to mux at the end.
+    """
+    chunks = 1
+    audio_list_path = None
+    if frames is None:
+        background_input, background_filter, _, duration = background_source(frames_dir, still_image_path, None, frame_count)
+        segment_duration = await speaker_segment_duration(duration)
+        audio_list_path = await write_static_audio_list(output_path, segment_duration)
+    if audio_list_path is not None:
+        template_duration = await asyncio.to_thread(video_duration, NEED_TO_OVERLAY_VIDEO_PATH)
+        tail_duration = await asyncio.to_thread(video_duration, LAST_EXPLANATION_VIDEO_PATH)
+        if template_duration is not None and tail_duration is not None:
+            total = output_frame_count([segment_duration, template_duration, tail_duration], FPS)
+            chunks = plan_chunk_count(total, FPS, default_scheduler.free_slots())
+    if chunks < 2:
+        if audio_list_path is not None:
+            audio_list_path.unlink()
+        await create_single_pass_video(frames_dir, output_path, company_name, still_image_path, frames, frame_count)
+        return
+
+    drawtext = prepared_for_drawtext(company_name)
+    def build_chunk_command(frame_range, chunk_path):
+        return build_single_pass_command(
+            background_input,
+            background_filter,
+            BASE_VIDEO_ENCODED_PATH,
+            MASK_IMAGE_ENCODED_PATH,
+            mask_width,
+            mask_height,
+            mask_left,
+            mask_bottom,
+            NEED_TO_OVERLAY_VIDEO_PATH,
+            drawtext,
+            LAST_EXPLANATION_VIDEO_PATH,
+            chunk_path,
+            speaker_asset,
+            frame_range=frame_range,
+            gop_frames=CHUNK_GOP_FRAMES,
+            profile=ENCODER,
+        )
+
+    started = time.perf_counter()
+    try:
+        await render_chunked(build_chunk_command, chunk_ranges(total, chunks), audio_list_path, output_path)
+    except subprocess.CalledProcessError as e:
+        logging.error(f"FFmpeg chunked render failed: {e}")
+        raise
+    finally:
+        if audio_list_path.exists():
+            audio_list_path.unlink()
+    logging.info(f"Chunked video created: {output_path} ({chunks} chunks) in {time.perf_counter() - started:.1f}s")
+
+async def create_pyav_video(output_path, company_name, frames):
+    """
+    Renders the same video as create_single_pass_video with the in-process
+    PyAV backend; runs in a worker thread with the scheduler's thread budget.
+    """
+    started = time.perf_counter()
+    async with default_scheduler.slot() as slot:
+        frame_count = await asyncio.to_thread(
+            pyav_renderer.render, frames, f"Prepared For: {normalize_company_text(company_name)}", output_path, slot.threads
+        )
+    logging.info(f"PyAV video created: {output_path} ({frame_count} frames) in {time.perf_counter() - started:.1f}s")
+
+def text_pass_settings(company_name):
+    """
+    Returns (drawtext, codec_args, audio_inputs, encode_args) of the per-row
+    text pass; encode_args is everything after the inputs of the full-template
+    command and also keys the text segment cache.
+    """
+    # Combine all filters into a single filter_complex
+    drawtext = prepared_for_drawtext(company_name)
+    filter_complex = f"[0:v]scale=1920:1080,format=yuv420p," + drawtext + " [vtext]"
+
+    text_codec_args = list(ENCODER.video_args)  # Codec, speed and quality of the selected profile
+    template_audio = static_audio.get(NEED_TO_OVERLAY_VIDEO_PATH)
+    if template_audio is not None:
+        text_audio_inputs = ["-i", str(template_audio)]  # Template audio, encoded once in main()
+        text_audio_args = ["-map", "1:a", "-c:a", "copy"]
+    else:
+        text_audio_inputs = []
+        text_audio_args = ["-map", "0:a"]
+        text_codec_args += audio_encode_args(ENCODER)
+    text_encode_args = [
+        "-filter_complex", filter_complex,  # Apply scaling, formatting, and text overlay
+        "-map", "[vtext]",
+        *text_audio_args,
+        *text_codec_args,
+        "-shortest",  # Stop when the shortest stream ends
+        "-r", "30",  # Set frame rate to 30 FPS
+        "-threads", "0",  # Use all available CPU threads
+    ]
+    return drawtext, text_codec_args, text_audio_inputs, text_encode_args
+
+def text_segment_key(company_name, text_encode_args):
+    segment_settings = [*text_encode_args, f"smart_cut={SMART_CUT_TEXT}"]
+    return text_segment_cache.key_for(company_name, FONT_PATH, NEED_TO_OVERLAY_VIDEO_PATH, segment_settings)
+
+async def prefetch_text_segments(company_names):
+    """
+    Renders the text segments of a batch's uncached company names in one
+    fan-out (one template decode for all of them) and puts them in the text
+    segment cache, so each row's text pass is a cache hit.
+    """
+    pending = {}
+    for company_name in company_names:
+        drawtext, text_codec_args, _, text_encode_args = text_pass_settings(company_name)
+        segment_key = text_segment_key(company_name, text_encode_args)
+        if segment_key not in pending and not text_segment_cache.contains(segment_key):
+            pending[segment_key] = drawtext
+    if len(pending) < 2:
+        return  # Nothing to share; the row renders it as usual
+
+    jobs = [(drawtext, CONCAT_DIR / f"fanout_{segment_key}.mp4") for segment_key, drawtext in pending.items()]
+    try:
+        rendered = await render_text_batch(
+            NEED_TO_OVERLAY_VIDEO_PATH, jobs, text_codec_args, TEXT_END, static_audio.get(NEED_TO_OVERLAY_VIDEO_PATH), SMART_CUT_TEXT
+        )
+        for segment_key, (_, output_path) in zip(pending, jobs):
+            if output_path in rendered:
+                text_segment_cache.insert(segment_key, output_path)
+    finally:
+        for _, output_path in jobs:
+            if output_path.exists():
+                output_path.unlink()
+
+async def create_overlay_and_merge_videos(frames_dir,first_path, text_overlay_path, output_path,website_url,company_name,still_image_path=None,frames=None):
+    background_input, background_filter, frames, duration = background_source(frames_dir, still_image_path, frames)
+    segment_duration = await speaker_segment_duration(duration)
+    concat_list = f"{sanitize_filename(website_url)}.txt"
+    started = time.perf_counter()
+
+    if speaker_asset is not None:
+        # Speaker is already scaled and masked, audio already AAC
+        speaker_inputs = ["-i", str(speaker_asset)]
+        speaker_filter = "[1:v] null [circle];"
+        audio_args = ["-map", "1:a", "-c:a", "copy"]
+    else:
+        speaker_inputs = [
+            "-i", BASE_VIDEO_ENCODED_PATH,  # Base video
+            "-i", str(MASK_IMAGE_ENCODED_PATH),  # Mask image
+        ]
+        speaker_filter = (
+            f"[1:v] scale={str(mask_width)}:{str(mask_height)},format=rgba [scaled];"  # Scale cropped video to square
+            f"[2:v] scale={str(mask_width)}:{str(mask_height)},format=gray [scaled_mask];"  # Scale mask to square
+            f"[scaled][scaled_mask] alphamerge [circle];"
+        )
+        if BASE_VIDEO_ENCODED_PATH in static_audio:
+            # Base audio was encoded once in main(); copy it
+            speaker_inputs += ["-i", str(static_audio[BASE_VIDEO_ENCODED_PATH])]
+            audio_args = ["-map", "3:a", "-c:a", "copy"]
+        else:
+            audio_args = [
+                "-map", "1:a",  # Map the audio from the base video
+                *audio_encode_args(ENCODER),
+            ]
 
     # Step 1: Command to create overlay video
     overlay_command = [
     "ffmpeg",
     "-y",  # Overwrite output files without asking
-    "-r", "30",  # Input frame rate
-    "-i", temp_frames_path,  # Input frames
-    "-i", BASE_VIDEO_ENCODED_PATH,  # Base video
-    "-i", str(MASK_IMAGE_ENCODED_PATH),  # Mask image
+    *background_input,  # Website background (looped still or frame sequence)
+    *speaker_inputs,  # Cached speaker asset, or base video + mask
     "-filter_complex",
     (
-        f"[0:v] scale=1920:1080,format=yuv420p [bg];"
-        f"[1:v] scale={str(mask_width)}:{str(mask_height)},format=rgba [scaled];"  # Scale cropped video to square
-        f"[2:v] scale={str(mask_width)}:{str(mask_height)},format=gray [scaled_mask];"  # Scale mask to square
-        f"[scaled][scaled_mask] alphamerge [circle];"
+        f"[0:v] {background_filter} [bg];"
+        f"{speaker_filter}"
         f"[bg][circle] overlay={str(mask_left)}:main_h-overlay_h{str(mask_bottom)} [out]"
     ),
     "-map", "[out]",  # Map the output video
-    "-map", "1:a",  # Map the audio from the base video
-    "-c:v", "libx264",  # Use the H.264 codec for video encoding
-    "-preset", "slow",  # High-quality compression preset
-    "-crf", "16",  # High video quality (lower CRF = better quality)
-    "-c:a", "aac",  # Use AAC codec for audio
-    "-b:a", "320k",  # High-quality audio bitrate
-    "-ar", "48000",  # Audio sample rate
+    *audio_args,  # Base audio, stream-copied when pre-encoded
+    *ENCODER.video_args,  # Codec, speed and quality of the selected profile
     "-threads", "0",  # Use all available CPU threads
-    "-shortest",  # Stop when the shortest input stream ends
+    # Same length as segment 1 of the single-pass graph; without it, stop when the shortest stream ends
+    *(["-t", f"{segment_duration:.6f}"] if segment_duration is not None else ["-shortest"]),
     str(first_path),  # Output file path
 ]
 
     # Step 2: Run overlay creation
     try:
-        await asyncio.to_thread(subprocess.run, overlay_command, check=True)
-        logging.info(f"Overlay video created: {first_path}")
+        if frames is not None:
+            await stream_frames_to_ffmpeg(overlay_command, frames, stage="overlay")
+        else:
+            await run_ffmpeg(overlay_command, stage="overlay")
+        overlay_done = time.perf_counter()
+        logging.info(f"Overlay video created: {first_path} in {overlay_done - started:.1f}s")
         # Step 3: Command to create text overlay video
-        # Absolute font file path (escaped backslashes)
-        font_path = r"Roboto-Regular.ttf"
-
-        # Define dynamic text overlays
-        # texts = [
-        #     (company_name, "black", 0, 40, "740", "842"),  # Example text
-        # ]
-        def escape_drawtext(text):
-            return text.replace('\\', '\\\\\\\\').replace(':', r'\:').replace("'", r"\'")
-
-        # Safe text overlay string
-        safe_text = escape_drawtext(f"Prepared For: {company_name}")
-
-        texts = [
-            (safe_text, "black", 0, 40, "(w-text_w)/2", "900"),
-        ]
-
-
-        # Build the drawtext filter
-        drawtext_filters = []
-        for text, color, start, end, x, y in texts:
-            drawtext_filters.append(
-                f"drawtext=text='{text}':fontsize=48:fontcolor={color}:fontfile={font_path}:x={x}:y={y}:enable='between(t,{start},{end})'"
-            )
-
-        # Combine all filters into a single filter_complex
-        filter_complex = f"[0:v]scale=1920:1080,format=yuv420p," + ",".join(drawtext_filters)
+        drawtext, text_codec_args, text_audio_inputs, text_encode_args = text_pass_settings(company_name)
+        template_audio = static_audio.get(NEED_TO_OVERLAY_VIDEO_PATH)
 
         # FFmpeg command
         textoverlay_command = [
             "ffmpeg",
             "-y",  # Overwrite output without prompting
             "-i",NEED_TO_OVERLAY_VIDEO_PATH,  # Input video file
-            "-filter_complex", filter_complex,  # Apply scaling, formatting, and text overlay
-            "-c:v", "libx264",  # Use H.264 codec for video encoding
-            "-preset", "slow",  # High-quality compression preset
-            "-crf", "16",  # High video quality (lower CRF = better quality)
-            "-c:a", "aac",  # Audio codec
-            "-b:a", "320k",  # High-quality audio bitrate
-            "-ar", "48000",  # Audio sample rate
-            "-shortest",  # Stop when the shortest stream ends
-            "-r", "30",  # Set frame rate to 30 FPS
-            "-threads", "0",  # Use all available CPU threads
+            *text_audio_inputs,
+            *text_encode_args,
             str(text_overlay_path),  # Output file
         ]
 
         # Run FFmpeg command
         try:
-            print("Processing video with text overlays...")
-            print("FFmpeg Command:", " ".join( textoverlay_command))  # Debugging
-            subprocess.run( textoverlay_command, check=True)
-            print(f"Processed video saved at: {text_overlay_path}")
-            concat_list = f"{sanitize_filename(website_url)}.txt"
+            segment_key = None
+            cached = False
+            if TEXT_SEGMENT_CACHE:
+                segment_key = text_segment_key(company_name, text_encode_args)
+                cached = text_segment_cache.fetch(segment_key, text_overlay_path)
+            if not cached:
+                smart_cut_done = False
+                if SMART_CUT_TEXT:
+                    smart_cut_done = await render_smart_cut_text(
+                        NEED_TO_OVERLAY_VIDEO_PATH, drawtext, text_codec_args, TEXT_END, text_overlay_path, template_audio
+                    )
+                if not smart_cut_done:
+                    logging.info("Processing video with text overlays...")
+                    logging.debug(f"FFmpeg command: {' '.join(textoverlay_command)}")
+                    await run_ffmpeg(textoverlay_command, stage="text")
+                if segment_key is not None:
+                    text_segment_cache.insert(segment_key, text_overlay_path)
+            text_done = time.perf_counter()
+            logging.info(f"Processed video saved at: {text_overlay_path}")
+            logging.info(f"Text overlay pass took {text_done - overlay_done:.1f}s")
+            # Refuse mismatched copy-concats up front; static tail is normalized once if needed
+            concat_inputs = await prepare_concat_inputs(
+                [(first_path, False), (text_overlay_path, False), (LAST_EXPLANATION_VIDEO_PATH, True)],
+                ENCODER,
+            )
             with open(concat_list, "w") as file:
-                file.write(f"file '{first_path}'\n")
-                file.write(f"file '{text_overlay_path}'\n")
-                file.write(f"file '{LAST_EXPLANATION_VIDEO_PATH}'\n")
+                for concat_input in concat_inputs:
+                    file.write(f"file '{concat_input}'\n")
             
             # Step 4: Command to concatenate videos
             merge_command = [
@@ -227,8 +532,13 @@ async def create_overlay_and_merge_videos(frames_dir,first_path, text_overlay_pa
 
             # Step 5: Run video merging
             try:
-                await asyncio.to_thread(subprocess.run, merge_command, check=True)
+                await run_ffmpeg(merge_command, stage="concat")
+                merge_done = time.perf_counter()
                 logging.info(f"Merged video created: {output_path}")
+                logging.info(
+                    f"Three-step render took {merge_done - started:.1f}s "
+                    f"(overlay {overlay_done - started:.1f}s, text {text_done - overlay_done:.1f}s, concat {merge_done - text_done:.1f}s)"
+                )
 
             except subprocess.CalledProcessError as e:
                 logging.error(f"FFmpeg concating failed: {e}")
@@ -255,21 +565,15 @@ async def create_overlay_and_merge_videos(frames_dir,first_path, text_overlay_pa
             
 async def update_google_sheet_cell(worksheet, cell, value):
     """
-    Updates a single cell in the sheet with retries on network errors.
+    Updates a single cell in the sheet. Rate limiting and retries on quota
+    and network errors happen in SheetsClient.
     """
-    for attempt in range(maxretries):
-        try:
-            worksheet.update_acell(cell, value)
-            logging.info(f"Updated {cell} with value: {value}")
-            return
-        except Exception as e:
-            if attempt < maxretries-1:
-                wait_time = 30
-                logging.warning(f"Failed to update {cell}: {e}. Retrying in {wait_time} seconds... (Attempt {attempt + 1})")
-                await asyncio.sleep(wait_time)
-            else:
-                logging.error(f"Max retries reached. Unable to update {cell}. Error: {e}")
-                raise
+    try:
+        await asyncio.to_thread(worksheet.update_acell, cell, value)
+        logging.info(f"Updated {cell} with value: {value}")
+    except Exception as e:
+        logging.error(f"Unable to update {cell}. Error: {e}")
+        raise
        
 
 
@@ -302,23 +606,15 @@ async def process_row(global_row_idx, row_data, headers, worksheet):
             company_name = row_data[companyname_index].strip() if companyname_index < len(row_data) else ""
 
             row_number_in_sheet = global_row_idx + 2  # +2 because data starts at row 2 in the sheet
-
-            # --- Polling logic: wait until 'Screenshot' cell is non-empty ---
-            poll_retries = 0
-            while not screenshot_path:
-                if poll_retries >= MAX_POLL_RETRIES:
-                    logging.error(f"Row {row_number_in_sheet}: 'Screenshot' remains empty after {MAX_POLL_RETRIES} retries.")
+            metrics_row.set(row_number_in_sheet)  # Tags this row's ffmpeg metrics
+
+            # --- Wait until 'Screenshot' cell is non-empty (one shared poller for all waiting rows) ---
+            if not screenshot_path:
+                logging.info(f"Row {row_number_in_sheet}: 'Screenshot' is empty. Waiting up to {SCREENSHOT_WAIT_SECONDS}s for it to be populated...")
+                screenshot_path = await screenshot_watcher.wait_for(row_number_in_sheet, SCREENSHOT_WAIT_SECONDS)
+                if not screenshot_path:
+                    logging.error(f"Row {row_number_in_sheet}: 'Screenshot' remains empty after {SCREENSHOT_WAIT_SECONDS}s.")
                     return (row_number_in_sheet, "Error")
-                logging.info(f"Row {row_number_in_sheet}: 'Screenshot' is empty. Waiting {POLL_INTERVAL}s for it to be populated... (Attempt {poll_retries + 1}/{MAX_POLL_RETRIES})")
-                await asyncio.sleep(POLL_INTERVAL)  # Wait before retrying
-                # Re-read the row from Google Sheets
-                new_row_data = worksheet.row_values(row_number_in_sheet)
-                if len(new_row_data) > screenshot_index:
-                    screenshot_path = new_row_data[screenshot_index].strip()
-                else:
-                    screenshot_path = ""
-
-                poll_retries += 1
 
             # Now screenshot_path should be populated
             first_path = OUTPUT_DIR / f"{sanitize_filename(website_url)}_first.mp4"
@@ -332,16 +628,39 @@ async def process_row(global_row_idx, row_data, headers, worksheet):
                 return (row_number_in_sheet, "Error")
 
             try:
-                ensure_directory_exists(frames_subdir)
+                still_image_path = None
+                frames = None
+                frame_count = None
+                if pyav_renderer is not None:
+                    # In-process backend always takes NumPy frames
+                    img = await asyncio.to_thread(load_screenshot, screenshot_path)
+                    frames = iter_frames(img)
+                elif BACKGROUND_MODE == "still":
+                    # No frames to write, ffmpeg reads the screenshot directly
+                    still_image_path = screenshot_path
+                elif BACKGROUND_MODE == "pipe":
+                    # Frames go from memory straight to ffmpeg's stdin
+                    img = await asyncio.to_thread(load_screenshot, screenshot_path)
+                    frames = iter_frames(img)
+                    frame_count = len(background_offsets(img))
+                else:
+                    ensure_directory_exists(frames_subdir)
 
-                # Generate frames
-                logging.info(f"Row {row_number_in_sheet}: Generating frames for {website_url}")
-                await generate_frames(screenshot_path, frames_subdir, "frame")
+                    # Generate frames
+                    logging.info(f"Row {row_number_in_sheet}: Generating frames for {website_url}")
+                    frame_count = await generate_frames(screenshot_path, frames_subdir, "frame")
 
                 # Create the overlay video
                 logging.info(f"Row {row_number_in_sheet}: Creating video for {website_url}")
                 # await create_and_overlay_video(frames_subdir, video_path)
-                await create_overlay_and_merge_videos(frames_subdir,first_path, text_overlay_path,video_path,website_url,company_name)
+                if pyav_renderer is not None:
+                    await create_pyav_video(video_path, company_name, frames)
+                elif RENDER_PIPELINE == "chunked":
+                    await create_chunked_video(frames_subdir, video_path, company_name, still_image_path, frames, frame_count)
+                elif RENDER_PIPELINE == "single":
+                    await create_single_pass_video(frames_subdir, video_path, company_name, still_image_path, frames, frame_count)
+                else:
+                    await create_overlay_and_merge_videos(frames_subdir,first_path, text_overlay_path,video_path,website_url,company_name,still_image_path,frames)
                 
                 logging.info(f"SUCCCCCCCCCCCCCCCCRow {row_number_in_sheet}: Video created successfully for {website_url}")
                 # Delete the screenshot file
@@ -369,9 +688,9 @@ async def process_row(global_row_idx, row_data, headers, worksheet):
                     
         except Exception as e:
             if attempt < maxretries-1:
-                wait_time = 30
-                logging.warning(f"Failed to connect to Google Sheets. Retrying in {wait_time} seconds... (Attempt {attempt + 1})")
-                asyncio.sleep(wait_time)
+                wait_time = backoff_delay(attempt)  # Jittered, so rows that failed together do not retry together
+                logging.warning(f"Row attempt failed: {e}. Retrying in {wait_time:.1f} seconds... (Attempt {attempt + 1})")
+                await asyncio.sleep(wait_time)
             else:
                 logging.error("Max retries reached. Unable to connect to Google Sheets.")
                 raise           
@@ -492,18 +811,69 @@ def binary_search_first_empty(all_values, start, end, col_index):
 
 
 async def main():
+    global speaker_asset, pyav_renderer
+    logging.info(f"Render scheduler: {default_scheduler.describe()}")
+    logging.info(f"Encoder profile: {ENCODER.name} ({ENCODER.description})")
+    if TEXT_FANOUT and RENDER_PIPELINE != "three_step":
+        logging.info(f"TEXT_FANOUT has no effect with RENDER_PIPELINE={RENDER_PIPELINE}: the text is drawn inside each row's single pass")
+    if SPEAKER_ASSET_CACHE:
+        try:
+            speaker_asset = await ensure_speaker_asset(
+                BASE_VIDEO_ENCODED_PATH, MASK_IMAGE_ENCODED_PATH, mask_width, mask_height, ENCODER
+            )
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+            logging.error(f"Could not build speaker asset, masking per row instead: {e}")
+    if STATIC_AUDIO_CACHE:
+        for static_path in (BASE_VIDEO_ENCODED_PATH, NEED_TO_OVERLAY_VIDEO_PATH, LAST_EXPLANATION_VIDEO_PATH):
+            try:
+                static_audio[static_path] = await ensure_audio_track(static_path, audio_encode_args(ENCODER))
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+                logging.error(f"Could not pre-encode audio of {static_path}, encoding it per row instead: {e}")
+    if RENDER_BACKEND == "pyav":
+        try:
+            pyav_renderer = await asyncio.to_thread(
+                PyAvRenderer,
+                BASE_VIDEO_ENCODED_PATH,
+                MASK_IMAGE_ENCODED_PATH,
+                mask_width,
+                mask_height,
+                mask_left,
+                mask_bottom,
+                NEED_TO_OVERLAY_VIDEO_PATH,
+                LAST_EXPLANATION_VIDEO_PATH,
+                (TEXT_START, TEXT_END),
+                speaker_asset_path=speaker_asset,
+                **x264_options(ENCODER),
+            )
+            logging.info("Rendering in-process with PyAV")
+        except Exception as e:
+            logging.error(f"Could not start the PyAV backend, using ffmpeg subprocesses: {e}")
+
     worksheet = get_google_sheet()
     # Ensure 'Personal Video' column exists
     headers, personal_video_index = ensure_personal_video_column(worksheet)
+    global screenshot_watcher
+    screenshot_watcher = ScreenshotWatcher(worksheet, column_index_to_letter(headers.index("Screenshot")))
 
-    # Determine total number of data rows (excluding header)
-    all_values = worksheet.get_all_values()
-    total_rows = len(all_values) - 1  # excluding header row
-    logging.info(f"Total data rows found: {total_rows}")
-    
-     # Update START_DATA_ROW to the first row with an empty 'Personal Video' column
     global START_DATA_ROW
-    START_DATA_ROW = binary_search_first_empty(all_values, START_DATA_ROW, total_rows, personal_video_index)
+    mirror = None
+    if SHEET_MIRROR:
+        # Local copy of the sheet: one read for every row, only changed rows are written
+        mirror = SheetMirror(worksheet, "Personal Video")
+        mirror.sync(headers)
+        total_rows = mirror.last_row() - 1  # excluding header row
+        logging.info(f"Total data rows found: {total_rows}")
+        first_pending = mirror.first_pending_row()
+        # Same 0-based index into all rows (header included) that the binary search returns
+        START_DATA_ROW = None if first_pending is None else first_pending - 1
+    else:
+        # Determine total number of data rows (excluding header)
+        all_values = worksheet.get_all_values()
+        total_rows = len(all_values) - 1  # excluding header row
+        logging.info(f"Total data rows found: {total_rows}")
+
+        # Update START_DATA_ROW to the first row with an empty 'Personal Video' column
+        START_DATA_ROW = binary_search_first_empty(all_values, START_DATA_ROW, total_rows, personal_video_index)
 
     if START_DATA_ROW is None:
         logging.info("No unprocessed rows found. All rows are already processed.")
@@ -511,77 +881,95 @@ async def main():
         logging.info(f"Updated START_DATA_ROW to: {START_DATA_ROW + 1}")  # Adjust for 1-based indexing
 
     start_row = START_DATA_ROW  # e.g., row 2
-    while True:
-        end_row = start_row + BATCH_SIZE - 1
-        range_str = f"A{start_row}:Z{end_row}"  # Adjust columns to match your sheet
-        logging.info(f"Reading batch rows {start_row} to {end_row}")
-        batch_data = worksheet.get_values(range_str)
-        if not batch_data:
-            logging.info("No more data to process. Exiting.")
-            break
-
-        tasks = []
-        row_number_mapping = []  # To keep track of row numbers for tasks
-        for row_idx_in_batch, row_data in enumerate(batch_data):
-            global_row_idx = (start_row - 2) + row_idx_in_batch  # 0-based index for entire data
-            row_number_in_sheet = global_row_idx + 2  # +2 because data starts at row 2
-
-            if not any(cell.strip() for cell in row_data):
-                logging.info(f"Skipping empty row at {row_number_in_sheet}")
-                continue
-
-            # Check if 'Personal Video' is already set
-            personal_video_value = ""
-            if personal_video_index < len(row_data):
-                personal_video_value = row_data[personal_video_index].strip()
-
-            if personal_video_value:
-                #logging.info(f"Skipping row {row_number_in_sheet}, 'Personal Video' already set.")
-                continue
-
-            # Append the task to process this row
-            tasks.append(process_row(global_row_idx, row_data, headers, worksheet))
-
-        if tasks:
-            # Execute tasks concurrently
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            # Update the sheet with personal video link or 'Error'
-            for result in results:
-                if isinstance(result, tuple) and len(result) == 2:
-                    row_number_in_sheet, value = result
-                    personal_video_letter = column_index_to_letter(personal_video_index)
-                    personal_video_cell = f"{personal_video_letter}{row_number_in_sheet}"
-
-                    if value == "Error":
-                        # Update the cell with 'Error'
-                        await update_google_sheet_cell(worksheet, personal_video_cell, "Error")
-                        logging.info(f"Row {row_number_in_sheet}: Set 'Personal Video' to 'Error'")
+    # Results are written in batches; the buffer flushes on size, on time and on the way out
+    async with SheetWriteBuffer(worksheet) as writeback:
+        while True:
+            end_row = start_row + BATCH_SIZE - 1
+            range_str = f"A{start_row}:Z{end_row}"  # Adjust columns to match your sheet
+            logging.info(f"Reading batch rows {start_row} to {end_row}")
+            if mirror:
+                # Re-sync once the mirror is older than SHEET_MIRROR_MAX_AGE; otherwise no request
+                mirror.refresh()
+                batch_data = mirror.rows(start_row, end_row)
+            else:
+                batch_data = worksheet.get_values(range_str)
+            if not batch_data:
+                logging.info("No more data to process. Exiting.")
+                break
+
+            tasks = []
+            row_number_mapping = []  # To keep track of row numbers for tasks
+            fanout_names = []  # Company names of this batch, for the shared text pass
+            for row_idx_in_batch, row_data in enumerate(batch_data):
+                global_row_idx = (start_row - 2) + row_idx_in_batch  # 0-based index for entire data
+                row_number_in_sheet = global_row_idx + 2  # +2 because data starts at row 2
+
+                if not any(cell.strip() for cell in row_data):
+                    logging.info(f"Skipping empty row at {row_number_in_sheet}")
+                    continue
+
+                # Check if 'Personal Video' is already set
+                personal_video_value = ""
+                if personal_video_index < len(row_data):
+                    personal_video_value = row_data[personal_video_index].strip()
+
+                if personal_video_value:
+                    #logging.info(f"Skipping row {row_number_in_sheet}, 'Personal Video' already set.")
+                    continue
+
+                if "Company Name" in headers and headers.index("Company Name") < len(row_data):
+                    fanout_names.append(row_data[headers.index("Company Name")].strip())
+                # Append the task to process this row
+                tasks.append(process_row(global_row_idx, row_data, headers, worksheet))
+
+            if tasks:
+                if TEXT_FANOUT and TEXT_SEGMENT_CACHE and RENDER_PIPELINE == "three_step" and pyav_renderer is None:
+                    await prefetch_text_segments(fanout_names)
+                # Execute tasks concurrently
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+
+                text_segment_cache.log_stats(f"batch rows {start_row}-{end_row}")
+
+                # Update the sheet with personal video link or 'Error'
+                for result in results:
+                    if isinstance(result, tuple) and len(result) == 2:
+                        row_number_in_sheet, value = result
+                        personal_video_letter = column_index_to_letter(personal_video_index)
+                        personal_video_cell = f"{personal_video_letter}{row_number_in_sheet}"
+                        if mirror:
+                            mirror.set_status(row_number_in_sheet, value)
+
+                        if value == "Error":
+                            # Update the cell with 'Error'
+                            await writeback.add(personal_video_cell, "Error")
+                            logging.info(f"Row {row_number_in_sheet}: Set 'Personal Video' to 'Error'")
+                        else:
+                            # Update the cell with the video path
+                            await writeback.add(personal_video_cell, value)
+                            logging.info(f"Row {row_number_in_sheet}: Set 'Personal Video' to video path")
+                    elif isinstance(result, Exception):
+                        # If the coroutine raised an exception, mark as 'Error'
+                        # Note: In this implementation, exceptions should be handled within process_row,
+                        # so this block might not be reached. Included for completeness.
+                        logging.error(f"Unexpected exception: {result}")
+                        # Optionally, you can attempt to determine the row number here if needed
                     else:
-                        # Update the cell with the video path
-                        await update_google_sheet_cell(worksheet, personal_video_cell, value)
-                        logging.info(f"Row {row_number_in_sheet}: Set 'Personal Video' to video path")
-                elif isinstance(result, Exception):
-                    # If the coroutine raised an exception, mark as 'Error'
-                    # Note: In this implementation, exceptions should be handled within process_row,
-                    # so this block might not be reached. Included for completeness.
-                    logging.error(f"Unexpected exception: {result}")
-                    # Optionally, you can attempt to determine the row number here if needed
-                else:
-                    # For any unexpected result types, mark as 'Error'
-                    logging.error(f"Unexpected result type: {result}")
-        else:
-            logging.info(f"No tasks to process in batch rows {start_row} to {end_row}")
+                        # For any unexpected result types, mark as 'Error'
+                        logging.error(f"Unexpected result type: {result}")
+            else:
+                logging.info(f"No tasks to process in batch rows {start_row} to {end_row}")
             
-        # Rest for 2 seconds before moving to the next batch
-        logging.info(f"Completed batch rows {start_row} to {end_row}. Resting for 2 seconds...")
-        await asyncio.sleep(1)
-
-        # Move to the next batch
-        start_row = end_row + 1
-        if (start_row - 1) > (total_rows + 1):
-            logging.info("We've processed up to or beyond the last row.")
-            break
+            # Rest for 2 seconds before moving to the next batch
+            logging.info(f"Completed batch rows {start_row} to {end_row}. Resting for 2 seconds...")
+            await asyncio.sleep(1)
+
+            # Move to the next batch
+            start_row = end_row + 1
+            if (start_row - 1) > (total_rows + 1):
+                logging.info("We've processed up to or beyond the last row.")
+                break
+
+    worksheet.log_stats()
 
 if __name__ == "__main__":
     asyncio.run(main())
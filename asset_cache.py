@@ -0,0 +1,182 @@
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from encoder_profiles import profile_for
+from render_graph import AUDIO_ENCODE_ARGS, audio_encode_args
+
+ASSET_CACHE_DIR = Path(os.getenv("ASSET_CACHE_DIR", "asset_cache"))
+DIGEST_INDEX_PATH = ASSET_CACHE_DIR / "digests.json"
+
+_digest_index = None
+_digest_index_lock = threading.Lock()  # file_digest runs in to_thread workers; one read-modify-write at a time
+_build_locks = collections.defaultdict(asyncio.Lock)  # Asset path -> lock, one build per asset
+
+
+def _load_digest_index():
+    # Caller holds _digest_index_lock
+    global _digest_index
+    if _digest_index is None:
+        try:
+            with open(DIGEST_INDEX_PATH, "r") as f:
+                _digest_index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            _digest_index = {}
+    return _digest_index
+
+
+def file_digest(path):
+    """
+    Returns the sha256 of a file's contents. Digests are remembered by path,
+    size and mtime, so large static inputs are only read again after they change.
+    """
+    path = Path(path)
+    stat = path.stat()
+    entry_key = str(path.resolve())
+    with _digest_index_lock:
+        entry = _load_digest_index().get(entry_key)
+    if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry["sha256"]
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+
+    with _digest_index_lock:
+        index = _load_digest_index()
+        index[entry_key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+        ASSET_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with atomic_output(DIGEST_INDEX_PATH) as tmp_path:
+            with open(tmp_path, "w") as f:
+                json.dump(index, f, indent=2)
+    return digest
+
+
+def cache_key(*parts):
+    """Short stable key from any mix of digests and settings."""
+    return hashlib.sha256("\n".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:20]
+
+
+@contextmanager
+def atomic_output(final_path):
+    """
+    Yields a temporary path next to final_path and renames it into place only
+    if the block succeeds, so readers never see a half-written asset. The
+    temporary name is unique per call, so concurrent writers in one process
+    never share it (the last rename wins).
+    """
+    final_path = Path(final_path)
+    tmp_path = final_path.with_name(f".{final_path.stem}.{os.getpid()}.{uuid.uuid4().hex}.tmp{final_path.suffix}")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, final_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+async def ensure_audio_track(source_path, audio_args=AUDIO_ENCODE_ARGS):
+    """
+    Returns the audio of a static video encoded once to the canonical AAC
+    format (audio_args), cached by the source's content hash. Per-row
+    renders mux it with '-c:a copy', so the track is never re-encoded.
+    """
+    from ffmpeg_runner import run_ffmpeg  # Imported here: ffmpeg_runner -> render_scheduler imports this module
+
+    digest = await asyncio.to_thread(file_digest, source_path)
+    key = cache_key("audio-track-v1", digest, " ".join(audio_args))
+    track_path = ASSET_CACHE_DIR / f"audio_{Path(source_path).stem}_{key}.m4a"
+    async with _build_locks[track_path]:
+        if track_path.exists():
+            return track_path
+
+        ASSET_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        logging.info(f"Encoding audio track of {source_path}: {track_path}")
+        with atomic_output(track_path) as tmp_path:
+            command = [
+                "ffmpeg",
+                "-y",
+                "-i", str(source_path),
+                "-map", "0:a:0",  # First audio stream only
+                "-vn",
+                *audio_args,
+                str(tmp_path),
+            ]
+            await run_ffmpeg(command, stage="audio_track")
+
+    # Drop tracks built from older versions of the same source
+    for old_track in ASSET_CACHE_DIR.glob(f"audio_{Path(source_path).stem}_*.m4a"):
+        if old_track != track_path:
+            old_track.unlink(missing_ok=True)
+    return track_path
+
+
+def speaker_asset_path(base_video_path, mask_path, mask_width, mask_height, profile):
+    key = cache_key(
+        "speaker-v1",
+        file_digest(base_video_path),
+        file_digest(mask_path),
+        mask_width,
+        mask_height,  # Position (MASK_LEFT/MASK_BOTTOM) is applied per row, not baked in
+        profile.name,
+        " ".join(audio_encode_args(profile)),  # The audio is encoded here and stream-copied per row
+    )
+    return ASSET_CACHE_DIR / f"speaker_{key}.mkv"
+
+
+async def ensure_speaker_asset(base_video_path, mask_path, mask_width, mask_height, profile=None):
+    """
+    Returns the path of the circular-masked speaker: base video scaled to the
+    mask size with the mask as its alpha channel (FFV1 yuva420p, lossless) and
+    its audio already encoded with the encoder profile's AAC settings (default:
+    the run's ENCODER_PROFILE). Built once per content of base.mp4 and
+    mask.png, mask size and profile; any change produces a new key, so a
+    stale asset is never reused.
+    """
+    from ffmpeg_runner import run_ffmpeg  # Imported here: ffmpeg_runner -> render_scheduler imports this module
+
+    profile = profile or profile_for()
+    asset_path = await asyncio.to_thread(speaker_asset_path, base_video_path, mask_path, mask_width, mask_height, profile)
+    async with _build_locks[asset_path]:
+        if asset_path.exists():
+            logging.info(f"Using cached speaker asset: {asset_path}")
+            return asset_path
+
+        ASSET_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        logging.info(f"Building speaker asset: {asset_path}")
+        with atomic_output(asset_path) as tmp_path:
+            command = [
+                "ffmpeg",
+                "-y",
+                "-i", str(base_video_path),  # Base video
+                "-i", str(mask_path),  # Mask image
+                "-filter_complex",
+                (
+                    f"[0:v] scale={mask_width}:{mask_height},format=rgba [scaled];"
+                    f"[1:v] scale={mask_width}:{mask_height},format=gray [scaled_mask];"
+                    f"[scaled][scaled_mask] alphamerge,format=yuva420p [circle]"
+                ),
+                "-map", "[circle]",
+                "-map", "0:a",
+                "-c:v", "ffv1",  # Lossless, keeps the alpha plane
+                "-level", "3",
+                *audio_encode_args(profile),  # Encoded once here instead of on every row
+                "-threads", "0",
+                str(tmp_path),
+            ]
+            await run_ffmpeg(command, stage="speaker_asset")
+    logging.info(f"Speaker asset ready: {asset_path}")
+
+    # Drop assets built from older inputs
+    for old_asset in ASSET_CACHE_DIR.glob("speaker_*.mkv"):
+        if old_asset != asset_path:
+            old_asset.unlink(missing_ok=True)
+    return asset_path
@@ -0,0 +1,57 @@
+import logging
+import math
+from screenshot_loader import proxy_scale_for, read_image_size
+
+# Output geometry of the website background
+FRAME_WIDTH = 1920
+FRAME_HEIGHT = 1080
+
+
+def still_hold_scale(image_path):
+    """
+    Decode scale for the hold's screenshot: 1 (full resolution) whenever the
+    whole page fits in STRIP_MEMORY_MB decoded, otherwise the DCT proxy scale
+    from proxy_scale_for. ffmpeg can't decode just the top 1080 rows, so the
+    budget has to apply to the whole page; only pages too tall for the budget
+    get a softer, upscaled hold. Raises ScreenshotTooLargeError when even the
+    1/8 decode doesn't fit.
+    """
+    width, height = read_image_size(image_path)
+    return proxy_scale_for(width, height)
+
+
+def still_hold_input(image_path, duration, fps=30, scale=1):
+    """
+    Returns ffmpeg input arguments that read a single still image once.
+    still_hold_filter turns that one decoded frame into a hold of exactly
+    `duration` seconds at `fps`; replaces writing FPS * duration identical
+    PNG frames to disk. No -loop: the image2 demuxer would re-read and
+    re-decode the full-page screenshot for every output frame.
+    scale > 1 (see still_hold_scale) decodes the JPEG at 1/scale size.
+    """
+    logging.info(f"Using single-still hold for {image_path} ({duration}s at {fps} fps, 1/{scale} scale)")
+    lowres = []
+    if scale > 1:
+        lowres = ["-lowres", str(int(math.log2(scale)))]  # Reduced-size JPEG decode, the full page is never materialized
+    return [
+        *lowres,
+        "-framerate", str(fps),  # Frame rate of the still
+        "-i", str(image_path),  # The screenshot itself, decoded once
+    ]
+
+
+def still_hold_filter(duration, fps=30, scale=1):
+    """
+    Returns the filter chain that turns the decoded screenshot into the hold
+    background. Same as img[:1080] followed by the usual scale in the overlay
+    pass; the crop happens before loop, so only the visible rows are held in
+    memory and repeated, like scroll_filter does.
+    """
+    frames = round(duration * fps)
+    return (
+        f"crop=iw:'min(ih,{FRAME_HEIGHT // scale})':0:0,"  # Top rows of the full-page screenshot
+        f"loop=loop={frames - 1}:size=1:start=0,"  # One decoded frame, repeated
+        f"setpts=N/({fps}*TB),"  # Steady timeline after loop
+        f"trim=end_frame={frames},"  # Exact hold duration
+        f"scale={FRAME_WIDTH}:{FRAME_HEIGHT},format=yuv420p"
+    )
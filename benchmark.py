@@ -0,0 +1,453 @@
+"""
+Offline render benchmarks. Each subcommand renders a fixed synthetic sample on
+this machine and prints wall times, so render settings can be compared with data.
+
+    python benchmark.py frames --frames 300
+    python benchmark.py render-jobs --seconds 4 --save
+    python benchmark.py pyav --rows 3
+    python benchmark.py profiles --seconds 10
+    python benchmark.py metrics metrics/ffmpeg_metrics.jsonl
+    python benchmark.py sheet --rows 10000 --latency-ms 150 --quota 60
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+from encode_metrics import FFMPEG_METRICS_PATH, load_metrics, summarize_metrics
+from encoder_profiles import ENCODER_PROFILES
+from generate_mask import load_mask_geometry
+from ffmpeg_runner import run_ffmpeg
+from frame_sink import pipe_input_args, stream_frames_to_ffmpeg
+from media_probe import video_duration
+from render_graph import audio_encode_args, build_drawtext_filters, build_single_pass_command, escape_drawtext, first_segment_duration
+from render_scheduler import RenderScheduler, host_cpus, save_calibration
+from screenshot_watcher import ScreenshotWatcher
+from sheet_backend import ConcurrentWriter, LocalWorksheet, write_local_sheet
+from sheet_mirror import SheetMirror
+from sheet_writeback import SheetWriteBuffer
+from sheets_client import SheetsClient
+
+FPS = 30
+SCROLL_STEP = 15
+SHEET_HEADERS = ["Website URL", "Company Name", "Screenshot", "Personal Video"]
+
+
+def synthetic_screenshot(width=1920, height=6000):
+    """
+    Returns a tall BGR test image with gradients and stripes, so the encoder has
+    real detail to compress (a flat image would flatter every path).
+    """
+    y = np.arange(height, dtype=np.int32)[:, None]
+    x = np.arange(width, dtype=np.int32)[None, :]
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[..., 0] = (x // 4) % 256
+    img[..., 1] = (y // 2) % 256
+    img[..., 2] = ((x + y) // 16 % 2) * 255
+    return img
+
+
+def sample_frames(img, count):
+    """Yields `count` 1080-row windows scrolling down the image."""
+    max_offset = img.shape[0] - 1080
+    for idx in range(count):
+        offset = (idx * SCROLL_STEP) % (max_offset + 1)
+        yield img[offset:offset + 1080, :, :]
+
+
+def encode_args(output_path, preset):
+    return [
+        "-vf", "scale=1920:1080,format=yuv420p",
+        "-c:v", "libx264",
+        "-preset", preset,
+        "-crf", "16",
+        "-threads", "0",
+        str(output_path),
+    ]
+
+
+def bench_png_directory(img, count, preset, work_dir):
+    frames_dir = work_dir / "frames"
+    frames_dir.mkdir()
+    start = time.perf_counter()
+    for idx, frame in enumerate(sample_frames(img, count)):
+        cv2.imwrite(str(frames_dir / f"frame_{idx:04d}.png"), frame)
+    written = time.perf_counter()
+    command = [
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-r", str(FPS),
+        "-i", str(frames_dir / "frame_%04d.png"),
+        *encode_args(work_dir / "png.mp4", preset),
+    ]
+    subprocess.run(command, check=True)
+    encoded = time.perf_counter()
+    shutil.rmtree(frames_dir)
+    done = time.perf_counter()
+    return {
+        "write": written - start,
+        "encode": encoded - written,
+        "cleanup": done - encoded,
+        "total": done - start,
+    }
+
+
+def bench_pipe(img, count, preset, work_dir):
+    command = [
+        "ffmpeg", "-y", "-loglevel", "error",
+        *pipe_input_args(img.shape[1], 1080, FPS),
+        *encode_args(work_dir / "pipe.mp4", preset),
+    ]
+    start = time.perf_counter()
+    # One slot with every core, same as the PNG path's plain '-threads 0'
+    asyncio.run(stream_frames_to_ffmpeg(command, sample_frames(img, count), scheduler=RenderScheduler(jobs=1)))
+    return {"total": time.perf_counter() - start}
+
+
+def run_frames_benchmark(args):
+    img = synthetic_screenshot(height=args.height)
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        png = bench_png_directory(img, args.frames, args.preset, work_dir)
+        pipe = bench_pipe(img, args.frames, args.preset, work_dir)
+
+    print(f"{args.frames} frames, preset {args.preset}")
+    print(f"  PNG directory: {png['total']:.2f}s "
+          f"(write {png['write']:.2f}s, encode {png['encode']:.2f}s, cleanup {png['cleanup']:.2f}s)")
+    print(f"  rawvideo pipe: {pipe['total']:.2f}s")
+    print(f"  speedup:       {png['total'] / pipe['total']:.2f}x")
+
+
+def synthetic_encode_command(output_path, seconds, preset):
+    return [
+        "ffmpeg", "-y",
+        "-f", "lavfi",
+        "-i", f"testsrc2=size=1920x1080:rate={FPS}",  # Moving synthetic content
+        "-t", str(seconds),
+        "-c:v", "libx264",
+        "-preset", preset,
+        "-crf", "16",
+        "-pix_fmt", "yuv420p",
+        "-threads", "0",  # Replaced by the scheduler's per-slot budget
+        str(output_path),
+    ]
+
+
+async def bench_parallel_jobs(jobs, videos, seconds, preset, pin, work_dir):
+    """Renders `videos` clips with `jobs` encodes at a time; returns videos/hour."""
+    scheduler = RenderScheduler(jobs=jobs, pin=pin)
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        run_ffmpeg(synthetic_encode_command(work_dir / f"jobs{jobs}_{idx}.mp4", seconds, preset), stage="benchmark", scheduler=scheduler)
+        for idx in range(videos)
+    ))
+    return videos / (time.perf_counter() - start) * 3600
+
+
+def run_render_jobs_benchmark(args):
+    cpus = host_cpus()
+    levels = sorted({jobs for jobs in (1, 2, 4, len(cpus)) if jobs <= len(cpus)})
+    videos = args.videos or max(4, levels[-1])
+    print(f"{videos} clips of {args.seconds}s per level, preset {args.preset}, {len(cpus)} CPUs{' pinned' if args.pin else ''}")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for jobs in levels:
+            results[jobs] = asyncio.run(bench_parallel_jobs(jobs, videos, args.seconds, args.preset, args.pin, Path(tmp)))
+            print(f"  {jobs:>3} parallel: {results[jobs]:8.1f} videos/hour")
+
+    best = max(results, key=results.get)
+    print(f"  best: {best} parallel encodes")
+    if args.save:
+        save_calibration(len(cpus), best, {str(jobs): round(vph, 1) for jobs, vph in results.items()})
+        print("  saved; RENDER_JOBS=auto will use it on this host")
+
+
+def quality_scores(reference_path, test_path):
+    """Returns (PSNR dB, SSIM) of test_path against reference_path, averaged over all frames."""
+    command = [
+        "ffmpeg",
+        "-i", str(test_path),
+        "-i", str(reference_path),
+        "-lavfi", "[0:v]split[t0][t1];[1:v]split[r0][r1];[t0][r0]psnr;[t1][r1]ssim",
+        "-f", "null", "-",
+    ]
+    result = subprocess.run(command, check=True, capture_output=True, text=True)
+    psnr = re.search(r"PSNR .*?average:([\d.]+|inf)", result.stderr)
+    ssim = re.search(r"SSIM .*?All:([\d.]+)", result.stderr)
+    return (float(psnr.group(1)) if psnr else None, float(ssim.group(1)) if ssim else None)
+
+
+def run_pyav_benchmark(args):
+    from pyav_backend import PyAvRenderer  # Optional dependency, only needed here
+
+    load_dotenv(dotenv_path="./.env")
+    mask_geometry = load_mask_geometry()
+    geometry = [mask_geometry[name] for name in ("MASK_WIDTH", "MASK_HEIGHT", "MASK_LEFT", "MASK_BOTTOM")]
+    img = synthetic_screenshot(height=args.height)
+    texts = [f"Prepared For: Benchmark Company {idx}" for idx in range(args.rows)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        subprocess_times = []
+        for idx, text in enumerate(texts):
+            drawtext = build_drawtext_filters([(escape_drawtext(text), "black", 0, args.text_end, "(w-text_w)/2", "900")])
+            command = build_single_pass_command(
+                pipe_input_args(img.shape[1], 1080, FPS), "scale=1920:1080,format=yuv420p",
+                args.base, args.mask, *geometry[:2], *geometry[2:],
+                args.template, drawtext, args.tail, work_dir / f"ffmpeg_{idx}.mp4",
+                segment_duration=first_segment_duration(args.frames / FPS, video_duration(args.base)),
+            )
+            start = time.perf_counter()
+            asyncio.run(stream_frames_to_ffmpeg(command, sample_frames(img, args.frames), scheduler=RenderScheduler(jobs=1)))
+            subprocess_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        renderer = PyAvRenderer(args.base, args.mask, *geometry[:2], *geometry[2:], args.template, args.tail, (0, args.text_end))
+        warmup = time.perf_counter() - start
+        pyav_times = []
+        for idx, text in enumerate(texts):
+            start = time.perf_counter()
+            renderer.render(sample_frames(img, args.frames), text, work_dir / f"pyav_{idx}.mp4")
+            pyav_times.append(time.perf_counter() - start)
+
+        psnr, ssim = quality_scores(work_dir / "ffmpeg_0.mp4", work_dir / "pyav_0.mp4")
+
+    print(f"{args.rows} rows, {args.frames} background frames each")
+    print(f"  ffmpeg subprocess: {np.mean(subprocess_times):.2f}s/row ({', '.join(f'{t:.2f}' for t in subprocess_times)})")
+    print(f"  pyav in-process:   {np.mean(pyav_times):.2f}s/row ({', '.join(f'{t:.2f}' for t in pyav_times)}), warm-up {warmup:.2f}s")
+    print(f"  speedup:           {np.mean(subprocess_times) / np.mean(pyav_times):.2f}x")
+    print(f"  parity vs ffmpeg:  PSNR {psnr} dB, SSIM {ssim}")
+
+
+def lossless_sample_command(output_path, width):
+    """Piped scroll frames plus a test tone, stored losslessly as the common source for every profile."""
+    return [
+        "ffmpeg", "-y",
+        *pipe_input_args(width, 1080, FPS),
+        "-f", "lavfi",
+        "-i", "sine=frequency=440:sample_rate=48000",  # Audio, so the audio bitrate shows in the size
+        "-vf", "scale=1920:1080,format=yuv420p",
+        "-c:v", "libx264",
+        "-preset", "ultrafast",
+        "-qp", "0",  # Lossless
+        "-c:a", "pcm_s16le",
+        "-shortest",
+        str(output_path),
+    ]
+
+
+def profile_encode_command(source_path, output_path, profile):
+    return [
+        "ffmpeg", "-y",
+        "-i", str(source_path),
+        *profile.video_args,
+        "-pix_fmt", "yuv420p",
+        *audio_encode_args(profile),
+        "-threads", "0",
+        str(output_path),
+    ]
+
+
+def run_profiles_benchmark(args):
+    names = args.profiles.split(",") if args.profiles else list(ENCODER_PROFILES)
+    if "archive" not in names:
+        names.insert(0, "archive")  # Quality is scored against it
+    scheduler = RenderScheduler(jobs=1)  # One encode with every core, like a single row
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        if args.source:
+            source_path = Path(args.source)
+            seconds = None
+        else:
+            img = synthetic_screenshot(height=args.height)
+            source_path = work_dir / "source.mkv"
+            frames = int(args.seconds * FPS)
+            asyncio.run(stream_frames_to_ffmpeg(lossless_sample_command(source_path, img.shape[1]), sample_frames(img, frames), scheduler=scheduler))
+            seconds = args.seconds
+
+        results = {}
+        for name in names:
+            output_path = work_dir / f"{name}.mp4"
+            start = time.perf_counter()
+            try:
+                asyncio.run(run_ffmpeg(profile_encode_command(source_path, output_path, ENCODER_PROFILES[name]), stage="benchmark", scheduler=scheduler))
+            except subprocess.CalledProcessError:
+                results[name] = None  # Hardware encoder not present on this machine
+                continue
+            results[name] = {"time": time.perf_counter() - start, "size": output_path.stat().st_size}
+
+        if results.get("archive") is None:
+            raise SystemExit("archive profile failed to encode; nothing to score against")
+        for name, result in results.items():
+            if result is not None:
+                result["psnr"], result["ssim"] = quality_scores(work_dir / "archive.mp4", work_dir / f"{name}.mp4")
+
+    print(f"{'profile':<10}{'encode s':>10}{'x realtime':>12}{'size MB':>10}{'PSNR dB':>10}{'SSIM':>9}")
+    for name, result in results.items():
+        if result is None:
+            print(f"{name:<10}{'unavailable on this machine':>61}")
+            continue
+        realtime = f"{seconds / result['time']:.2f}" if seconds else "-"
+        print(
+            f"{name:<10}{result['time']:>10.2f}{realtime:>12}{result['size'] / 1e6:>10.2f}"
+            f"{result['psnr']:>10.2f}{result['ssim']:>9.4f}"
+        )
+    print("PSNR/SSIM are measured against the archive encode (archive vs itself is the upper bound).")
+
+
+def run_metrics_summary(args):
+    summary = summarize_metrics(load_metrics(args.path))
+    print(f"{'stage':<20}{'runs':>6}{'failed':>8}{'wall s':>10}{'cpu s':>10}{'frames':>10}{'fps':>8}")
+    for stage, stats in sorted(summary["stages"].items()):
+        fps = stats["frames"] / stats["wall_s"] if stats["wall_s"] else 0.0
+        print(
+            f"{stage:<20}{stats['runs']:>6}{stats['failed']:>8}{stats['wall_s']:>10.1f}"
+            f"{stats['cpu_s']:>10.1f}{stats['frames']:>10}{fps:>8.1f}"
+        )
+    if summary["videos_per_hour"] is not None:
+        print(f"{summary['videos']} videos, {summary['videos_per_hour']:.1f} videos/hour")
+
+
+async def simulate_sheet_pipeline(worksheet, rows, batch_size, render_seconds, mirror_path=None):
+    """
+    The sheet I/O of main() (start row, batch reads, screenshot waits,
+    result writes) around a fake render of render_seconds per row.
+    """
+    headers = worksheet.row_values(1)
+    personal_video_index = headers.index("Personal Video")
+    screenshot_index = headers.index("Screenshot")
+    watcher = ScreenshotWatcher(worksheet, chr(65 + screenshot_index))
+    mirror = None
+    if mirror_path is not None:
+        mirror = SheetMirror(worksheet, "Personal Video", db_path=mirror_path)
+        mirror.sync(headers)
+
+    async def fake_row(row_number, row_data):
+        screenshot = row_data[screenshot_index] if screenshot_index < len(row_data) else ""
+        if not screenshot:
+            screenshot = await watcher.wait_for(row_number, 600)
+        await asyncio.sleep(render_seconds)
+        return row_number, f"videos/row_{row_number}.mp4" if screenshot else "Error"
+
+    async with SheetWriteBuffer(worksheet) as writeback:
+        for start_row in range(2, rows + 2, batch_size):
+            end_row = start_row + batch_size - 1
+            if mirror:
+                mirror.refresh()
+                batch = mirror.rows(start_row, end_row)
+            else:
+                batch = worksheet.get_values(f"A{start_row}:D{end_row}")
+            results = await asyncio.gather(*(
+                fake_row(start_row + offset, row_data) for offset, row_data in enumerate(batch)
+                if any(row_data) and not (personal_video_index < len(row_data) and row_data[personal_video_index])
+            ))
+            for row_number, value in results:
+                if mirror:
+                    mirror.set_status(row_number, value)
+                await writeback.add(f"{chr(65 + personal_video_index)}{row_number}", value)
+    if mirror:
+        mirror.close()
+
+
+def run_sheet_benchmark(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        sheet_path = work_dir / "sheet.csv"
+        write_local_sheet(sheet_path, SHEET_HEADERS, [
+            [f"https://example{n}.com", f"Company {n}", "" if random.random() < args.missing_screenshots else f"screenshots/{n}.png", ""]
+            for n in range(args.rows)
+        ])
+        sheet = LocalWorksheet(sheet_path, args.latency_ms, args.jitter_ms, args.quota, args.error_rate)
+        client = SheetsClient(sheet)
+        writer = ConcurrentWriter(sheet, SHEET_HEADERS.index("Screenshot") + 1, args.writer_interval).start()
+        print(
+            f"{args.rows} rows in batches of {args.batch}, {args.render_seconds}s fake render per row, "
+            f"{args.latency_ms}+{args.jitter_ms}ms latency, quota {args.quota or 'none'}/min, "
+            f"{args.error_rate:.0%} errors, mirror {'off' if args.no_mirror else 'on'}"
+        )
+        start = time.perf_counter()
+        mirror_path = None if args.no_mirror else work_dir / "mirror.sqlite3"
+        asyncio.run(simulate_sheet_pipeline(client, args.rows, args.batch, args.render_seconds, mirror_path))
+        elapsed = time.perf_counter() - start
+        writer.stop()
+
+    render_only = -(-args.rows // args.batch) * args.render_seconds  # Batches run one after another
+    calls = {k.split(".", 1)[1]: v for k, v in client.counters.items() if k.startswith("calls.")}
+    print(f"  wall: {elapsed:.1f}s, {args.rows / elapsed * 3600:.0f} rows/hour")
+    if render_only:
+        print(f"  render only: {render_only:.1f}s, {args.rows / render_only * 3600:.0f} rows/hour")
+        print(f"  lost to sheet I/O: {max(0.0, 1 - render_only / elapsed):.1%}")
+    print(f"  requests: {sum(calls.values())} {calls}")
+    print(
+        f"  retries: {client.counters['retries']} ({client.counters['quota_errors']} on quota), "
+        f"coalesced: {client.counters['coalesced']}, throttled: {client.counters['throttled_seconds']:.1f}s, "
+        f"screenshots filled meanwhile: {writer.filled}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    frames_parser = subparsers.add_parser("frames", help="PNG frame directory vs rawvideo pipe")
+    frames_parser.add_argument("--frames", type=int, default=300, help="Number of frames to render")
+    frames_parser.add_argument("--height", type=int, default=6000, help="Synthetic screenshot height")
+    frames_parser.add_argument("--preset", default="slow", help="x264 preset used for both paths")
+    frames_parser.set_defaults(func=run_frames_benchmark)
+
+    jobs_parser = subparsers.add_parser("render-jobs", help="Aggregate videos/hour at 1, 2, 4 and N parallel encodes")
+    jobs_parser.add_argument("--seconds", type=float, default=4, help="Length of each synthetic clip")
+    jobs_parser.add_argument("--videos", type=int, default=None, help="Clips per level (default: max(4, CPU count))")
+    jobs_parser.add_argument("--preset", default="slow", help="x264 preset")
+    jobs_parser.add_argument("--pin", action="store_true", help="Pin each encode to its own cores")
+    jobs_parser.add_argument("--save", action="store_true", help="Store the best job count for RENDER_JOBS=auto")
+    jobs_parser.set_defaults(func=run_render_jobs_benchmark)
+
+    pyav_parser = subparsers.add_parser("pyav", help="ffmpeg subprocess vs in-process PyAV backend: speed and parity")
+    pyav_parser.add_argument("--rows", type=int, default=3, help="Rows to render with each backend")
+    pyav_parser.add_argument("--frames", type=int, default=90, help="Background frames per row")
+    pyav_parser.add_argument("--height", type=int, default=6000, help="Synthetic screenshot height")
+    pyav_parser.add_argument("--text-end", type=float, default=40, help="Seconds of the template that show the text")
+    pyav_parser.add_argument("--base", default="base.mp4", help="Speaker video")
+    pyav_parser.add_argument("--mask", default="mask.png", help="Speaker mask")
+    pyav_parser.add_argument("--template", default="NeedTextOverlay.mp4", help="Text template video")
+    pyav_parser.add_argument("--tail", default="last_explanation.mp4", help="Closing video")
+    pyav_parser.set_defaults(func=run_pyav_benchmark)
+
+    profiles_parser = subparsers.add_parser("profiles", help="Encode time, size and SSIM/PSNR of each encoder profile")
+    profiles_parser.add_argument("--seconds", type=float, default=10, help="Length of the synthetic sample")
+    profiles_parser.add_argument("--height", type=int, default=6000, help="Synthetic screenshot height")
+    profiles_parser.add_argument("--source", default=None, help="Use this video instead of the synthetic sample")
+    profiles_parser.add_argument("--profiles", default=None, help="Comma-separated profiles (default: all)")
+    profiles_parser.set_defaults(func=run_profiles_benchmark)
+
+    metrics_parser = subparsers.add_parser("metrics", help="Summarize a ffmpeg metrics JSONL file")
+    metrics_parser.add_argument("path", nargs="?", default=str(FFMPEG_METRICS_PATH), help="Metrics file written by the pipeline")
+    metrics_parser.set_defaults(func=run_metrics_summary)
+
+    sheet_parser = subparsers.add_parser("sheet", help="Throughput lost to sheet I/O, against a local sheet with simulated latency and errors")
+    sheet_parser.add_argument("--rows", type=int, default=10000, help="Rows in the generated sheet")
+    sheet_parser.add_argument("--batch", type=int, default=3, help="Rows per batch, like BATCH_SIZE")
+    sheet_parser.add_argument("--render-seconds", type=float, default=0, help="Fake render time per row")
+    sheet_parser.add_argument("--latency-ms", type=float, default=150, help="Simulated latency per request")
+    sheet_parser.add_argument("--jitter-ms", type=float, default=50, help="Random extra latency per request")
+    sheet_parser.add_argument("--quota", type=int, default=60, help="Requests per minute before 429s (0 = none)")
+    sheet_parser.add_argument("--error-rate", type=float, default=0.01, help="Fraction of requests that fail with 503")
+    sheet_parser.add_argument("--missing-screenshots", type=float, default=0, help="Fraction of rows whose screenshot arrives later")
+    sheet_parser.add_argument("--writer-interval", type=float, default=1, help="Seconds between screenshots filled by the concurrent writer")
+    sheet_parser.add_argument("--no-mirror", action="store_true", help="Read every batch from the sheet instead of the SQLite mirror")
+    sheet_parser.set_defaults(func=run_sheet_benchmark)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
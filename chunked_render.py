@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import os
+from pathlib import Path
+from ffmpeg_runner import run_ffmpeg
+
+CHUNK_GOP_FRAMES = int(os.getenv("CHUNK_GOP_FRAMES", "60"))  # Keyframe interval; chunks start on multiples of it
+CHUNK_MIN_SECONDS = float(os.getenv("CHUNK_MIN_SECONDS", "6"))  # Shorter chunks cost more in decode warm-up than they save
+
+
+def output_frame_count(segment_durations, fps):
+    """
+    Frames of a concatenated render. Every segment goes through its own fps
+    filter, so each segment is rounded to whole frames separately. Segment 1
+    must be its real length (render_graph.first_segment_duration), not just
+    the background's.
+    """
+    return sum(round(duration * fps) for duration in segment_durations)
+
+
+def plan_chunk_count(total_frames, fps, free_slots):
+    """How many chunks to split into: one per free encode slot, but none shorter than CHUNK_MIN_SECONDS."""
+    longest_useful = int(total_frames // (CHUNK_MIN_SECONDS * fps))
+    return max(1, min(free_slots, longest_useful))
+
+
+def chunk_ranges(total_frames, chunks, gop_frames=CHUNK_GOP_FRAMES):
+    """
+    Splits [0, total_frames) into up to `chunks` (start, end) frame ranges that
+    start on GOP boundaries. The last range is open-ended (end None), so an
+    estimated total_frames that is a few frames off still covers the video.
+    """
+    gops = max(1, -(-total_frames // gop_frames))
+    chunks = max(1, min(chunks, gops))
+    starts = [idx * gops // chunks * gop_frames for idx in range(chunks)]
+    ends = starts[1:] + [None]
+    return list(zip(starts, ends))
+
+
+async def render_chunked(build_chunk_command, ranges, audio_list_path, output_path):
+    """
+    Encodes every frame range in parallel (each job takes its own scheduler
+    slot), then joins the chunks and the pre-encoded soundtrack with a single
+    copy-concat. build_chunk_command(frame_range, chunk_path) must return an
+    ffmpeg command with identical encoder settings for every chunk, so the
+    chunks share SPS/PPS and can be stream-copied back to back.
+    """
+    output_path = Path(output_path)
+    chunk_paths = [output_path.with_name(f"{output_path.stem}_chunk{idx:02d}.mp4") for idx in range(len(ranges))]
+    list_path = output_path.with_name(f"{output_path.stem}_chunks.txt")
+    tasks = [
+        asyncio.create_task(run_ffmpeg(build_chunk_command(frame_range, chunk_path), stage="chunk"))
+        for frame_range, chunk_path in zip(ranges, chunk_paths)
+    ]
+    try:
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # One chunk failed or the row was cancelled: stop the others too
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        with open(list_path, "w") as file:
+            for chunk_path in chunk_paths:
+                file.write(f"file '{chunk_path.resolve()}'\n")
+        join_command = [
+            "ffmpeg",
+            "-y",
+            "-f", "concat",  # Video chunks
+            "-safe", "0",
+            "-i", str(list_path),
+            "-f", "concat",  # Pre-encoded static audio
+            "-safe", "0",
+            "-i", str(audio_list_path),
+            "-map", "0:v",
+            "-map", "1:a",
+            "-c", "copy",  # No re-encode, just stitching
+            str(output_path),
+        ]
+        await run_ffmpeg(join_command, stage="chunk_join")
+    finally:
+        for part in (*chunk_paths, list_path):
+            if part.exists():
+                part.unlink()
+    logging.info(f"Joined {len(ranges)} chunks into {output_path}")
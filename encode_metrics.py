@@ -0,0 +1,180 @@
+import contextvars
+import json
+import logging
+import os
+import re
+import time
+from pathlib import Path
+
+FFMPEG_METRICS_PATH = Path(os.getenv("FFMPEG_METRICS_PATH", "metrics/ffmpeg_metrics.jsonl"))
+FFMPEG_METRICS = os.getenv("FFMPEG_METRICS", "true").lower() == "true"  # Append one JSON line per ffmpeg run
+
+# Row label of the current task; asyncio copies context per task, so rows in one gather don't mix
+metrics_row = contextvars.ContextVar("metrics_row", default=None)
+
+# Written by ffmpeg -benchmark at exit: "bench: utime=1.234s stime=0.056s rtime=1.300s" and "bench: maxrss=123456KiB"
+_BENCH_TIMES = re.compile(r"bench: utime=([\d.]+)s stime=([\d.]+)s rtime=([\d.]+)s")
+_BENCH_MAXRSS = re.compile(r"bench: maxrss=(\d+)KiB")
+
+
+def progress_args():
+    """
+    Extra ffmpeg arguments: key=value progress blocks on stdout instead of the
+    console status line, plus per-process CPU time and peak memory at exit.
+    """
+    return [
+        "-progress", "pipe:1",  # Machine-readable progress on stdout
+        "-nostats",  # No \r status line on stderr
+        "-benchmark",  # utime/stime/maxrss of this process
+    ]
+
+
+def with_progress(command):
+    """Returns command with progress_args() right after the program name."""
+    return [command[0], *progress_args(), *command[1:]]
+
+
+def is_ffmpeg(command):
+    return Path(str(command[0])).stem.lower() == "ffmpeg"
+
+
+class ProgressParser:
+    """
+    Consumes ffmpeg -progress output. Each block ends with progress=continue
+    or progress=end; the last complete block is kept.
+    """
+
+    def __init__(self):
+        self.current = {}
+        self.last = {}
+        self.blocks = 0
+
+    def feed_line(self, line):
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return
+        self.current[key] = value
+        if key == "progress":
+            self.last = self.current
+            self.current = {}
+            self.blocks += 1
+            logging.debug(f"ffmpeg progress: frame={self.last.get('frame')} speed={self.last.get('speed')}")
+
+    async def feed_stream(self, stream):
+        while True:
+            line = await stream.readline()
+            if not line:
+                break
+            self.feed_line(line.decode("utf-8", errors="replace"))
+
+    def summary(self):
+        block = self.last or self.current
+        return {
+            "frames": _to_int(block.get("frame")),
+            "fps": _to_float(block.get("fps")),
+            "speed": _to_float(block.get("speed", "").rstrip("x")),
+            "out_time_s": _out_time_seconds(block),
+            "total_size": _to_int(block.get("total_size")),
+            "finished": block.get("progress") == "end",
+        }
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _out_time_seconds(block):
+    # out_time_ms is in microseconds despite its name; out_time_us is the newer key
+    micros = _to_int(block.get("out_time_us")) or _to_int(block.get("out_time_ms"))
+    return micros / 1_000_000 if micros is not None else None
+
+
+def parse_benchmark(stderr):
+    """Returns utime/stime/cpu/maxrss from the -benchmark lines of stderr."""
+    result = {"utime_s": None, "stime_s": None, "cpu_s": None, "maxrss_kb": None}
+    times = _BENCH_TIMES.findall(stderr or "")
+    if times:
+        utime, stime, _ = (float(value) for value in times[-1])
+        result.update(utime_s=utime, stime_s=stime, cpu_s=round(utime + stime, 3))
+    maxrss = _BENCH_MAXRSS.findall(stderr or "")
+    if maxrss:
+        result["maxrss_kb"] = int(maxrss[-1])
+    return result
+
+
+def record_encode(command, stage, status, returncode, wall_s, parser, stderr):
+    """Appends one JSON line describing a finished (or failed) ffmpeg run."""
+    if not FFMPEG_METRICS:
+        return
+    output = str(command[-1])
+    try:
+        output_bytes = os.path.getsize(output)
+    except OSError:
+        output_bytes = None
+    entry = {
+        "ts": round(time.time(), 3),
+        "row": metrics_row.get(),
+        "stage": stage or "ffmpeg",
+        "status": status,
+        "returncode": returncode,
+        "wall_s": round(wall_s, 3),
+        **parse_benchmark(stderr),
+        **parser.summary(),
+        "output": output,
+        "output_bytes": output_bytes,
+    }
+    try:
+        FFMPEG_METRICS_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(FFMPEG_METRICS_PATH, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError as e:
+        logging.warning(f"Could not write ffmpeg metrics: {e}")
+    logging.info(
+        f"ffmpeg {entry['stage']} ({entry['row']}): {status} in {wall_s:.1f}s, "
+        f"cpu {entry['cpu_s']}s, {entry['frames']} frames, speed {entry['speed']}x"
+    )
+
+
+def load_metrics(path=FFMPEG_METRICS_PATH):
+    entries = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return entries
+
+
+def summarize_metrics(entries, final_stages=("single_pass", "concat", "render", "chunk_join")):
+    """
+    Per-stage totals and overall videos/hour. A row counts as one video when
+    one of final_stages finished with status ok.
+    """
+    stages = {}
+    for entry in entries:
+        stats = stages.setdefault(entry["stage"], {"runs": 0, "failed": 0, "wall_s": 0.0, "cpu_s": 0.0, "frames": 0})
+        stats["runs"] += 1
+        if entry["status"] != "ok":
+            stats["failed"] += 1
+        stats["wall_s"] += entry.get("wall_s") or 0.0
+        stats["cpu_s"] += entry.get("cpu_s") or 0.0
+        stats["frames"] += entry.get("frames") or 0
+
+    videos = [e for e in entries if e["stage"] in final_stages and e["status"] == "ok"]
+    videos_per_hour = None
+    if entries and videos:
+        first_start = min(e["ts"] - e["wall_s"] for e in entries)
+        last_end = max(e["ts"] for e in entries)
+        if last_end > first_start:
+            videos_per_hour = len(videos) / ((last_end - first_start) / 3600)
+    return {"stages": stages, "videos": len(videos), "videos_per_hour": videos_per_hour}
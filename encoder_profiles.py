@@ -0,0 +1,103 @@
+import collections
+import logging
+import os
+from pathlib import Path
+
+ENCODER_PROFILE = os.getenv("ENCODER_PROFILE", "archive")  # archive | delivery | draft | qsv | amf
+# Per-template overrides, e.g. "NeedTextOverlay=delivery,Webinar=draft" (keyed by the text template's file stem)
+TEMPLATE_ENCODER_PROFILES = os.getenv("TEMPLATE_ENCODER_PROFILES", "")
+
+EncoderProfile = collections.namedtuple("EncoderProfile", ["name", "video_args", "audio_bitrate", "description"])
+
+ENCODER_PROFILES = {
+    "archive": EncoderProfile(
+        "archive",
+        [
+            "-c:v", "libx264",  # Use the H.264 codec for video encoding
+            "-preset", "slow",  # High-quality compression preset
+            "-crf", "16",  # High video quality (lower CRF = better quality)
+        ],
+        "320k",
+        "Master quality, the settings every render used before profiles existed",
+    ),
+    "delivery": EncoderProfile(
+        "delivery",
+        [
+            "-c:v", "libx264",
+            "-preset", "medium",  # About 2x faster than slow for a small size cost
+            "-crf", "20",  # Visually transparent for screen content at 1080p
+        ],
+        "192k",
+        "What recipients watch: smaller files, faster encode",
+    ),
+    "draft": EncoderProfile(
+        "draft",
+        [
+            "-c:v", "libx264",
+            "-preset", "veryfast",
+            "-crf", "28",  # Visible softening; for checking layout and text only
+        ],
+        "128k",
+        "Quick previews",
+    ),
+    "qsv": EncoderProfile(
+        "qsv",
+        [
+            "-c:v", "h264_qsv",  # Intel Quick Sync hardware encoder
+            "-preset", "veryfast",
+            "-global_quality", "25",  # ICQ quality level, roughly comparable to x264 CRF
+        ],
+        "192k",
+        "Intel iGPU hosts",
+    ),
+    "amf": EncoderProfile(
+        "amf",
+        [
+            "-c:v", "h264_amf",  # AMD hardware encoder
+            "-quality", "balanced",
+            "-rc", "cqp",  # Constant QP, the closest AMF has to CRF
+            "-qp_i", "20",
+            "-qp_p", "22",
+        ],
+        "192k",
+        "AMD GPU hosts",
+    ),
+}
+
+
+def get_profile(name):
+    try:
+        return ENCODER_PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown encoder profile {name!r}; choose one of {', '.join(ENCODER_PROFILES)}") from None
+
+
+def template_overrides(spec=TEMPLATE_ENCODER_PROFILES):
+    """Parses "stem=profile,stem=profile" into a dict."""
+    overrides = {}
+    for item in spec.split(","):
+        stem, sep, name = item.partition("=")
+        if sep and stem.strip():
+            overrides[stem.strip()] = name.strip()
+    return overrides
+
+
+def profile_for(template_path=None):
+    """
+    The profile for a run: the override for this text template when one is
+    configured, otherwise ENCODER_PROFILE.
+    """
+    name = ENCODER_PROFILE
+    if template_path is not None:
+        name = template_overrides().get(Path(template_path).stem, name)
+    profile = get_profile(name)
+    logging.debug(f"Encoder profile for {template_path}: {profile.name}")
+    return profile
+
+
+def x264_options(profile):
+    """crf/preset of a libx264 profile as encoder options (for the in-process PyAV backend)."""
+    args = dict(zip(profile.video_args[::2], profile.video_args[1::2]))
+    if args.get("-c:v") != "libx264":
+        raise ValueError(f"Encoder profile {profile.name} does not use libx264")
+    return {"crf": args["-crf"], "preset": args["-preset"]}
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import os
+import subprocess
+import time
+from contextlib import asynccontextmanager
+from encode_metrics import ProgressParser, is_ffmpeg, record_encode, with_progress
+from render_scheduler import RenderScheduler, apply_thread_budget, is_stream_copy
+
+FFMPEG_TIMEOUT = float(os.getenv("FFMPEG_TIMEOUT", "1800"))  # Seconds before a job is considered hung and killed
+STDERR_TAIL_BYTES = 64 * 1024  # Stderr kept per job for error reports
+
+default_scheduler = RenderScheduler()
+_light_jobs = asyncio.Semaphore(max(2, len(default_scheduler.cpus)))  # ffprobe and stream copies
+
+
+@asynccontextmanager
+async def ffmpeg_slot(command, scheduler=None):
+    """
+    Yields the encode Slot the command may use, waiting for one to be free.
+    ffprobe and '-c copy' remuxes don't encode and yield None instead.
+    """
+    scheduler = scheduler or default_scheduler
+    if not is_ffmpeg(command) or is_stream_copy(command):
+        async with _light_jobs:
+            yield None
+    else:
+        async with scheduler.slot() as slot:
+            yield slot
+
+
+def budget_command(command, slot):
+    """Applies the slot's thread budget to an encode command."""
+    return apply_thread_budget(command, slot.threads) if slot is not None else command
+
+
+async def collect_stream(stream, buffer, keep_bytes=None):
+    # Chunked reads: ffmpeg's progress line is rewritten with \r and can grow past readline()'s limit
+    while True:
+        chunk = await stream.read(64 * 1024)
+        if not chunk:
+            break
+        buffer.extend(chunk)
+        if keep_bytes is not None and len(buffer) > keep_bytes:
+            del buffer[:-keep_bytes]
+
+
+async def kill_process(process):
+    """Kills a still-running process and reaps it, so nothing is left behind."""
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+
+async def run_ffmpeg(command, timeout=FFMPEG_TIMEOUT, capture_stdout=False, stage=None, scheduler=None):
+    """
+    Runs an ffmpeg (or ffprobe) command without blocking the event loop.
+    Encodes wait for a scheduler slot and run with its thread budget (and CPU
+    affinity when pinning is on), so concurrent rows split the cores between them.
+    On timeout or cancellation the process is killed before the error propagates.
+    Raises subprocess.CalledProcessError (with the stderr tail) on a nonzero exit
+    and subprocess.TimeoutExpired after `timeout` seconds.
+    Returns a subprocess.CompletedProcess; stdout is text when capture_stdout=True.
+    ffmpeg runs (not ffprobe, not capture_stdout) report -progress on stdout and
+    are recorded in the metrics file under `stage` (see encode_metrics).
+    """
+    parser = None
+    if is_ffmpeg(command) and not capture_stdout:
+        parser = ProgressParser()
+        command = with_progress(command)
+
+    async with ffmpeg_slot(command, scheduler) as slot:
+        command = budget_command(command, slot)
+        started = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.DEVNULL,  # ffmpeg must never wait on a terminal prompt
+            stdout=asyncio.subprocess.PIPE if capture_stdout or parser else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            preexec_fn=(scheduler or default_scheduler).pin_preexec(slot),  # CPU affinity set before exec
+        )
+        stderr_tail = bytearray()
+        stdout = bytearray()
+        readers = [collect_stream(process.stderr, stderr_tail, STDERR_TAIL_BYTES)]
+        if parser:
+            readers.append(parser.feed_stream(process.stdout))
+        elif capture_stdout:
+            readers.append(collect_stream(process.stdout, stdout))
+        try:
+            await asyncio.wait_for(asyncio.gather(*readers, process.wait()), timeout)
+        except asyncio.TimeoutError:
+            await kill_process(process)
+            stderr = stderr_tail.decode("utf-8", errors="replace")
+            if parser:
+                record_encode(command, stage, "timeout", process.returncode, time.perf_counter() - started, parser, stderr)
+            logging.error(f"ffmpeg timed out after {timeout:.0f}s: {' '.join(map(str, command))}")
+            raise subprocess.TimeoutExpired(command, timeout, stderr=stderr)
+        except BaseException:
+            await kill_process(process)  # Cancelled with the rest of the batch
+            if parser:
+                record_encode(command, stage, "cancelled", process.returncode, time.perf_counter() - started, parser, "")
+            raise
+
+    stderr = stderr_tail.decode("utf-8", errors="replace")
+    if parser:
+        status = "ok" if process.returncode == 0 else "failed"
+        record_encode(command, stage, status, process.returncode, time.perf_counter() - started, parser, stderr)
+    if process.returncode != 0:
+        logging.error(f"ffmpeg exited with {process.returncode}: {stderr[-2000:]}")
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr)
+    return subprocess.CompletedProcess(command, process.returncode, stdout.decode("utf-8", errors="replace"), stderr)
@@ -0,0 +1,131 @@
+import asyncio
+import itertools
+import logging
+import subprocess
+import time
+from encode_metrics import ProgressParser, record_encode, with_progress
+from ffmpeg_runner import FFMPEG_TIMEOUT, STDERR_TAIL_BYTES, budget_command, collect_stream, default_scheduler, ffmpeg_slot, kill_process
+
+
+def pipe_input_args(width, height, fps=30):
+    """
+    Returns ffmpeg input arguments for raw BGR frames arriving on stdin.
+    Use in place of ["-r", "30", "-i", "frame_%04d.png"].
+    """
+    return [
+        "-f", "rawvideo",  # Uncompressed frames, no PNG encode/decode
+        "-pix_fmt", "bgr24",  # OpenCV channel order
+        "-s", f"{width}x{height}",  # Frame size
+        "-r", str(fps),  # Input frame rate
+        "-i", "pipe:0",  # Read frames from stdin
+    ]
+
+
+def peek_frame_size(frames):
+    """
+    Returns (width, height, frames) where frames is the same iterable with the
+    first frame put back in front.
+    """
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is None:
+        raise ValueError("No frames to stream")
+    height, width = first.shape[:2]
+    return width, height, itertools.chain([first], frames)
+
+
+class FfmpegFrameSink:
+    """
+    A running ffmpeg process that consumes NumPy frames over stdin.
+    write() waits on the pipe drain, so a slow encoder throttles the producer and
+    only a few frames are ever held in memory.
+    """
+
+    def __init__(self, command, preexec_fn=None):
+        self.command = with_progress(command)
+        self.preexec_fn = preexec_fn  # e.g. RenderScheduler.pin_preexec, runs in the child before exec
+        self.process = None
+        self.frames_written = 0
+        self.progress = ProgressParser()
+        self._stderr_tail = bytearray()
+        self._output_tasks = []
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,  # -progress blocks
+            stderr=asyncio.subprocess.PIPE,
+            preexec_fn=self.preexec_fn,
+        )
+        self._output_tasks = [
+            asyncio.create_task(collect_stream(self.process.stderr, self._stderr_tail, STDERR_TAIL_BYTES)),
+            asyncio.create_task(self.progress.feed_stream(self.process.stdout)),
+        ]
+        return self
+
+    @property
+    def stderr(self):
+        return self._stderr_tail.decode("utf-8", errors="replace")
+
+    async def write(self, frame):
+        self.process.stdin.write(frame.tobytes())
+        await self.process.stdin.drain()  # Backpressure: wait for ffmpeg to catch up
+        self.frames_written += 1
+
+    async def close(self):
+        if self.process.stdin and not self.process.stdin.is_closing():
+            self.process.stdin.close()
+            try:
+                await self.process.stdin.wait_closed()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        returncode = await self.process.wait()
+        await asyncio.gather(*self._output_tasks)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, self.command, stderr=self.stderr)
+        return returncode
+
+    async def abort(self):
+        if self.process:
+            await kill_process(self.process)
+
+
+async def _feed(sink, frames):
+    try:
+        for frame in frames:
+            await sink.write(frame)
+    except (BrokenPipeError, ConnectionResetError):
+        # ffmpeg stopped reading early (e.g. -shortest); its exit code decides
+        logging.info("ffmpeg closed its input before all frames were written")
+    await sink.close()
+
+
+async def stream_frames_to_ffmpeg(command, frames, timeout=FFMPEG_TIMEOUT, stage=None, scheduler=None):
+    """
+    Runs `command` (which must read its first input from pipe:0) and feeds it
+    every frame from the `frames` iterable. Returns the number of frames written.
+    Shares the ffmpeg_runner job slots; the process is killed on timeout or
+    cancellation. Progress and timings are recorded under `stage`.
+    """
+    async with ffmpeg_slot(command, scheduler) as slot:
+        started = time.perf_counter()
+        pin = (scheduler or default_scheduler).pin_preexec(slot)
+        sink = await FfmpegFrameSink(budget_command(command, slot), pin).start()
+        try:
+            await asyncio.wait_for(_feed(sink, frames), timeout)
+        except asyncio.TimeoutError:
+            await sink.abort()
+            record_encode(sink.command, stage, "timeout", sink.process.returncode, time.perf_counter() - started, sink.progress, sink.stderr)
+            logging.error(f"ffmpeg timed out after {timeout:.0f}s while streaming frames")
+            raise subprocess.TimeoutExpired(command, timeout, stderr=sink.stderr)
+        except subprocess.CalledProcessError:
+            record_encode(sink.command, stage, "failed", sink.process.returncode, time.perf_counter() - started, sink.progress, sink.stderr)
+            raise
+        except BaseException:
+            await sink.abort()
+            record_encode(sink.command, stage, "cancelled", sink.process.returncode, time.perf_counter() - started, sink.progress, "")
+            raise
+    record_encode(sink.command, stage, "ok", sink.process.returncode, time.perf_counter() - started, sink.progress, sink.stderr)
+    logging.info(f"Streamed {sink.frames_written} frames to ffmpeg")
+    return sink.frames_written
@@ -1,212 +1,404 @@
+import json
 import os
+import shutil
 import numpy as np
 import logging
 import cv2
 from dotenv import load_dotenv
 from pathlib import Path
+from asset_cache import ASSET_CACHE_DIR, atomic_output, cache_key, file_digest
 
 # Constants
 MASK_IMAGE_ENCODED_PATH = "mask.png"
+MASK_GEOMETRY_PATH = "mask_geometry.json"  # MASK_WIDTH/HEIGHT/LEFT/BOTTOM of mask.png, written next to it
+MASK_TRACK_PATH = "mask_track.json"  # Per-timestamp face offsets (MASK_MODE=track only)
 MODEL_PATH = r"models/deploy.prototxt"
 WEIGHTS_PATH = r"models/res10_300x300_ssd_iter_140000.caffemodel"
 VIDEO_PATH = r"base.mp4"
+TARGET_WIDTH = 700  # Speaker frames are scaled to this width before detection
+FRAME_SKIP = 10  # Look at every 10th frame (at most MASK_MAX_SAMPLES of them)
+CONFIDENCE_THRESHOLD = 0.5
+HEAD_MARGIN = 130  # generally we will use 100 but for kevin video we are using 130
 
 
 # Load environment variables
 load_dotenv(dotenv_path="./.env")
+MASK_MAX_SAMPLES = int(os.getenv("MASK_MAX_SAMPLES", "64"))  # Frames decoded at most, whatever the video length
+MASK_BATCH_SIZE = int(os.getenv("MASK_BATCH_SIZE", "8"))  # Sampled frames per net.forward()
+MASK_MODE = os.getenv("MASK_MODE", "first")  # first (first confident frame) | track (robust median over a uniform sample)
+MASK_TRACK_SAMPLES = int(os.getenv("MASK_TRACK_SAMPLES", "48"))  # Uniformly spaced frames in track mode
+MASK_OUTLIER_K = float(os.getenv("MASK_OUTLIER_K", "3.0"))  # Robust z-score above which a track box is rejected
+SEEK_MIN_GAP = 30  # Shorter gaps are cheaper to grab() through than to seek (a seek decodes from the previous keyframe)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
-if Path(MASK_IMAGE_ENCODED_PATH).exists():
-    try:
-        Path(MASK_IMAGE_ENCODED_PATH).unlink()
-        logging.info(f"deleted mask..")
-    except Exception as e:
-            logging.error(f"Error while deleting mask: {e}")
-print("Mask generation started")
-#update env file mask width and height
-def update_env_value(key, value, env_file=".env"):
-    """Updates or adds a key=value line in the given .env file."""
+
+def sample_indices(total_frames, frame_skip=10, max_samples=None):
+    """
+    Frame indices to inspect: every frame_skip-th frame (as before), thinned
+    out evenly on long videos so there are never more than max_samples.
+    """
+    max_samples = max_samples or MASK_MAX_SAMPLES
+    indices = list(range(frame_skip - 1, total_frames, frame_skip))
+    if len(indices) > max_samples:
+        indices = [indices[i * len(indices) // max_samples] for i in range(max_samples)]
+    return indices
+
+
+def iter_sampled_frames(cap, indices):
+    """
+    Yields (index, frame) for the requested frame indices only. Short gaps
+    are skipped with grab() (no color conversion or copy); long gaps seek,
+    which decodes from the previous keyframe instead of from the current
+    position.
+    """
+    position = 0
+    for index in indices:
+        if index - position > SEEK_MIN_GAP:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            position = index
+        while position < index:
+            if not cap.grab():
+                return
+            position += 1
+        ret, frame = cap.read()
+        if not ret:
+            return
+        position += 1
+        yield index, frame
+
+
+def iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def detect_faces(net, frames):
+    """
+    Runs the face detector on a batch of frames in a single forward pass.
+    Returns one list per frame of (confidence, box) in detection order, where
+    box is (x1, y1, x2, y2) relative to the frame size.
+    """
+    blob = cv2.dnn.blobFromImages(frames, 1.0, (300, 300), (104.0, 177.0, 123.0))
+    net.setInput(blob)
+    detections = net.forward()
+    per_frame = [[] for _ in frames]
+    for detection in detections[0, 0]:
+        image_id = int(detection[0])
+        if 0 <= image_id < len(frames):
+            per_frame[image_id].append((float(detection[2]), detection[3:7]))
+    return per_frame
+
+
+def resize_for_detection(batch):
+    """Scales each (index, frame) of a batch to TARGET_WIDTH, keeping the aspect ratio."""
+    frames = []
+    for _, frame in batch:
+        h, w = frame.shape[:2]
+        scale_factor = TARGET_WIDTH / w
+        new_w = TARGET_WIDTH
+        new_h = int(h * scale_factor)
+        frames.append(cv2.resize(frame, (new_w, new_h)))
+    return frames
+
+
+def first_face(cap, net, total_frames):
+    """
+    Box (x1, y1, x2, y2 in pixels) of the first confident face in the sampled
+    frames, plus the (width, height) it refers to.
+    """
+    indices = sample_indices(total_frames, FRAME_SKIP)
+    logging.info(f"Total frames in video: {total_frames}, sampling {len(indices)}")
+    for batch in iter_batches(iter_sampled_frames(cap, indices), MASK_BATCH_SIZE):
+        frames = resize_for_detection(batch)
+        h, w = frames[0].shape[:2]
+        # Earliest sampled frame with a confident face wins, as with the frame-by-frame scan
+        for faces in detect_faces(net, frames):
+            for confidence, relative_box in faces:
+                if confidence > CONFIDENCE_THRESHOLD:
+                    return relative_box * np.array([w, h, w, h]), (w, h)
+    raise RuntimeError("Failed to generate mask.png: No face detected in the video.")
+
+
+def robust_inliers(boxes, k=None):
+    """
+    Boolean mask of the boxes whose center and size are all within k scaled
+    MADs of the median (a robust z-score), so a few odd frames can't move
+    the result. Falls back to keeping everything if nothing would survive.
+    """
+    k = k or MASK_OUTLIER_K
+    features = np.column_stack([
+        (boxes[:, 0] + boxes[:, 2]) / 2,  # center x
+        (boxes[:, 1] + boxes[:, 3]) / 2,  # center y
+        boxes[:, 2] - boxes[:, 0],  # width
+        boxes[:, 3] - boxes[:, 1],  # height
+    ])
+    median = np.median(features, axis=0)
+    mad = np.median(np.abs(features - median), axis=0) * 1.4826  # Scaled to a standard deviation for normal data
+    scores = np.abs(features - median) / np.maximum(mad, 1.0)  # At least one pixel, so a perfectly still speaker keeps all boxes
+    inliers = np.all(scores <= k, axis=1)
+    return inliers if inliers.any() else np.ones(len(boxes), dtype=bool)
+
+
+def rolling_median(values, window=5):
+    """Centered running median of a 1-D array (edges padded with the end values)."""
+    if len(values) < window:
+        return values
+    padded = np.pad(values, window // 2, mode="edge")
+    return np.median(np.lib.stride_tricks.sliding_window_view(padded, window), axis=1)
+
+
+def face_track(cap, net, total_frames):
+    """
+    Detects the face on MASK_TRACK_SAMPLES uniformly spaced frames (batched
+    forward passes) and aggregates the boxes. Returns (box, (width, height),
+    track): the robust median box, and per sampled timestamp the offset of
+    the face center from that box, with outliers interpolated and smoothed.
+    """
+    indices = np.unique(np.linspace(0, max(total_frames - 1, 0), MASK_TRACK_SAMPLES).round().astype(int)).tolist()
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    logging.info(f"Total frames in video: {total_frames}, tracking the face on {len(indices)} frames")
+    times, boxes = [], []
+    size = None
+    for batch in iter_batches(iter_sampled_frames(cap, indices), MASK_BATCH_SIZE):
+        frames = resize_for_detection(batch)
+        h, w = frames[0].shape[:2]
+        size = (w, h)
+        for (index, _), faces in zip(batch, detect_faces(net, frames)):
+            confident = [face for face in faces if face[0] > CONFIDENCE_THRESHOLD]
+            if confident:
+                # Strongest face of the frame
+                times.append(index / fps)
+                boxes.append(max(confident, key=lambda face: face[0])[1])
+    if not boxes:
+        raise RuntimeError("Failed to generate mask.png: No face detected in the video.")
+
+    w, h = size
+    boxes = np.array(boxes, dtype=np.float64) * np.array([w, h, w, h])
+    times = np.array(times)
+    inliers = robust_inliers(boxes)
+    box = np.median(boxes[inliers], axis=0)
+    logging.info(f"Face track: {len(boxes)} detections, {int((~inliers).sum())} rejected as outliers")
+
+    centers = np.column_stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2])
+    center = np.array([(box[0] + box[2]) / 2, (box[1] + box[3]) / 2])
+    offsets = []
+    for axis in range(2):
+        # Outlier samples take the value interpolated from their inlier neighbours
+        filled = np.interp(times, times[inliers], centers[inliers, axis])
+        offsets.append(np.rint(rolling_median(filled) - center[axis]).astype(int))
+    track = {
+        "width": w,
+        "height": h,
+        "points": [
+            {"t": round(float(t), 3), "dx": int(dx), "dy": int(dy)}
+            for t, dx, dy in zip(times, offsets[0], offsets[1])
+        ],
+    }
+    return box, size, track
+
+
+def detect_mask(video_path=VIDEO_PATH, model_path=MODEL_PATH, weights_path=WEIGHTS_PATH):
+    """
+    Finds the speaker's face in base video frames and returns
+    (mask, geometry, track): the circular binary mask, its MASK_* values
+    (strings, as the render scripts splice them into ffmpeg filters) and,
+    with MASK_MODE=track, the per-timestamp face offsets (else None).
+    Raises RuntimeError when no face is detected.
+    """
+    # Verify that the model files exist
+    if not os.path.exists(model_path) or not os.path.exists(weights_path):
+        raise FileNotFoundError(f"Model files not found: {model_path}, {weights_path}")
+
+    # Load the pre-trained DNN model for face detection
+    net = cv2.dnn.readNetFromCaffe(model_path, weights_path)
+
+    # Open the video file
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open video at {video_path}.")
+
+    track = None
     try:
-        with open(env_file, "r") as f:
-            lines = f.readlines()
-    except FileNotFoundError:
-        # If .env doesn't exist yet, start with no lines
-        lines = []
-
-    new_lines = []
-    replaced = False
-
-    for line in lines:
-        if line.strip().startswith(f"{key}="):
-            new_lines.append(f"{key}={value}\n")
-            replaced = True
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if MASK_MODE == "track":
+            box, (w, h), track = face_track(cap, net, total_frames)
         else:
-            new_lines.append(line)
-
-    if not replaced:
-        # If the key wasn't found, add it at the end
-        new_lines.append(f"{key}={value}\n")
-
-    with open(env_file, "w") as f:
-        f.writelines(new_lines)
-
-    
-def check_or_generate_mask():
-   
+            box, (w, h) = first_face(cap, net, total_frames)
+    finally:
+        cap.release()
+    new_h = h
+
+    x, y, x2, y2 = box.astype("int")
+    face_width = x2 - x
+    face_height = y2 - y
+
+    # Calculate circle parameters
+    # distance_from_head_above = max(0, y - (100*new_h)//720)
+    value = HEAD_MARGIN
+    while value>=0:
+        distance_from_head_above = max(0, y - (value * new_h) // 720)
+        if distance_from_head_above != 0:
+            break
+        value -= 10
+
+    circle_center_y = (distance_from_head_above + h) // 2
+    circle_center_x = x + face_width // 2
+
+    radius = max(
+        (h - distance_from_head_above) // 2,
+        face_width // 2,
+        face_height // 2
+    )
+
+    radius = min(
+        radius,
+        circle_center_y - distance_from_head_above,
+        h - circle_center_y,
+        circle_center_x,
+        w - circle_center_x
+    )
+
+    circle_center = (int(circle_center_x), int(circle_center_y))
+
+    # Calculate distances from boundaries
+    distance_left_to_circle = circle_center_x - radius
+    distance_bottom_to_circle = h - (circle_center_y + radius)
+
+    # Print the distances
+    print(f"Distance from left boundary to circle boundary: {distance_left_to_circle}")
+    print(f"Distance from bottom boundary to circle boundary: {distance_bottom_to_circle}")
+    print(f"Frame dimensions: width={w}, height={h}")
+    geometry = {}
+    left=distance_left_to_circle
+    if left>10:
+        left=(left-10)
+        geometry["MASK_LEFT"] = f"-{str(left)}"
+    elif left<10:
+        left=(10-left)
+        geometry["MASK_LEFT"] = f"+{str(left)}"
+    else:
+        geometry["MASK_LEFT"] = "10"
+    bottom=distance_bottom_to_circle
+    if bottom>10:
+        bottom=(bottom-10)
+        geometry["MASK_BOTTOM"] = f"-{str(bottom)}"
+    if bottom<10:
+        bottom=10-bottom
+        geometry["MASK_BOTTOM"] = f"-{str(bottom)}"
+    else:
+        geometry["MASK_BOTTOM"] = "10"
+
+    geometry["MASK_HEIGHT"] = str(h)
+    geometry["MASK_WIDTH"] = str(w)
+
+    # Create a binary mask
+    mask = np.zeros((h, w), dtype=np.uint8)
+    cv2.circle(mask, circle_center, int(radius), 255, -1)
+    logging.info(f"Circle center: {circle_center}, radius: {radius}")
+    return mask, geometry, track
+
+
+def mask_cache_key(video_path=VIDEO_PATH, model_path=MODEL_PATH, weights_path=WEIGHTS_PATH):
+    """Key of the mask for these inputs and detection settings; any change means a new detection."""
+    mode_settings = (MASK_TRACK_SAMPLES, MASK_OUTLIER_K) if MASK_MODE == "track" else (FRAME_SKIP, MASK_MAX_SAMPLES)
+    return cache_key(
+        "mask-v2",
+        file_digest(video_path),
+        file_digest(model_path),
+        file_digest(weights_path),
+        MASK_MODE,
+        TARGET_WIDTH,
+        CONFIDENCE_THRESHOLD,
+        HEAD_MARGIN,
+        *mode_settings,
+    )
+
+
+def load_mask_geometry(geometry_path=MASK_GEOMETRY_PATH):
+    """MASK_* values from the sidecar, falling back to the .env values older runs wrote."""
     try:
-        # Paths to the model files
-        model_path = r"models\deploy.prototxt"
-        weights_path = r"models\res10_300x300_ssd_iter_140000.caffemodel"
+        with open(geometry_path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {name: os.getenv(name) for name in ("MASK_WIDTH", "MASK_HEIGHT", "MASK_LEFT", "MASK_BOTTOM")}
 
-        # Verify that the model files exist
-        if not os.path.exists(model_path) or not os.path.exists(weights_path):
-            logging.error("Model files not found. Please check the paths.")
-            exit()
 
-        # Path to the video file
-        video_path = r"base.mp4"  # Replace with your file path or use 0 for webcam
+def _write_json(path, data):
+    with atomic_output(path) as tmp_path:
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
 
 
-        # Load the pre-trained DNN model for face detection
-        net = cv2.dnn.readNetFromCaffe(model_path, weights_path)
-
-        # Open the video file
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            logging.error(f"Could not open video at {video_path}.")
-            exit()
-
-        # Video scaling parameters
-        target_width = 700
-
-        frame_skip = 10  # Skip every 10 frames for optimization
-        frame_count = 0
-        mask_saved = False
+def _read_json(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def ensure_mask(video_path=VIDEO_PATH, mask_path=MASK_IMAGE_ENCODED_PATH, geometry_path=MASK_GEOMETRY_PATH, track_path=MASK_TRACK_PATH):
+    """
+    Returns the mask geometry, making sure mask_path and its geometry sidecar
+    match the current base video, model and detection settings. The mask is a
+    cached artifact: face detection only runs when one of those inputs changed,
+    otherwise the cached mask is put in place (or left alone when it already is).
+    With MASK_MODE=track the face track is cached alongside and copied to
+    track_path.
+    """
+    key = mask_cache_key(video_path)
+    cached_mask = ASSET_CACHE_DIR / f"mask_{key}.png"
+    cached_geometry = ASSET_CACHE_DIR / f"mask_{key}.json"
+    cached_track = ASSET_CACHE_DIR / f"mask_{key}.track.json"
+    if cached_mask.exists() and cached_geometry.exists() and (MASK_MODE != "track" or cached_track.exists()):
+        logging.info(f"Using cached mask: {cached_mask}")
+    else:
+        logging.info(f"Mask generation started ({MASK_MODE} mode)")
+        mask, geometry, track = detect_mask(video_path)
+        ASSET_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with atomic_output(cached_mask) as tmp_path:
+            if not cv2.imwrite(str(tmp_path), mask):
+                raise RuntimeError(f"Could not write {tmp_path}")
+        _write_json(cached_geometry, geometry)
+        if track is not None:
+            _write_json(cached_track, track)
+        # Drop masks of older inputs
+        for old_mask in ASSET_CACHE_DIR.glob("mask_*.*"):
+            if old_mask not in (cached_mask, cached_geometry, cached_track):
+                old_mask.unlink(missing_ok=True)
+
+    # Only touch mask.png when it differs, so its digest (and the speaker asset keyed by it) stays valid
+    if not Path(mask_path).exists() or file_digest(mask_path) != file_digest(cached_mask):
+        with atomic_output(mask_path) as tmp_path:
+            shutil.copyfile(cached_mask, tmp_path)
+        logging.info(f"Mask saved to: {mask_path}")
+    geometry = _read_json(cached_geometry)
+    if load_mask_geometry(geometry_path) != geometry:
+        _write_json(geometry_path, geometry)
+    if MASK_MODE == "track":
+        track = _read_json(cached_track)
+        if _read_json(track_path) != track:
+            _write_json(track_path, track)
+        logging.info(f"Face track with {len(track['points'])} points: {track_path}")
+    return geometry
 
-        # Process video
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        logging.info(f"Total frames in video: {total_frames}")
-
-        while cap.isOpened() and not mask_saved:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            frame_count += 1
-
-            # Skip frames for optimization
-            if frame_count % frame_skip != 0:
-                continue
-
-            # Resize frame to scale width to 500 pixels while maintaining aspect ratio
-            h, w = frame.shape[:2]
-            scale_factor = target_width / w
-            new_w = target_width
-            new_h = int(h * scale_factor)
-            frame = cv2.resize(frame, (new_w, new_h))
-
-            # Update dimensions after resizing
-            h, w = frame.shape[:2]
-
-            # Prepare the blob for DNN
-            blob = cv2.dnn.blobFromImage(frame, 1.0, (300, 300), (104.0, 177.0, 123.0))
-            net.setInput(blob)
-            detections = net.forward()
-
-            for i in range(detections.shape[2]):
-                confidence = detections[0, 0, i, 2]
-                if confidence > 0.5:  # Confidence threshold
-                    box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-                    x, y, x2, y2 = box.astype("int")
-                    face_width = x2 - x
-                    face_height = y2 - y
-
-                    # Calculate circle parameters
-                    # distance_from_head_above = max(0, y - (100*new_h)//720)
-                    value=130 #generally we will use 100 but for kevin video we are using 130
-                    while value>=0:
-                        distance_from_head_above = max(0, y - (value * new_h) // 720)
-                        if distance_from_head_above != 0:
-                            break
-                        value -= 10
-            
-                    circle_center_y = (distance_from_head_above + h) // 2
-                    circle_center_x = x + face_width // 2
-
-                    radius = max(
-                        (h - distance_from_head_above) // 2,
-                        face_width // 2,
-                        face_height // 2
-                    )
-
-                    radius = min(
-                        radius,
-                        circle_center_y - distance_from_head_above,
-                        h - circle_center_y,
-                        circle_center_x,
-                        w - circle_center_x
-                    )
-
-                    circle_center = (circle_center_x, circle_center_y)
-
-                    # Calculate distances from boundaries
-                    distance_left_to_circle = circle_center_x - radius
-                    distance_bottom_to_circle = h - (circle_center_y + radius)
-
-                    # Print the distances
-                    print(f"Distance from left boundary to circle boundary: {distance_left_to_circle}")
-                    print(f"Distance from bottom boundary to circle boundary: {distance_bottom_to_circle}")
-                    print(f"Frame dimensions: width={w}, height={h}")
-                    # Usage:
-                    left=distance_left_to_circle
-                    if left>10:
-                        left=(left-10)
-                        update_env_value("MASK_LEFT", f"-{str(left)}")
-                    elif left<10:
-                        left=(10-left)
-                        update_env_value("MASK_LEFT", f"+{str(left)}")
-                    else:
-                        update_env_value("MASK_LEFT", "10")  
-                    bottom=distance_bottom_to_circle
-                    if bottom>10:
-                        bottom=(bottom-10)
-                        update_env_value("MASK_BOTTOM", f"-{str(bottom)}")
-                    if bottom<10:
-                        bottom=10-bottom
-                        update_env_value("MASK_BOTTOM", f"-{str(bottom)}")
-                    else:
-                        update_env_value("MASK_BOTTOM", "10")
-                        
-                    update_env_value("MASK_HEIGHT", str(h))
-                    update_env_value("MASK_WIDTH", str(w))   
-                    
-                    
-                    # Create a binary mask
-                    mask = np.zeros((h, w), dtype=np.uint8)
-                    cv2.circle(mask, circle_center, radius, 255, -1)
-                    mask_path = os.path.join("mask.png")
-                    cv2.imwrite(mask_path, mask)
-
-                    
-                    
-                    logging.info(f"Circle center: {circle_center}, radius: {radius}")
-                    logging.info(f"Mask saved to: {mask_path}")
-                    
-
-                    mask_saved = True
-                    break
 
-        cap.release()
-        if not mask_saved:
-            raise RuntimeError("Failed to generate mask.png: No face detected in the video.")
+def check_or_generate_mask():
+    try:
+        return ensure_mask()
     except Exception as e:
         logging.error(f"Error while generating mask.png: {e}")
         raise
 
-    
-        
+
 def main():
     logging.info("Starting mask generation...")
     check_or_generate_mask()
@@ -0,0 +1,207 @@
+import asyncio
+import collections
+import json
+import logging
+import subprocess
+import threading
+from pathlib import Path
+from asset_cache import ASSET_CACHE_DIR, atomic_output, cache_key, file_digest
+from encoder_profiles import profile_for
+from ffmpeg_runner import run_ffmpeg
+from render_graph import audio_encode_args
+
+PROBE_CACHE_PATH = ASSET_CACHE_DIR / "probe_cache.json"
+
+# Stream fields that must match for a '-f concat -c copy' to be safe
+VIDEO_FIELDS = ("codec_name", "profile", "width", "height", "pix_fmt", "sample_aspect_ratio", "time_base", "r_frame_rate")
+AUDIO_FIELDS = ("codec_name", "sample_rate", "channels", "channel_layout")
+
+_probe_cache = None
+_probe_cache_lock = threading.Lock()  # Probes run in to_thread workers; one read-modify-write at a time
+_canonical_locks = collections.defaultdict(asyncio.Lock)  # Cache key -> lock, one build per canonical asset
+
+
+class ConcatCompatibilityError(RuntimeError):
+    pass
+
+
+def _load_probe_cache():
+    global _probe_cache
+    with _probe_cache_lock:
+        if _probe_cache is None:
+            try:
+                with open(PROBE_CACHE_PATH, "r") as f:
+                    _probe_cache = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                _probe_cache = {}
+        return _probe_cache
+
+
+def _store_probe_result(key, value):
+    probe_cache = _load_probe_cache()
+    with _probe_cache_lock:
+        probe_cache[key] = value
+        ASSET_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with atomic_output(PROBE_CACHE_PATH) as tmp_path:
+            with open(tmp_path, "w") as f:
+                json.dump(probe_cache, f, indent=2)
+
+
+def _run_ffprobe(path):
+    command = [
+        "ffprobe",
+        "-v", "error",
+        "-show_streams",
+        "-of", "json",
+        str(path),
+    ]
+    result = subprocess.run(command, check=True, capture_output=True, text=True)
+    return json.loads(result.stdout)
+
+
+def _signature_from_probe(probe):
+    signature = {"video": None, "audio": None}
+    for stream in probe.get("streams", []):
+        kind = stream.get("codec_type")
+        if kind == "video" and signature["video"] is None:
+            video = {field: stream.get(field) for field in VIDEO_FIELDS}
+            if video["sample_aspect_ratio"] in (None, "0:1", "N/A"):
+                video["sample_aspect_ratio"] = "1:1"  # Unset SAR means square pixels
+            signature["video"] = video
+        elif kind == "audio" and signature["audio"] is None:
+            signature["audio"] = {field: stream.get(field) for field in AUDIO_FIELDS}
+    return signature
+
+
+def stream_signature(path, cache=True):
+    """
+    Returns the concat-relevant parameters of the first video and audio stream.
+    With cache=True (static assets) the result is stored by content hash, so
+    each asset is probed once; per-row outputs should pass cache=False.
+    """
+    if not cache:
+        return _signature_from_probe(_run_ffprobe(path))
+
+    probe_cache = _load_probe_cache()
+    digest = file_digest(path)
+    if digest not in probe_cache:
+        _store_probe_result(digest, _signature_from_probe(_run_ffprobe(path)))
+    return probe_cache[digest]
+
+
+def video_duration(path):
+    """Duration in seconds of a static file's first video stream, probed once per content hash."""
+    probe_cache = _load_probe_cache()
+    key = f"duration:{file_digest(path)}"
+    if key not in probe_cache:
+        streams = _run_ffprobe(path).get("streams", [])
+        video = next((stream for stream in streams if stream.get("codec_type") == "video"), {})
+        try:
+            duration = float(video.get("duration"))
+        except (TypeError, ValueError):
+            return None  # Not stored, e.g. no duration in the stream header
+        _store_probe_result(key, duration)
+    return probe_cache[key]
+
+
+def signature_mismatches(reference, other):
+    """Returns human-readable differences between two stream signatures."""
+    mismatches = []
+    for kind in ("video", "audio"):
+        ref_stream, other_stream = reference[kind], other[kind]
+        if (ref_stream is None) != (other_stream is None):
+            mismatches.append(f"{kind} stream present in only one file")
+            continue
+        if ref_stream is None:
+            continue
+        for field, ref_value in ref_stream.items():
+            if other_stream.get(field) != ref_value:
+                mismatches.append(f"{kind} {field}: {other_stream.get(field)} != {ref_value}")
+    return mismatches
+
+
+async def ensure_canonical_asset(path, reference, profile=None):
+    """
+    Returns a copy of a static asset re-encoded to match `reference`, built once
+    and cached by the asset's content hash, the target signature and the
+    encoder profile it is encoded with (default: the run's ENCODER_PROFILE,
+    the same one the per-row segments use).
+    """
+    video, audio = reference["video"], reference["audio"]
+    if video is None or video["codec_name"] != "h264":
+        raise ConcatCompatibilityError(f"Cannot normalize {path} to a {video and video['codec_name']} reference")
+
+    profile = profile or profile_for()
+    key = cache_key(
+        "canonical-asset-v2",
+        await asyncio.to_thread(file_digest, path),
+        json.dumps(reference, sort_keys=True),
+        profile.name,
+        " ".join(profile.video_args),
+        " ".join(audio_encode_args(profile)),
+    )
+    canonical_path = ASSET_CACHE_DIR / f"{Path(path).stem}_{key}.mp4"
+    if canonical_path.exists():
+        return canonical_path
+    # Every row of a batch gets here at once on a cold cache; only the first builds
+    async with _canonical_locks[key]:
+        if canonical_path.exists():
+            return canonical_path
+        return await _build_canonical_asset(path, reference, canonical_path, profile)
+
+
+async def _build_canonical_asset(path, reference, canonical_path, profile):
+    video, audio = reference["video"], reference["audio"]
+    ASSET_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    logging.info(f"Normalizing {path} for copy-concat: {canonical_path}")
+    sar = video["sample_aspect_ratio"].replace(":", "/")
+    timescale = video["time_base"].split("/")[1]
+    command = [
+        "ffmpeg",
+        "-y",
+        "-i", str(path),
+        "-vf", f"scale={video['width']}:{video['height']},setsar={sar},fps={video['r_frame_rate']},format={video['pix_fmt']}",
+        *profile.video_args,  # Codec, speed and quality of the run's profile
+        "-profile:v", (video["profile"] or "high").lower().replace(" ", ""),
+        "-video_track_timescale", timescale,  # Same time base as the per-row segments
+    ]
+    if audio is not None:
+        command += [
+            *audio_encode_args(profile),
+            "-ar", str(audio["sample_rate"]),  # The reference's rate and channels win over the profile's
+            "-ac", str(audio["channels"]),
+        ]
+    command += ["-threads", "0"]  # Scheduler slot's thread budget, see apply_thread_budget
+    with atomic_output(canonical_path) as tmp_path:
+        await run_ffmpeg([*command, str(tmp_path)], stage="canonical_asset")
+    return canonical_path
+
+
+async def prepare_concat_inputs(entries, profile=None):
+    """
+    entries is a list of (path, is_static). The first per-row (non-static)
+    entry is the reference. Per-row files that do not match it raise
+    ConcatCompatibilityError before anything is concatenated; static files
+    that do not match are replaced by their cached canonical copy, encoded
+    with `profile` (see ensure_canonical_asset).
+    Returns the list of paths to concatenate.
+    """
+    reference_path = next((path for path, is_static in entries if not is_static), entries[0][0])
+    reference = await asyncio.to_thread(stream_signature, reference_path, False)
+
+    prepared = []
+    for path, is_static in entries:
+        if path == reference_path:
+            prepared.append(path)
+            continue
+        mismatches = signature_mismatches(reference, await asyncio.to_thread(stream_signature, path, is_static))
+        if not mismatches:
+            prepared.append(path)
+        elif is_static:
+            logging.warning(f"{path} does not match {reference_path} ({'; '.join(mismatches)}), using normalized copy")
+            prepared.append(await ensure_canonical_asset(path, reference, profile))
+        else:
+            raise ConcatCompatibilityError(
+                f"Refusing copy-concat: {path} does not match {reference_path}: {'; '.join(mismatches)}"
+            )
+    return prepared
@@ -98,22 +98,40 @@
 #ffmpeg -i "Generic Video.mp4" -vf "scale=1920:1080, hqdn3d=1.5:1.5:6:6" -c:v libx264 -preset slow -crf 18 -c:a aac -b:a 192k output1.mp4
 #ffmpeg -i "Explanation Video (Miro).mp4" -vf "scale=1920:1080, hqdn3d=1.5:1.5:6:6" -c:v libx264 -preset slow -crf 18 -c:a aac -b:a 192k output2.mp4 
 
+import asyncio
 import subprocess
 from pathlib import Path
+from media_probe import prepare_concat_inputs
 
 concat_list = Path("concat_list.txt")
+checked_list = Path("concat_list_checked.txt")
 output_path = Path("merged_output.mp4")
 
+# The first file is the reference; later files are static assets and get normalized once if they don't match
+entries = []
+with open(concat_list, "r") as f:
+    for line in f:
+        line = line.strip()
+        if line.startswith("file "):
+            entries.append(line[len("file "):].strip().strip("'"))
+concat_inputs = asyncio.run(prepare_concat_inputs([(entry, idx > 0) for idx, entry in enumerate(entries)]))
+with open(checked_list, "w") as f:
+    for concat_input in concat_inputs:
+        f.write(f"file '{concat_input}'\n")
+
 merge_command = [
     "ffmpeg",
     "-y",
     "-f", "concat",
     "-safe", "0",
-    "-i", str(concat_list),
+    "-i", str(checked_list),
     "-c", "copy",
     str(output_path)
 ]
 
-subprocess.run(merge_command, check=True)
+try:
+    subprocess.run(merge_command, check=True)
+finally:
+    checked_list.unlink(missing_ok=True)
 
 
@@ -543,8 +543,21 @@ from pathlib import Path
 import cv2
 from dotenv import load_dotenv
 from PIL import Image
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+from background import still_hold_input, still_hold_filter, still_hold_scale
+from frame_sink import pipe_input_args, peek_frame_size, stream_frames_to_ffmpeg
+from scroll_engine import plan_scroll, plan_scroll_for_image, scroll_offsets, scroll_filter, scroll_input
+from screenshot_loader import ScreenshotStrips
+from ffmpeg_runner import run_ffmpeg
+from encode_metrics import metrics_row
+from asset_cache import ensure_audio_track
+from render_graph import audio_encode_args
+from encoder_profiles import profile_for
+from generate_mask import ensure_mask
+from sheet_writeback import SheetWriteBuffer
+from sheets_client import backoff_delay
+from sheet_backend import open_worksheet
+from sheet_mirror import SHEET_MIRROR, SheetMirror
+from screenshot_watcher import ScreenshotWatcher
 
 # Constants
 FPS = 26
@@ -557,15 +570,11 @@ BATCH_SIZE = 1  # Read/process 4 rows at a time (customize as needed)
 START_DATA_ROW = 2  # Data starts at row 2 if row 1 is your header
 POLL_INTERVAL = 30  # Seconds to wait before rechecking 'Screenshot' cell
 MAX_POLL_RETRIES = 100  # Maximum number of retries to wait for 'Screenshot'
+SCREENSHOT_WAIT_SECONDS = POLL_INTERVAL * MAX_POLL_RETRIES  # How long a row waits for its 'Screenshot' cell
+screenshot_watcher = None  # ScreenshotWatcher for the 'Screenshot' column, set in main()
+HOLD_SECONDS = 3  # Length of the static website hold at the start of the video
 maxretries=500
-try:
-    result = subprocess.run(["python", "generate_mask.py"], capture_output=True, text=True, check=True)
-    print("generate_mask.py output:", result.stdout)
-    print("generate_mask.py error (if any):", result.stderr)
-except subprocess.CalledProcessError as e:
-    print(f"generate_mask.py failed with return code {e.returncode}")
-    print(f"Error output: {e.stderr}")
-    raise
+mask_geometry = ensure_mask()  # Cached by content: face detection only reruns when base.mp4 or the model changes
 
 
 # Load Environment Variables
@@ -574,10 +583,15 @@ SHEET_URL = os.getenv("SHEET_URL")      # e.g., "https://docs.google.com/spreads
 TAB_NAME = os.getenv("TAB_NAME")        # e.g., "Sheet1"
 CREDENTIALS_PATH = os.getenv("GOOGLE_CREDENTIALS")  # e.g., "service_account.json"
 
-mask_height = os.getenv("MASK_HEIGHT")  # returns a string, e.g. "700"
-mask_width = os.getenv("MASK_WIDTH")    # returns a string, e.g. "393"
-mask_left = os.getenv("MASK_LEFT")      # returns a string, e.g. "10"
-mask_bottom = os.getenv("MASK_BOTTOM")  # returns a string, e.g. "10"
+mask_height = mask_geometry["MASK_HEIGHT"]  # a string, e.g. "700"
+mask_width = mask_geometry["MASK_WIDTH"]    # a string, e.g. "393"
+mask_left = mask_geometry["MASK_LEFT"]      # a string, e.g. "10"
+mask_bottom = mask_geometry["MASK_BOTTOM"]  # a string, e.g. "10"
+BACKGROUND_MODE = os.getenv("BACKGROUND_MODE", "still")  # still (looped screenshot) | pipe (raw frames over stdin) | frames (PNG directory)
+SCROLL_BACKGROUND = os.getenv("SCROLL_BACKGROUND", "false").lower() == "true"  # hold -> scroll -> hold over the full-page screenshot
+STATIC_AUDIO_CACHE = os.getenv("STATIC_AUDIO_CACHE", "true").lower() == "true"  # Encode the base audio once, copy it per row
+base_audio = None  # Pre-encoded base.mp4 audio, set in main()
+ENCODER = profile_for()  # ENCODER_PROFILE: archive | delivery | draft | qsv | amf
 
 print("mask_height:", mask_height)
 print("mask_width:", mask_width)
@@ -600,14 +614,11 @@ for folder in [OUTPUT_DIR, FRAMES_DIR]:
 
 def get_google_sheet():
     """
-    Returns a gspread worksheet object for the specified TAB_NAME in the .env config.
+    Returns the worksheet for the specified TAB_NAME in the .env config
+    (or the local stand-in when SHEET_BACKEND=local), wrapped in the
+    rate-limited, retrying SheetsClient.
     """
-    scope = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_PATH, scope)
-    client = gspread.authorize(creds)
-    spreadsheet = client.open_by_url(SHEET_URL)
-    worksheet = spreadsheet.worksheet(TAB_NAME)
-    return worksheet
+    return open_worksheet(CREDENTIALS_PATH, SHEET_URL, TAB_NAME)
 
 def ensure_directory_exists(path):
     path.mkdir(parents=True, exist_ok=True)
@@ -619,62 +630,109 @@ async def write_frame_async(frame, output_path):
     loop = asyncio.get_event_loop()
     await loop.run_in_executor(None, lambda: cv2.imwrite(str(output_path), frame))
 
-async def write_frames_parallel(frames, output_dir, base_name):
+async def write_frames_parallel(frames, output_dir, base_name, max_pending=16):
     tasks = []
+    written = 0
     for idx, frame in enumerate(frames):
         output_path = output_dir / f"{base_name}_{idx:04d}.png"
         tasks.append(write_frame_async(frame, output_path))
+        written += 1
+        if len(tasks) >= max_pending:
+            # Keep only a few frames in flight so memory stays bounded
+            await asyncio.gather(*tasks)
+            tasks = []
     await asyncio.gather(*tasks)
+    return written
 
-async def generate_frames(image_path, output_dir, base_name):
-    logging.info(f"Generating frames for image: {image_path}")
-    img = cv2.imread(str(image_path))
-    if img is None:
-        raise FileNotFoundError(f"Image not found at {image_path}")
+def load_screenshot(image_path):
+    """
+    Returns lazy strip access to the screenshot. Decoding is capped at
+    STRIP_MEMORY_MB, so very tall pages are decoded at reduced resolution.
+    """
+    img = ScreenshotStrips(image_path)
+    img.proxy()  # Decode now so a bad file fails before ffmpeg starts
+    return img
 
+def iter_frames(img):
+    """
+    Yields the background frames for a screenshot one at a time.
+    img is a ScreenshotStrips; frames are produced lazily from its row windows.
+    """
     img_height, img_width, _ = img.shape
-    frames = []
-    hold_duration_frames = FPS * 3
+    hold_duration_frames = FPS * HOLD_SECONDS
     scroll_base_speed = SCROLL_STEP
     scroll_duration_frames = FPS
     hold_after_scroll_frames = FPS
 
-    top_frame = img[:1080, :, :]
-    frames.extend([top_frame] * hold_duration_frames)
+    if SCROLL_BACKGROUND:
+        plan = plan_scroll(img_height, FPS, hold_duration_frames, scroll_base_speed, scroll_duration_frames, hold_after_scroll_frames)
+        offsets = scroll_offsets(plan)
+    else:
+        offsets = np.zeros(hold_duration_frames, dtype=np.int64)  # Top of the page only
+
+    yield from img.iter_windows(offsets)
+
+async def generate_frames(image_path, output_dir, base_name):
+    logging.info(f"Generating frames for image: {image_path}")
+    img = load_screenshot(image_path)
 
-  
     ensure_directory_exists(output_dir)
-    await write_frames_parallel(frames, output_dir, base_name)
-    logging.info(f"Generated and wrote {len(frames)} frames for image: {image_path}")
-    return len(frames)
+    frame_count = await write_frames_parallel(iter_frames(img), output_dir, base_name)
+    logging.info(f"Generated and wrote {frame_count} frames for image: {image_path}")
+    return frame_count
 
   
         
-async def create_and_overlay_video(frames_dir, output_path,website_url):
-    temp_frames_path = str(frames_dir / "frame_%04d.png")
+async def create_and_overlay_video(frames_dir, output_path,website_url,still_image_path=None,frames=None):
+    if still_image_path is not None and SCROLL_BACKGROUND:
+        # Scroll rendered by ffmpeg as a crop expression over the decoded screenshot
+        plan, scale = plan_scroll_for_image(still_image_path, FPS, FPS * HOLD_SECONDS, SCROLL_STEP, FPS, FPS)
+        background_input = scroll_input(still_image_path, FPS, scale)
+        background_filter = scroll_filter(plan, FPS, scale)
+    elif still_image_path is not None:
+        # Static hold: the screenshot goes to ffmpeg once as a looped still, at full resolution if it fits the budget
+        scale = still_hold_scale(still_image_path)
+        background_input = still_hold_input(still_image_path, HOLD_SECONDS, FPS, scale)
+        background_filter = still_hold_filter(HOLD_SECONDS, FPS, scale)
+    elif frames is not None:
+        # Raw frames streamed over stdin, nothing touches disk
+        frame_width, frame_height, frames = peek_frame_size(frames)
+        background_input = pipe_input_args(frame_width, frame_height, FPS)
+        background_filter = "scale=1920:1080,format=yuv420p"
+    else:
+        temp_frames_path = str(frames_dir / "frame_%04d.png")
+        background_input = ["-r", str(FPS), "-i", temp_frames_path]  # Input frames, at the rate they were generated for
+        background_filter = "scale=1920:1080,format=yuv420p"
+    if base_audio is not None:
+        audio_inputs = ["-i", str(base_audio)]  # Base audio, encoded once in main()
+        audio_args = [
+            "-map", "3:a",
+            "-c:a", "copy",  # No per-row audio encode
+        ]
+    else:
+        audio_inputs = []
+        audio_args = [
+            "-map", "1:a",  # Map the audio from the base video
+            *audio_encode_args(ENCODER),
+        ]
     command1 = [
     "ffmpeg",
     "-y",  # Overwrite output files without asking
-    "-r", "30",  # Input frame rate
-    "-i", temp_frames_path,  # Input frames
+    *background_input,  # Website background (looped still or frame sequence)
     "-i", BASE_VIDEO_ENCODED_PATH,  # Base video
     "-i", str(MASK_IMAGE_ENCODED_PATH),  # Mask image
+    *audio_inputs,
     "-filter_complex",
     (
-        f"[0:v] scale=1920:1080,format=yuv420p [bg];"
+        f"[0:v] {background_filter} [bg];"
         f"[1:v] scale={str(mask_width)}:{str(mask_height)},format=rgba [scaled];"  # Scale cropped video to square
         f"[2:v] scale={str(mask_width)}:{str(mask_height)},format=gray [scaled_mask];"  # Scale mask to square
         f"[scaled][scaled_mask] alphamerge [circle];"
         f"[bg][circle] overlay={str(mask_left)}:main_h-overlay_h-{str(mask_bottom)} [out]"
     ),
     "-map", "[out]",  # Map the output video
-    "-map", "1:a",  # Map the audio from the base video
-    "-c:v", "libx264",  # Use the H.264 codec for video encoding
-    "-preset", "slow",  # High-quality compression preset
-    "-crf", "16",  # High video quality (lower CRF = better quality)
-    "-c:a", "aac",  # Use AAC codec for audio
-    "-b:a", "320k",  # High-quality audio bitrate
-    "-ar", "48000",  # Audio sample rate
+    *audio_args,
+    *ENCODER.video_args,  # Codec, speed and quality of the selected profile
     "-threads", "0",  # Use all available CPU threads
     "-shortest",  # Stop when the shortest input stream ends
     str(output_path),  # Output file path
@@ -736,7 +794,10 @@ async def create_and_overlay_video(frames_dir, output_path,website_url):
 
 
     try:
-        await asyncio.to_thread(subprocess.run, command1, check=True)
+        if frames is not None:
+            await stream_frames_to_ffmpeg(command1, frames, stage="render")
+        else:
+            await run_ffmpeg(command1, stage="render")
         logging.info(f"Video created: {output_path}")
        
         
@@ -756,21 +817,15 @@ async def create_and_overlay_video(frames_dir, output_path,website_url):
         
 async def update_google_sheet_cell(worksheet, cell, value):
     """
-    Updates a single cell in the sheet with retries on network errors.
+    Updates a single cell in the sheet. Rate limiting and retries on quota
+    and network errors happen in SheetsClient.
     """
-    for attempt in range(maxretries):
-        try:
-            worksheet.update_acell(cell, value)
-            logging.info(f"Updated {cell} with value: {value}")
-            return
-        except Exception as e:
-            if attempt < maxretries-1:
-                wait_time = 30
-                logging.warning(f"Failed to update {cell}: {e}. Retrying in {wait_time} seconds... (Attempt {attempt + 1})")
-                await asyncio.sleep(wait_time)
-            else:
-                logging.error(f"Max retries reached. Unable to update {cell}. Error: {e}")
-                raise
+    try:
+        await asyncio.to_thread(worksheet.update_acell, cell, value)
+        logging.info(f"Updated {cell} with value: {value}")
+    except Exception as e:
+        logging.error(f"Unable to update {cell}. Error: {e}")
+        raise
        
 
 
@@ -801,23 +856,15 @@ async def process_row(global_row_idx, row_data, headers, worksheet):
             screenshot_path = row_data[screenshot_index].strip() if screenshot_index < len(row_data) else ""
 
             row_number_in_sheet = global_row_idx + 2  # +2 because data starts at row 2 in the sheet
-
-            # --- Polling logic: wait until 'Screenshot' cell is non-empty ---
-            poll_retries = 0
-            while not screenshot_path:
-                if poll_retries >= MAX_POLL_RETRIES:
-                    logging.error(f"Row {row_number_in_sheet}: 'Screenshot' remains empty after {MAX_POLL_RETRIES} retries.")
+            metrics_row.set(row_number_in_sheet)  # Tags this row's ffmpeg metrics
+
+            # --- Wait until 'Screenshot' cell is non-empty (one shared poller for all waiting rows) ---
+            if not screenshot_path:
+                logging.info(f"Row {row_number_in_sheet}: 'Screenshot' is empty. Waiting up to {SCREENSHOT_WAIT_SECONDS}s for it to be populated...")
+                screenshot_path = await screenshot_watcher.wait_for(row_number_in_sheet, SCREENSHOT_WAIT_SECONDS)
+                if not screenshot_path:
+                    logging.error(f"Row {row_number_in_sheet}: 'Screenshot' remains empty after {SCREENSHOT_WAIT_SECONDS}s.")
                     return (row_number_in_sheet, "Error")
-                logging.info(f"Row {row_number_in_sheet}: 'Screenshot' is empty. Waiting {POLL_INTERVAL}s for it to be populated... (Attempt {poll_retries + 1}/{MAX_POLL_RETRIES})")
-                await asyncio.sleep(POLL_INTERVAL)  # Wait before retrying
-                # Re-read the row from Google Sheets
-                new_row_data = worksheet.row_values(row_number_in_sheet)
-                if len(new_row_data) > screenshot_index:
-                    screenshot_path = new_row_data[screenshot_index].strip()
-                else:
-                    screenshot_path = ""
-
-                poll_retries += 1
 
             # Now screenshot_path should be populated
             video_path = OUTPUT_DIR / f"{sanitize_filename(website_url)}.mp4"
@@ -829,15 +876,25 @@ async def process_row(global_row_idx, row_data, headers, worksheet):
                 return (row_number_in_sheet, "Error")
 
             try:
-                ensure_directory_exists(frames_subdir)
+                still_image_path = None
+                frames = None
+                if BACKGROUND_MODE == "still":
+                    # No frames to write, ffmpeg reads the screenshot directly
+                    still_image_path = screenshot_path
+                elif BACKGROUND_MODE == "pipe":
+                    # Frames go from memory straight to ffmpeg's stdin
+                    img = await asyncio.to_thread(load_screenshot, screenshot_path)
+                    frames = iter_frames(img)
+                else:
+                    ensure_directory_exists(frames_subdir)
 
-                # Generate frames
-                logging.info(f"Row {row_number_in_sheet}: Generating frames for {website_url}")
-                await generate_frames(screenshot_path, frames_subdir, "frame")
+                    # Generate frames
+                    logging.info(f"Row {row_number_in_sheet}: Generating frames for {website_url}")
+                    await generate_frames(screenshot_path, frames_subdir, "frame")
 
                 # Create the overlay video
                 logging.info(f"Row {row_number_in_sheet}: Creating video for {website_url}")
-                await create_and_overlay_video(frames_subdir, video_path, website_url)
+                await create_and_overlay_video(frames_subdir, video_path, website_url, still_image_path, frames)
 
                 logging.info(f"Row {row_number_in_sheet}: Video created successfully for {website_url}")
                 return (row_number_in_sheet, str(video_path))
@@ -859,9 +916,9 @@ async def process_row(global_row_idx, row_data, headers, worksheet):
                             logging.error(f"Row {row_number_in_sheet}: Failed to delete screenshot '{screenshot_path}': {e}")
         except Exception as e:
             if attempt < maxretries-1:
-                wait_time = 30
-                logging.warning(f"Failed to connect to Google Sheets. Retrying in {wait_time} seconds... (Attempt {attempt + 1})")
-                asyncio.sleep(wait_time)
+                wait_time = backoff_delay(attempt)  # Jittered, so rows that failed together do not retry together
+                logging.warning(f"Row attempt failed: {e}. Retrying in {wait_time:.1f} seconds... (Attempt {attempt + 1})")
+                await asyncio.sleep(wait_time)
             else:
                 logging.error("Max retries reached. Unable to connect to Google Sheets.")
                 raise           
@@ -984,18 +1041,37 @@ def binary_search_first_empty(all_values, start, end, col_index):
 
 async def main():
     # check_or_generate_mask()
+    global base_audio
+    if STATIC_AUDIO_CACHE:
+        try:
+            base_audio = await ensure_audio_track(BASE_VIDEO_ENCODED_PATH, audio_encode_args(ENCODER))
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+            logging.error(f"Could not pre-encode base audio, encoding it per row instead: {e}")
     worksheet = get_google_sheet()
     # Ensure 'Personal Video' column exists
     headers, personal_video_index = ensure_personal_video_column(worksheet)
+    global screenshot_watcher
+    screenshot_watcher = ScreenshotWatcher(worksheet, column_index_to_letter(headers.index("Screenshot")))
 
-    # Determine total number of data rows (excluding header)
-    all_values = worksheet.get_all_values()
-    total_rows = len(all_values) - 1  # excluding header row
-    logging.info(f"Total data rows found: {total_rows}")
-    
-     # Update START_DATA_ROW to the first row with an empty 'Personal Video' column
     global START_DATA_ROW
-    START_DATA_ROW = binary_search_first_empty(all_values, START_DATA_ROW, total_rows, personal_video_index)
+    mirror = None
+    if SHEET_MIRROR:
+        # Local copy of the sheet: one read for every row, only changed rows are written
+        mirror = SheetMirror(worksheet, "Personal Video")
+        mirror.sync(headers)
+        total_rows = mirror.last_row() - 1  # excluding header row
+        logging.info(f"Total data rows found: {total_rows}")
+        first_pending = mirror.first_pending_row()
+        # Same 0-based index into all rows (header included) that the binary search returns
+        START_DATA_ROW = None if first_pending is None else first_pending - 1
+    else:
+        # Determine total number of data rows (excluding header)
+        all_values = worksheet.get_all_values()
+        total_rows = len(all_values) - 1  # excluding header row
+        logging.info(f"Total data rows found: {total_rows}")
+
+        # Update START_DATA_ROW to the first row with an empty 'Personal Video' column
+        START_DATA_ROW = binary_search_first_empty(all_values, START_DATA_ROW, total_rows, personal_video_index)
 
     if START_DATA_ROW is None:
         logging.info("No unprocessed rows found. All rows are already processed.")
@@ -1003,77 +1079,89 @@ async def main():
         logging.info(f"Updated START_DATA_ROW to: {START_DATA_ROW + 1}")  # Adjust for 1-based indexing
 
     start_row = START_DATA_ROW  # e.g., row 2
-    while True:
-        end_row = start_row + BATCH_SIZE - 1
-        range_str = f"A{start_row}:Z{end_row}"  # Adjust columns to match your sheet
-        logging.info(f"Reading batch rows {start_row} to {end_row}")
-        batch_data = worksheet.get_values(range_str)
-        if not batch_data:
-            logging.info("No more data to process. Exiting.")
-            break
-
-        tasks = []
-        row_number_mapping = []  # To keep track of row numbers for tasks
-        for row_idx_in_batch, row_data in enumerate(batch_data):
-            global_row_idx = (start_row - 2) + row_idx_in_batch  # 0-based index for entire data
-            row_number_in_sheet = global_row_idx + 2  # +2 because data starts at row 2
-
-            if not any(cell.strip() for cell in row_data):
-                logging.info(f"Skipping empty row at {row_number_in_sheet}")
-                continue
-
-            # Check if 'Personal Video' is already set
-            personal_video_value = ""
-            if personal_video_index < len(row_data):
-                personal_video_value = row_data[personal_video_index].strip()
-
-            if personal_video_value:
-                #logging.info(f"Skipping row {row_number_in_sheet}, 'Personal Video' already set.")
-                continue
-
-            # Append the task to process this row
-            tasks.append(process_row(global_row_idx, row_data, headers, worksheet))
-
-        if tasks:
-            # Execute tasks concurrently
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            # Update the sheet with personal video link or 'Error'
-            for result in results:
-                if isinstance(result, tuple) and len(result) == 2:
-                    row_number_in_sheet, value = result
-                    personal_video_letter = column_index_to_letter(personal_video_index)
-                    personal_video_cell = f"{personal_video_letter}{row_number_in_sheet}"
-
-                    if value == "Error":
-                        # Update the cell with 'Error'
-                        await update_google_sheet_cell(worksheet, personal_video_cell, "Error")
-                        logging.info(f"Row {row_number_in_sheet}: Set 'Personal Video' to 'Error'")
+    # Results are written in batches; the buffer flushes on size, on time and on the way out
+    async with SheetWriteBuffer(worksheet) as writeback:
+        while True:
+            end_row = start_row + BATCH_SIZE - 1
+            range_str = f"A{start_row}:Z{end_row}"  # Adjust columns to match your sheet
+            logging.info(f"Reading batch rows {start_row} to {end_row}")
+            if mirror:
+                # Re-sync once the mirror is older than SHEET_MIRROR_MAX_AGE; otherwise no request
+                mirror.refresh()
+                batch_data = mirror.rows(start_row, end_row)
+            else:
+                batch_data = worksheet.get_values(range_str)
+            if not batch_data:
+                logging.info("No more data to process. Exiting.")
+                break
+
+            tasks = []
+            row_number_mapping = []  # To keep track of row numbers for tasks
+            for row_idx_in_batch, row_data in enumerate(batch_data):
+                global_row_idx = (start_row - 2) + row_idx_in_batch  # 0-based index for entire data
+                row_number_in_sheet = global_row_idx + 2  # +2 because data starts at row 2
+
+                if not any(cell.strip() for cell in row_data):
+                    logging.info(f"Skipping empty row at {row_number_in_sheet}")
+                    continue
+
+                # Check if 'Personal Video' is already set
+                personal_video_value = ""
+                if personal_video_index < len(row_data):
+                    personal_video_value = row_data[personal_video_index].strip()
+
+                if personal_video_value:
+                    #logging.info(f"Skipping row {row_number_in_sheet}, 'Personal Video' already set.")
+                    continue
+
+                # Append the task to process this row
+                tasks.append(process_row(global_row_idx, row_data, headers, worksheet))
+
+            if tasks:
+                # Execute tasks concurrently
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+
+                # Update the sheet with personal video link or 'Error'
+                for result in results:
+                    if isinstance(result, tuple) and len(result) == 2:
+                        row_number_in_sheet, value = result
+                        personal_video_letter = column_index_to_letter(personal_video_index)
+                        personal_video_cell = f"{personal_video_letter}{row_number_in_sheet}"
+                        if mirror:
+                            mirror.set_status(row_number_in_sheet, value)
+
+                        if value == "Error":
+                            # Update the cell with 'Error'
+                            await writeback.add(personal_video_cell, "Error")
+                            logging.info(f"Row {row_number_in_sheet}: Set 'Personal Video' to 'Error'")
+                        else:
+                            # Update the cell with the video path
+                            await writeback.add(personal_video_cell, value)
+                            logging.info(f"Row {row_number_in_sheet}: Set 'Personal Video' to video path")
+                    elif isinstance(result, Exception):
+                        # If the coroutine raised an exception, mark as 'Error'
+                        # Note: In this implementation, exceptions should be handled within process_row,
+                        # so this block might not be reached. Included for completeness.
+                        logging.error(f"Unexpected exception: {result}")
+                        # Optionally, you can attempt to determine the row number here if needed
                     else:
-                        # Update the cell with the video path
-                        await update_google_sheet_cell(worksheet, personal_video_cell, value)
-                        logging.info(f"Row {row_number_in_sheet}: Set 'Personal Video' to video path")
-                elif isinstance(result, Exception):
-                    # If the coroutine raised an exception, mark as 'Error'
-                    # Note: In this implementation, exceptions should be handled within process_row,
-                    # so this block might not be reached. Included for completeness.
-                    logging.error(f"Unexpected exception: {result}")
-                    # Optionally, you can attempt to determine the row number here if needed
-                else:
-                    # For any unexpected result types, mark as 'Error'
-                    logging.error(f"Unexpected result type: {result}")
-        else:
-            logging.info(f"No tasks to process in batch rows {start_row} to {end_row}")
+                        # For any unexpected result types, mark as 'Error'
+                        logging.error(f"Unexpected result type: {result}")
+            else:
+                logging.info(f"No tasks to process in batch rows {start_row} to {end_row}")
             
-        # Rest for 2 seconds before moving to the next batch
-        logging.info(f"Completed batch rows {start_row} to {end_row}. Resting for 2 seconds...")
-        await asyncio.sleep(1)
-
-        # Move to the next batch
-        start_row = end_row + 1
-        if (start_row - 1) > (total_rows + 1):
-            logging.info("We've processed up to or beyond the last row.")
-            break
+            # Rest for 2 seconds before moving to the next batch
+            logging.info(f"Completed batch rows {start_row} to {end_row}. Resting for 2 seconds...")
+            await asyncio.sleep(1)
+
+            # Move to the next batch
+            start_row = end_row + 1
+            if (start_row - 1) > (total_rows + 1):
+                logging.info("We've processed up to or beyond the last row.")
+                break
+
+    worksheet.log_stats()
+
 
 if __name__ == "__main__":
     asyncio.run(main())
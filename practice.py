@@ -1,5 +1,7 @@
+import asyncio
 import subprocess
 import os
+from media_probe import prepare_concat_inputs
 
 # Paths to the videos
 first_video = "E:\FinalAutomationVideo\personal_videos\http___www_pinkandnavyboutique_com.mp4"
@@ -9,10 +11,13 @@ output_video = "merged_video.mp4"
 # Temporary concat list file
 concat_list = "concat_list.txt"
 
+# Check stream parameters first; the explanation video is normalized once if it doesn't match
+concat_inputs = asyncio.run(prepare_concat_inputs([(first_video, False), (second_video, True)]))
+
 # Create the concat list file
 with open(concat_list, "w") as file:
-    file.write(f"file '{first_video}'\n")
-    file.write(f"file '{second_video}'\n")
+    for concat_input in concat_inputs:
+        file.write(f"file '{concat_input}'\n")
 
 # FFmpeg command to concatenate without re-encoding
 command = [
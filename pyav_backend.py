@@ -0,0 +1,270 @@
+import logging
+import os
+import threading
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from asset_cache import atomic_output
+from render_graph import AUDIO_RATE, FONT_PATH, OUTPUT_FPS
+
+try:
+    import av
+except ImportError:  # Optional: only needed for RENDER_BACKEND=pyav
+    av = None
+
+FRAME_WIDTH = 1920
+FRAME_HEIGHT = 1080
+PYAV_STATIC_CACHE_MB = int(os.getenv("PYAV_STATIC_CACHE_MB", "1024"))  # Per static video kept decoded in memory
+
+
+def decode_audio(path):
+    """Returns the first audio stream as float32 planar stereo at AUDIO_RATE, shape (2, samples)."""
+    resampler = av.AudioResampler(format="fltp", layout="stereo", rate=AUDIO_RATE)
+    chunks = []
+    with av.open(str(path)) as container:
+        if not container.streams.audio:
+            return np.zeros((2, 0), dtype=np.float32)
+        for frame in container.decode(audio=0):
+            chunks.extend(out.to_ndarray() for out in resampler.resample(frame))
+        chunks.extend(out.to_ndarray() for out in resampler.resample(None))
+    return np.concatenate(chunks, axis=1) if chunks else np.zeros((2, 0), dtype=np.float32)
+
+
+def fit_audio(samples, frame_count):
+    """Trims or pads with silence to exactly the length of frame_count video frames."""
+    wanted = frame_count * AUDIO_RATE // OUTPUT_FPS
+    if samples.shape[1] >= wanted:
+        return samples[:, :wanted]
+    return np.pad(samples, ((0, 0), (0, wanted - samples.shape[1])))
+
+
+def alpha_composite(dst, overlay, x, y):
+    """Blends an RGBA overlay into an RGB frame in place at (x, y); parts outside the frame are clipped."""
+    height, width = overlay.shape[:2]
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + width, dst.shape[1]), min(y + height, dst.shape[0])
+    if x0 >= x1 or y0 >= y1:
+        return dst
+    src = overlay[y0 - y:y1 - y, x0 - x:x1 - x]
+    alpha = src[..., 3:4].astype(np.float32) / 255.0
+    region = dst[y0:y1, x0:x1]
+    region[:] = (src[..., :3] * alpha + region * (1.0 - alpha) + 0.5).astype(np.uint8)
+    return dst
+
+
+class StaticFrames:
+    """
+    Frames of a static input video, converted once by `convert`. The first full
+    decode is kept in memory when it fits in budget_mb; otherwise every call
+    decodes the file again (still in-process, no probe or fork).
+    """
+
+    def __init__(self, path, convert, budget_mb=PYAV_STATIC_CACHE_MB):
+        self.path = str(path)
+        self.convert = convert
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.cached = None
+        self.too_large = False
+
+    def __iter__(self):
+        if self.cached is not None:
+            return iter(self.cached)
+        return self._decode()
+
+    def _decode(self):
+        collected = [] if not self.too_large else None
+        size = 0
+        with av.open(self.path) as container:
+            stream = container.streams.video[0]
+            stream.thread_type = "AUTO"
+            for frame in container.decode(stream):
+                converted = self.convert(frame)
+                if collected is not None:
+                    size += converted.nbytes
+                    if size > self.budget_bytes:
+                        logging.info(f"{self.path} is larger than {self.budget_bytes // (1024 * 1024)} MB decoded, streaming it per row")
+                        collected = None
+                        self.too_large = True
+                    else:
+                        collected.append(converted)
+                yield converted
+        if collected is not None:
+            self.cached = collected
+
+
+class PyAvRenderer:
+    """
+    In-process version of build_single_pass_command for a long-lived worker.
+    The mask, font, static videos (speaker, text template, tail) and their
+    audio are decoded once and reused for every row; a row only decodes its
+    background frames (NumPy, e.g. from iter_frames) and runs the encoder.
+    Static videos are assumed to already be at OUTPUT_FPS, like the templates
+    shipped with the repo.
+    """
+
+    def __init__(
+        self,
+        base_video_path,
+        mask_path,
+        mask_width,
+        mask_height,
+        mask_left,
+        mask_bottom,
+        text_video_path,
+        tail_video_path,
+        text_window,
+        font_path=FONT_PATH,
+        fontsize=48,
+        text_y=900,
+        speaker_asset_path=None,
+        crf=16,
+        preset="slow",
+    ):
+        if av is None:
+            raise RuntimeError("RENDER_BACKEND=pyav needs PyAV: pip install av")
+        self.mask_size = (int(mask_width), int(mask_height))
+        self.speaker_x = int(mask_left)
+        self.speaker_y = FRAME_HEIGHT - int(mask_height) + int(mask_bottom)  # overlay y = main_h-overlay_h{mask_bottom}
+        self.text_window = text_window
+        self.text_y = text_y
+        self.font = ImageFont.truetype(str(font_path), fontsize)
+        self.encoder_options = {"crf": str(crf), "preset": preset}
+        self._lock = threading.Lock()
+        self._text_overlays = {}
+
+        if speaker_asset_path is not None:
+            # Pre-masked FFV1 asset already carries the alpha channel
+            speaker_source = speaker_asset_path
+            convert_speaker = lambda frame: frame.to_ndarray(format="rgba")
+        else:
+            speaker_source = base_video_path
+            alpha = np.asarray(Image.open(mask_path).convert("L").resize(self.mask_size, Image.BICUBIC))[..., None]
+            convert_speaker = lambda frame: np.concatenate(
+                [frame.reformat(width=self.mask_size[0], height=self.mask_size[1], format="rgb24").to_ndarray(), alpha], axis=2
+            )
+        self.speaker = StaticFrames(speaker_source, convert_speaker)
+        self.template = StaticFrames(text_video_path, self._to_yuv)
+        self.tail = StaticFrames(tail_video_path, self._to_yuv)
+        self.speaker_audio = decode_audio(speaker_source)
+        self.template_audio = decode_audio(text_video_path)
+        self.tail_audio = decode_audio(tail_video_path)
+
+    @staticmethod
+    def _to_yuv(frame):
+        return frame.reformat(width=FRAME_WIDTH, height=FRAME_HEIGHT, format="yuv420p", interpolation="BICUBIC").to_ndarray()
+
+    def text_overlay(self, text):
+        """RGBA patch and x position for "(w-text_w)/2", rendered once per distinct text."""
+        with self._lock:
+            if text not in self._text_overlays:
+                ascent, descent = self.font.getmetrics()
+                width = max(1, int(round(self.font.getlength(text))))
+                patch = Image.new("RGBA", (width, ascent + descent), (0, 0, 0, 0))
+                ImageDraw.Draw(patch).text((0, 0), text, font=self.font, fill=(0, 0, 0, 255), anchor="la")
+                self._text_overlays[text] = (np.asarray(patch), (FRAME_WIDTH - width) // 2)
+                if len(self._text_overlays) > 64:
+                    self._text_overlays.pop(next(iter(self._text_overlays)))
+            return self._text_overlays[text]
+
+    def render(self, background_frames, text, output_path, threads=0):
+        """
+        Renders background + speaker, the text segment and the tail into
+        output_path. background_frames yields BGR NumPy frames of any size.
+        Returns the number of video frames written.
+        """
+        with atomic_output(output_path) as tmp_path:
+            with av.open(str(tmp_path), mode="w") as container:
+                video = container.add_stream("libx264", rate=OUTPUT_FPS)
+                video.width = FRAME_WIDTH
+                video.height = FRAME_HEIGHT
+                video.pix_fmt = "yuv420p"
+                video.options = self.encoder_options
+                video.codec_context.thread_count = threads
+                audio = container.add_stream("aac", rate=AUDIO_RATE)
+                audio.layout = "stereo"
+                audio.bit_rate = 320000
+                writer = _SegmentWriter(container, video, audio)
+
+                # Segment 1: website background with the circular speaker. Like the
+                # overlay filter, it lasts until both inputs end; whichever ends
+                # first keeps showing its last frame.
+                background_frames = iter(background_frames)
+                speaker_frames = iter(self.speaker)
+                background = speaker = None
+                start = writer.frame_count
+                while True:
+                    bgr = next(background_frames, None)
+                    next_speaker = next(speaker_frames, None)
+                    if bgr is None and next_speaker is None:
+                        break
+                    if bgr is not None:
+                        background = av.VideoFrame.from_ndarray(np.ascontiguousarray(bgr), format="bgr24").reformat(
+                            width=FRAME_WIDTH, height=FRAME_HEIGHT, format="rgb24", interpolation="BICUBIC"
+                        ).to_ndarray()
+                    if next_speaker is not None:
+                        speaker = next_speaker
+                    if background is None:
+                        continue  # No background at all; nothing to overlay the speaker on
+                    rgb = background.copy()  # The held background frame is reused, so composite into a copy
+                    if speaker is not None:
+                        alpha_composite(rgb, speaker, self.speaker_x, self.speaker_y)
+                    writer.video_frame(av.VideoFrame.from_ndarray(rgb, format="rgb24"))
+                writer.audio(fit_audio(self.speaker_audio, writer.frame_count - start))
+
+                # Segment 2: "Prepared For" text burned into the template
+                overlay, text_x = self.text_overlay(text)
+                text_start, text_end = self.text_window
+                start = writer.frame_count
+                for idx, yuv in enumerate(self.template):
+                    if text_start <= idx / OUTPUT_FPS <= text_end:
+                        rgb = av.VideoFrame.from_ndarray(yuv, format="yuv420p").to_ndarray(format="rgb24")
+                        writer.video_frame(av.VideoFrame.from_ndarray(alpha_composite(rgb, overlay, text_x, self.text_y), format="rgb24"))
+                    else:
+                        writer.video_frame(av.VideoFrame.from_ndarray(yuv, format="yuv420p"))
+                writer.audio(fit_audio(self.template_audio, writer.frame_count - start))
+
+                # Segment 3: closing explanation
+                start = writer.frame_count
+                for yuv in self.tail:
+                    writer.video_frame(av.VideoFrame.from_ndarray(yuv, format="yuv420p"))
+                writer.audio(fit_audio(self.tail_audio, writer.frame_count - start))
+                writer.flush()
+        return writer.frame_count
+
+
+class _SegmentWriter:
+    """Encodes and muxes frames with continuous timestamps across segments."""
+
+    def __init__(self, container, video, audio):
+        self.container = container
+        self.video = video
+        self.audio_stream = audio
+        self.frame_count = 0
+        self.sample_count = 0
+        self.pending = np.zeros((2, 0), dtype=np.float32)
+
+    def video_frame(self, frame):
+        frame = frame.reformat(format="yuv420p")
+        frame.pts = self.frame_count
+        self.frame_count += 1
+        self.container.mux(self.video.encode(frame))
+
+    def audio(self, samples):
+        # AAC takes fixed-size frames; the remainder waits for the next segment
+        self.pending = np.concatenate([self.pending, samples.astype(np.float32)], axis=1)
+        frame_size = self.audio_stream.codec_context.frame_size or 1024
+        while self.pending.shape[1] >= frame_size:
+            self._encode_audio(self.pending[:, :frame_size])
+            self.pending = self.pending[:, frame_size:]
+
+    def _encode_audio(self, chunk):
+        frame = av.AudioFrame.from_ndarray(np.ascontiguousarray(chunk), format="fltp", layout="stereo")
+        frame.sample_rate = AUDIO_RATE
+        frame.pts = self.sample_count
+        self.sample_count += chunk.shape[1]
+        self.container.mux(self.audio_stream.encode(frame))
+
+    def flush(self):
+        if self.pending.shape[1]:
+            self._encode_audio(self.pending)
+        self.container.mux(self.video.encode(None))
+        self.container.mux(self.audio_stream.encode(None))
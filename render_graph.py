@@ -0,0 +1,245 @@
+import logging
+from pathlib import Path
+from encoder_profiles import profile_for
+
+FRAME_SIZE = "1920:1080"
+OUTPUT_FPS = 30
+AUDIO_RATE = 48000
+FONT_PATH = r"Roboto-Regular.ttf"
+
+
+def audio_encode_args(profile):
+    """AAC settings of an encoder profile, at the rate and layout every segment is normalized to."""
+    return ["-c:a", "aac", "-b:a", profile.audio_bitrate, "-ar", str(AUDIO_RATE), "-ac", "2"]
+
+
+# Canonical audio of every static track: encoded once, then stream-copied
+AUDIO_ENCODE_ARGS = audio_encode_args(profile_for())
+
+# Common shape for every concat segment, so the concat filter sees identical streams
+VIDEO_NORMALIZE = f"fps={OUTPUT_FPS},setsar=1"
+AUDIO_NORMALIZE = f"aresample={AUDIO_RATE},aformat=sample_fmts=fltp:channel_layouts=stereo"
+
+
+def escape_drawtext(text):
+    return text.replace('\\', '\\\\\\\\').replace(':', r'\:').replace("'", r"\'")
+
+
+def build_drawtext_filters(texts, font_path=FONT_PATH, fontsize=48):
+    """
+    texts is a list of (text, color, start, end, x, y); text must already be escaped.
+    Returns the comma-joined drawtext chain.
+    """
+    drawtext_filters = []
+    for text, color, start, end, x, y in texts:
+        drawtext_filters.append(
+            f"drawtext=text='{text}':fontsize={fontsize}:fontcolor={color}:fontfile={font_path}:x={x}:y={y}:enable='between(t,{start},{end})'"
+        )
+    return ",".join(drawtext_filters)
+
+
+def build_text_fanout_command(template_path, drawtexts, output_paths, codec_args, audio_track=None, duration=None):
+    """
+    Returns one ffmpeg command that decodes and scales the text template once,
+    splits it into one branch per drawtext and encodes each branch to its own
+    output. drawtexts and output_paths are parallel lists.
+    With audio_track every output stream-copies that track; otherwise the
+    template's audio is encoded by codec_args. duration cuts every output
+    after that many seconds (smart-cut heads), otherwise outputs end with
+    the shortest stream. Each output carries its own '-threads 0', which the
+    scheduler's thread budget splits between the outputs.
+    """
+    count = len(drawtexts)
+    branches = [f"[0:v] scale={FRAME_SIZE},format=yuv420p,split={count}{''.join(f'[t{idx}]' for idx in range(count))}"]
+    branches += [f"[t{idx}] {drawtext} [vtext{idx}]" for idx, drawtext in enumerate(drawtexts)]
+    if audio_track is not None:
+        audio_inputs = ["-i", str(audio_track)]  # Pre-encoded template audio, shared by every output
+        audio_args = ["-map", "1:a", "-c:a", "copy"]
+    else:
+        audio_inputs = []
+        audio_args = ["-map", "0:a?"]
+    length_args = ["-t", f"{duration:.6f}"] if duration is not None else ["-shortest"]
+
+    command = [
+        "ffmpeg",
+        "-y",  # Overwrite output without prompting
+        "-i", str(template_path),  # Decoded once for all outputs
+        *audio_inputs,
+        "-filter_complex", ";".join(branches),
+    ]
+    for idx, output_path in enumerate(output_paths):
+        command += [
+            "-map", f"[vtext{idx}]",
+            *audio_args,
+            *codec_args,
+            *length_args,
+            "-r", str(OUTPUT_FPS),
+            "-threads", "0",  # Share of the slot's threads, see apply_thread_budget
+            str(output_path),
+        ]
+    logging.debug(f"Text fan-out graph: {';'.join(branches)}")
+    return command
+
+
+def first_segment_duration(background_duration, speaker_duration):
+    """
+    Length in seconds of segment 1 (background + speaker). The overlay keeps
+    showing the last background frame while the speaker is still talking, so
+    it lasts as long as the longer of the two; None if either is unknown.
+    """
+    if background_duration is None or speaker_duration is None:
+        return None
+    return max(background_duration, speaker_duration)
+
+
+def write_audio_concat_list(list_path, segments):
+    """
+    Writes a concat demuxer list that joins pre-encoded audio tracks.
+    segments is a list of (track_path, duration); each track is cut after
+    `duration` seconds (at the nearest AAC frame), None keeps the whole track.
+    """
+    with open(list_path, "w") as file:
+        for track_path, duration in segments:
+            file.write(f"file '{Path(track_path).resolve()}'\n")
+            if duration is not None:
+                file.write(f"outpoint {duration:.6f}\n")
+
+
+def static_audio_segments(speaker_track, template_track, tail_track, segment_duration, template_duration):
+    """
+    Entries for write_audio_concat_list that join the pre-encoded static
+    tracks into the soundtrack of a single-pass render. Each track is cut
+    where its video segment ends, so the template and tail audio start
+    together with their video: the speaker after segment 1's real length
+    (see first_segment_duration), the template after its own duration.
+    """
+    return [
+        (speaker_track, segment_duration),
+        (template_track, template_duration),
+        (tail_track, None),  # Last segment, ends with the tail
+    ]
+
+
+def build_single_pass_command(
+    background_input,
+    background_filter,
+    base_video_path,
+    mask_path,
+    mask_width,
+    mask_height,
+    mask_left,
+    mask_bottom,
+    text_video_path,
+    drawtext,
+    tail_video_path,
+    output_path,
+    speaker_asset_path=None,
+    audio_list_path=None,
+    frame_range=None,
+    gop_frames=None,
+    profile=None,
+    segment_duration=None,
+):
+    """
+    Returns one ffmpeg command that renders the whole personalized video:
+    web background + masked speaker, the text segment and the tail, joined by
+    the concat filter and encoded once. Replaces the overlay, drawtext and
+    concat-copy passes and their intermediate files.
+    With speaker_asset_path (see asset_cache.ensure_speaker_asset) the speaker
+    is overlaid as-is instead of being scaled and alpha-merged on every row.
+    With audio_list_path (see write_audio_concat_list) the soundtrack is the
+    pre-encoded static audio, stream-copied; nothing is decoded or encoded
+    for audio on this row.
+    With frame_range=(start, end) only those output frames are encoded, video
+    only (end None means to the last frame); see chunked_render. gop_frames
+    fixes the keyframe interval so chunk boundaries fall on GOP starts.
+    profile (see encoder_profiles) picks the encoder settings; default is the
+    run's ENCODER_PROFILE.
+    segment_duration is segment 1's length in seconds (see
+    first_segment_duration); when audio is encoded here, the speaker's
+    soundtrack is padded/trimmed to it so segment 1's audio and video end
+    together.
+    """
+    profile = profile or profile_for()
+    if speaker_asset_path is not None:
+        speaker_inputs = ["-i", str(speaker_asset_path)]  # Pre-masked speaker with alpha
+        speaker_filter = "[1:v] null [circle];"
+        text_idx, tail_idx = 2, 3
+    else:
+        speaker_inputs = [
+            "-i", str(base_video_path),  # Base video
+            "-i", str(mask_path),  # Mask image
+        ]
+        speaker_filter = (
+            f"[1:v] scale={mask_width}:{mask_height},format=rgba [scaled];"
+            f"[2:v] scale={mask_width}:{mask_height},format=gray [scaled_mask];"
+            f"[scaled][scaled_mask] alphamerge [circle];"
+        )
+        text_idx, tail_idx = 3, 4
+
+    video_filters = (
+        # Segment 1: website background with the circular speaker
+        f"[0:v] {background_filter} [bg];"
+        f"{speaker_filter}"
+        f"[bg][circle] overlay={mask_left}:main_h-overlay_h{mask_bottom},{VIDEO_NORMALIZE} [v0];"
+        # Segment 2: "Prepared For" text burned into the template
+        f"[{text_idx}:v] scale={FRAME_SIZE},format=yuv420p,{drawtext},{VIDEO_NORMALIZE} [v1];"
+        # Segment 3: closing explanation
+        f"[{tail_idx}:v] scale={FRAME_SIZE},format=yuv420p,{VIDEO_NORMALIZE} [v2];"
+    )
+    if frame_range is not None:
+        start_frame, end_frame = frame_range
+        trim = f"trim=start_frame={start_frame}" + (f":end_frame={end_frame}" if end_frame is not None else "")
+        filter_complex = (
+            f"{video_filters}[v0][v1][v2] concat=n=3:v=1:a=0 [full];"
+            f"[full] {trim},setpts=PTS-STARTPTS [outv]"
+        )
+        audio_inputs = []
+        audio_args = ["-an"]  # Audio is muxed once when the chunks are joined
+    elif audio_list_path is not None:
+        filter_complex = f"{video_filters}[v0][v1][v2] concat=n=3:v=1:a=0 [outv]"
+        audio_inputs = [
+            "-f", "concat",  # Pre-encoded static audio, joined by the concat demuxer
+            "-safe", "0",
+            "-i", str(audio_list_path),
+        ]
+        audio_args = [
+            "-map", f"{tail_idx + 1}:a",
+            "-c:a", "copy",  # No per-row audio encode
+        ]
+    else:
+        # Same as fit_audio in pyav_backend: segment 1's audio lasts exactly as long as its video
+        fit_speaker_audio = (
+            f"apad,atrim=end={segment_duration},asetpts=PTS-STARTPTS," if segment_duration is not None else ""
+        )
+        filter_complex = (
+            f"{video_filters}"
+            f"[1:a] {fit_speaker_audio}{AUDIO_NORMALIZE} [a0];"
+            f"[{text_idx}:a] {AUDIO_NORMALIZE} [a1];"
+            f"[{tail_idx}:a] {AUDIO_NORMALIZE} [a2];"
+            f"[v0][a0][v1][a1][v2][a2] concat=n=3:v=1:a=1 [outv][outa]"
+        )
+        audio_inputs = []
+        audio_args = [
+            "-map", "[outa]",
+            *audio_encode_args(profile),
+        ]
+    command = [
+        "ffmpeg",
+        "-y",  # Overwrite output files without asking
+        *background_input,  # Website background
+        *speaker_inputs,
+        "-i", str(text_video_path),  # Template that gets the company name
+        "-i", str(tail_video_path),  # Closing segment
+        *audio_inputs,
+        "-filter_complex", filter_complex,
+        "-map", "[outv]",
+        *audio_args,
+        *profile.video_args,  # Codec, speed and quality of the selected profile
+        "-pix_fmt", "yuv420p",
+        *(["-g", str(gop_frames)] if gop_frames else []),  # Fixed GOP length
+        "-threads", "0",  # Use all available CPU threads
+        str(output_path),
+    ]
+    logging.debug(f"Single-pass filter graph: {filter_complex}")
+    return command
@@ -0,0 +1,143 @@
+import asyncio
+import collections
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from asset_cache import ASSET_CACHE_DIR, atomic_output
+
+CALIBRATION_PATH = ASSET_CACHE_DIR / "render_jobs.json"  # Written by `python benchmark.py render-jobs`
+RENDER_JOBS = os.getenv("RENDER_JOBS", "auto")  # auto (calibrated) | number of simultaneous encodes
+RENDER_PIN_CPUS = os.getenv("RENDER_PIN_CPUS", "false").lower() == "true"  # Pin each encode to its own cores
+
+Slot = collections.namedtuple("Slot", ["index", "cpus", "threads"])
+
+
+def host_cpus():
+    """CPUs this process may run on (respects taskset/cgroup cpusets)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def load_calibration(cpu_count):
+    """Returns the measured best job count for this core count, or None."""
+    try:
+        with open(CALIBRATION_PATH, "r") as f:
+            calibration = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if calibration.get("cpus") != cpu_count:
+        logging.info(f"Render calibration is for {calibration.get('cpus')} CPUs, this host has {cpu_count}; ignoring it")
+        return None
+    return calibration.get("jobs")
+
+
+def save_calibration(cpu_count, jobs, videos_per_hour):
+    ASSET_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with atomic_output(CALIBRATION_PATH) as tmp_path:
+        with open(tmp_path, "w") as f:
+            json.dump({"cpus": cpu_count, "jobs": jobs, "videos_per_hour": videos_per_hour}, f, indent=2)
+
+
+def default_jobs(cpu_count):
+    """
+    Simultaneous encodes to run: the calibrated value when the benchmark has
+    been run on this core count, otherwise one encode per 4 cores.
+    """
+    if RENDER_JOBS != "auto":
+        return max(1, int(RENDER_JOBS))
+    calibrated = load_calibration(cpu_count)
+    if calibrated:
+        return calibrated
+    return max(1, cpu_count // 4)
+
+
+def partition_cpus(cpus, jobs):
+    """Splits the CPU list into `jobs` contiguous, near-equal sets."""
+    jobs = max(1, min(jobs, len(cpus)))
+    return [cpus[idx * len(cpus) // jobs:(idx + 1) * len(cpus) // jobs] for idx in range(jobs)]
+
+
+class RenderScheduler:
+    """
+    Hands out encode slots. The host's cores are split into one set per slot;
+    a job holding a slot gets that many encoder threads and, with pin=True,
+    is bound to exactly those cores, so concurrent x264 encodes don't each
+    spawn a thread per core and fight over the whole machine.
+    """
+
+    def __init__(self, jobs=None, cpus=None, pin=RENDER_PIN_CPUS):
+        self.cpus = cpus or host_cpus()
+        self.jobs = jobs or default_jobs(len(self.cpus))
+        self.pin = pin and hasattr(os, "sched_setaffinity")
+        self.slots = [Slot(idx, cpu_set, len(cpu_set)) for idx, cpu_set in enumerate(partition_cpus(self.cpus, self.jobs))]
+        self.jobs = len(self.slots)
+        self._free = None
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._free is None:
+            # Created on first use so it belongs to the running event loop
+            self._free = asyncio.Queue()
+            for slot in self.slots:
+                self._free.put_nowait(slot)
+        slot = await self._free.get()
+        try:
+            yield slot
+        finally:
+            self._free.put_nowait(slot)
+
+    def free_slots(self):
+        """Slots nobody is using right now."""
+        return self._free.qsize() if self._free is not None else len(self.slots)
+
+    def pin_preexec(self, slot):
+        """
+        Returns a preexec_fn that binds the child to the slot's cores before it
+        execs ffmpeg, so every thread ffmpeg starts inherits the mask; None
+        unless pinning is on. Pinning after the process has started only moved
+        its main thread.
+        """
+        if not self.pin or slot is None:
+            return None
+        cpus = frozenset(slot.cpus)  # Built here; the child only makes the syscall
+
+        def pin():
+            try:
+                os.sched_setaffinity(0, cpus)
+            except OSError:
+                pass  # e.g. cores taken away by a cgroup; run unpinned rather than fail the row
+
+        return pin
+
+    def describe(self):
+        return f"{self.jobs} simultaneous encodes on {len(self.cpus)} CPUs ({', '.join(str(s.threads) for s in self.slots)} threads){' pinned' if self.pin else ''}"
+
+
+def apply_thread_budget(command, threads):
+    """
+    Returns the command with every '-threads 0' (use all cores) replaced by the
+    slot's thread budget, and the filter graph limited to the same budget.
+    A command with several outputs (one '-threads 0' each) splits the budget
+    between them, so a fan-out encode stays inside its slot.
+    """
+    command = [str(arg) for arg in command]
+    outputs = sum(1 for arg, nxt in zip(command, command[1:]) if arg == "-threads" and nxt == "0")
+    per_output = max(1, threads // outputs) if outputs > 1 else threads
+    budgeted = [command[0], "-filter_complex_threads", str(threads), "-filter_threads", str(threads)]
+    idx = 1
+    while idx < len(command):
+        if command[idx] == "-threads" and idx + 1 < len(command) and command[idx + 1] == "0":
+            budgeted += ["-threads", str(per_output)]
+            idx += 2
+            continue
+        budgeted.append(command[idx])
+        idx += 1
+    return budgeted
+
+
+def is_stream_copy(command):
+    """True when ffmpeg only remuxes ('-c copy'); such jobs don't need an encode slot."""
+    args = [str(arg) for arg in command]
+    return any(arg == "-c" and nxt == "copy" for arg, nxt in zip(args, args[1:]))
@@ -0,0 +1,98 @@
+import logging
+import os
+import cv2
+from PIL import Image
+
+VIEW_HEIGHT = 1080
+STRIP_MEMORY_MB = int(os.getenv("STRIP_MEMORY_MB", "96"))  # Max decoded screenshot size per job
+
+# Scale denominators libjpeg can decode to directly (DCT scaling, no full-size pass)
+_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class ScreenshotTooLargeError(ValueError):
+    pass
+
+
+def read_image_size(image_path):
+    """Returns (width, height) from the image header without decoding pixels."""
+    with Image.open(image_path) as im:
+        return im.size
+
+
+def proxy_scale_for(width, height, budget_mb=STRIP_MEMORY_MB):
+    """
+    Returns the smallest scale denominator (1, 2, 4 or 8) whose decoded BGR
+    size fits in budget_mb. Pages that fit are kept at full resolution.
+    Raises ScreenshotTooLargeError when even the 1/8 decode is over budget:
+    decoding it anyway would break the cap, and no smaller DCT scale exists.
+    """
+    budget = budget_mb * 1024 * 1024
+    for scale in (1, 2, 4, 8):
+        if (width // scale) * (height // scale) * 3 <= budget:
+            return scale
+    raise ScreenshotTooLargeError(
+        f"{width}x{height} screenshot needs {(width // 8) * (height // 8) * 3 / (1024 * 1024):.0f} MB "
+        f"even at 1/8 scale, over STRIP_MEMORY_MB={budget_mb}"
+    )
+
+
+class ScreenshotStrips:
+    """
+    Lazy, memory-bounded row access to a full-page screenshot.
+    The screenshot is decoded once, on first use, at the scale chosen by
+    proxy_scale_for(), so peak memory stays under STRIP_MEMORY_MB; pages too
+    tall even for the 1/8 decode raise ScreenshotTooLargeError. window() returns full-size VIEW_HEIGHT-row frames; for scaled
+    proxies each band is upscaled on demand and the last one is reused while
+    the offset does not change (holds).
+    """
+
+    def __init__(self, image_path, budget_mb=STRIP_MEMORY_MB):
+        self.image_path = str(image_path)
+        self.width, self.height = read_image_size(self.image_path)
+        self.scale = proxy_scale_for(self.width, self.height, budget_mb)
+        self._proxy = None
+        self._last_window = (None, None)
+
+    @property
+    def shape(self):
+        return (self.height, self.width, 3)
+
+    def proxy(self):
+        if self._proxy is None:
+            proxy = cv2.imread(self.image_path, _REDUCED_FLAGS[self.scale])
+            if proxy is None:
+                raise FileNotFoundError(f"Image not found at {self.image_path}")
+            self._proxy = proxy
+            logging.info(
+                f"Decoded {self.image_path} ({self.width}x{self.height}) at 1/{self.scale} scale: "
+                f"{proxy.nbytes / (1024 * 1024):.1f} MB"
+            )
+        return self._proxy
+
+    def window(self, top, rows=VIEW_HEIGHT):
+        """Returns rows [top, top + rows) at full width as a BGR array."""
+        rows = min(rows, self.height)
+        top = max(0, min(int(top), self.height - rows))
+        if self.scale == 1:
+            return self.proxy()[top:top + rows, :, :]  # View, no copy
+
+        cached_top, cached = self._last_window
+        if cached_top == top and cached.shape[0] == rows:
+            return cached
+        proxy = self.proxy()
+        start = top // self.scale
+        end = max(start + 1, -(-(top + rows) // self.scale))  # Round the bottom edge up
+        band = proxy[start:end, :, :]
+        frame = cv2.resize(band, (self.width, rows), interpolation=cv2.INTER_LINEAR)
+        self._last_window = (top, frame)
+        return frame
+
+    def iter_windows(self, offsets, rows=VIEW_HEIGHT):
+        for offset in offsets:
+            yield self.window(offset, rows)
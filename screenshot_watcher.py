@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import os
+import time
+
+SCREENSHOT_POLL_MIN = float(os.getenv("SCREENSHOT_POLL_MIN", "5"))  # Seconds between reads while screenshots keep arriving
+SCREENSHOT_POLL_MAX = float(os.getenv("SCREENSHOT_POLL_MAX", "60"))  # Upper bound while nothing arrives
+SCREENSHOT_POLL_BACKOFF = 1.5  # Interval growth per empty cycle (halved again when something arrives)
+
+
+class ScreenshotWatcher:
+    """
+    One poller for every row waiting on its 'Screenshot' cell. Each cycle
+    reads only the Screenshot column between the lowest and highest waiting
+    row, in a single request, and resolves the futures of rows that now have
+    a value. The interval halves (down to SCREENSHOT_POLL_MIN) when
+    screenshots arrive and grows (up to SCREENSHOT_POLL_MAX) when none do.
+    """
+
+    def __init__(self, worksheet, column_letter, min_interval=SCREENSHOT_POLL_MIN, max_interval=SCREENSHOT_POLL_MAX):
+        self.worksheet = worksheet
+        self.column_letter = column_letter
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.waiters = {}  # row number -> (future, deadline)
+        self._task = None
+
+    async def wait_for(self, row_number, timeout):
+        """Returns the row's screenshot path once it is filled in, or None after timeout seconds."""
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[row_number] = (future, time.monotonic() + timeout)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        try:
+            return await future
+        finally:
+            self.waiters.pop(row_number, None)  # Also when the row's task is cancelled
+
+    async def _run(self):
+        while self.waiters:
+            await asyncio.sleep(self.interval)
+            try:
+                arrived = await self.poll()
+            except Exception as e:
+                logging.warning(f"Screenshot poll failed: {e}. Next try in {self.interval:.0f}s")
+                arrived = 0
+            self.expire()  # Also when polls keep failing, so no row waits forever
+            if arrived:
+                self.interval = max(self.min_interval, self.interval / 2)
+            else:
+                self.interval = min(self.max_interval, self.interval * SCREENSHOT_POLL_BACKOFF)
+
+    def expire(self):
+        """Resolves waiters past their deadline with None."""
+        now = time.monotonic()
+        for row, (future, deadline) in list(self.waiters.items()):
+            if now >= deadline and not future.done():
+                future.set_result(None)
+
+    async def poll(self):
+        """Reads the Screenshot cells of all waiting rows at once; returns how many were resolved."""
+        waiting = {row: entry for row, entry in self.waiters.items() if not entry[0].done()}
+        if not waiting:
+            return 0
+        first, last = min(waiting), max(waiting)
+        range_str = f"{self.column_letter}{first}:{self.column_letter}{last}"
+        values = await asyncio.to_thread(self.worksheet.get_values, range_str)  # Trailing empty rows are omitted
+        arrived = 0
+        for row, (future, _) in waiting.items():
+            if future.done():
+                continue  # The row's task was cancelled while the read was in flight
+            offset = row - first
+            value = values[offset][0].strip() if offset < len(values) and values[offset] else ""
+            if value:
+                future.set_result(value)
+                arrived += 1
+        logging.info(f"Screenshot poll {range_str}: {arrived} arrived, {len(waiting) - arrived} still waiting, next in {self.interval:.0f}s")
+        return arrived
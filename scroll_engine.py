@@ -0,0 +1,87 @@
+import logging
+import math
+from collections import namedtuple
+import numpy as np
+from screenshot_loader import read_image_size, proxy_scale_for
+
+VIEW_HEIGHT = 1080  # Visible rows of the full-page screenshot per frame
+MAX_SCROLL_SECONDS = 20  # Very tall pages scroll faster instead of making the video longer
+
+# hold -> eased scroll -> hold, all counts in frames
+ScrollPlan = namedtuple("ScrollPlan", ["hold_frames", "scroll_frames", "hold_after_frames", "distance"])
+
+
+def plan_scroll(img_height, fps, hold_frames, scroll_step, min_scroll_frames, hold_after_frames):
+    """
+    Returns a ScrollPlan for a screenshot of img_height rows.
+    The scroll moves scroll_step pixels per frame on average, takes at least
+    min_scroll_frames and at most MAX_SCROLL_SECONDS.
+    """
+    distance = max(0, img_height - VIEW_HEIGHT)
+    if distance == 0:
+        # Nothing below the fold, just hold the top of the page
+        return ScrollPlan(hold_frames, 0, 0, 0)
+    scroll_frames = math.ceil(distance / scroll_step)
+    scroll_frames = max(min_scroll_frames, min(scroll_frames, MAX_SCROLL_SECONDS * fps))
+    return ScrollPlan(hold_frames, scroll_frames, hold_after_frames, distance)
+
+
+def plan_scroll_for_image(image_path, fps, hold_frames, scroll_step, min_scroll_frames, hold_after_frames):
+    """
+    Returns (plan, scale) for a screenshot file. Only the header is read; scale
+    is the decode denominator that keeps the decoded page within STRIP_MEMORY_MB.
+    """
+    img_width, img_height = read_image_size(image_path)
+    plan = plan_scroll(img_height, fps, hold_frames, scroll_step, min_scroll_frames, hold_after_frames)
+    scale = proxy_scale_for(img_width, img_height)
+    logging.info(f"Scroll plan for {image_path}: {plan}, decode scale 1/{scale}")
+    return plan, scale
+
+
+def total_frames(plan):
+    return plan.hold_frames + plan.scroll_frames + plan.hold_after_frames
+
+
+def scroll_offsets(plan):
+    """
+    Returns the top row of the visible window for every frame as an int array.
+    Easing is smoothstep (3u^2 - 2u^3), so the scroll starts and stops gently.
+    """
+    n = np.arange(total_frames(plan), dtype=np.float64)
+    if plan.scroll_frames == 0:
+        return np.zeros(len(n), dtype=np.int64)
+    u = np.clip((n - plan.hold_frames) / plan.scroll_frames, 0.0, 1.0)
+    return np.floor(plan.distance * u * u * (3 - 2 * u)).astype(np.int64)
+
+
+def scroll_filter(plan, fps, scale=1):
+    """
+    Returns a filter chain that renders the whole timeline from a single decoded
+    still: loop repeats the one frame in memory, and crop evaluates the same
+    eased offset as scroll_offsets() per output frame. There is no per-frame
+    Python work and no per-frame image decode, so the cost follows the output
+    duration, not the page height.
+    With scale > 1 the input is decoded with -lowres, so rows are scaled down by
+    the same factor before cropping.
+    """
+    frames = total_frames(plan)
+    if plan.scroll_frames == 0:
+        y_expr = "0"
+    else:
+        u = f"clip((n-{plan.hold_frames})/{plan.scroll_frames},0,1)"
+        y_expr = f"{plan.distance}/{scale}*{u}*{u}*(3-2*{u})"
+    return (
+        f"loop=loop={frames - 1}:size=1:start=0,"  # One decoded frame, repeated
+        f"setpts=N/({fps}*TB),"  # Restore a steady timeline after loop
+        f"crop=w=iw:h='min(ih,{VIEW_HEIGHT // scale})':x=0:y='{y_expr}',"
+        f"scale=1920:1080,format=yuv420p"
+    )
+
+
+def scroll_input(image_path, fps, scale=1):
+    """Input arguments for the tall screenshot, read once (no -loop)."""
+    lowres = []
+    if scale > 1:
+        # DCT-domain reduced decode, the full-size page is never materialized
+        lowres = ["-lowres", str(int(math.log2(scale)))]
+    return [*lowres, "-framerate", str(fps), "-i", str(image_path)]
@@ -0,0 +1,111 @@
+import logging
+import os
+import re
+import shutil
+import unicodedata
+from pathlib import Path
+from asset_cache import ASSET_CACHE_DIR, atomic_output, cache_key, file_digest
+
+TEXT_SEGMENT_CACHE_DIR = Path(os.getenv("TEXT_SEGMENT_CACHE_DIR", str(ASSET_CACHE_DIR / "text_segments")))
+TEXT_SEGMENT_CACHE_MB = int(os.getenv("TEXT_SEGMENT_CACHE_MB", "2048"))
+
+
+def normalize_company_text(text):
+    """
+    Canonical form of a company name: NFC, trimmed, single spaces.
+    The normalized text is also what gets rendered, so equal keys always
+    mean identical pixels.
+    """
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _link_or_copy(src, dst):
+    # A hardlink is instant and keeps the data alive even if the cache evicts src
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class SegmentCache:
+    """
+    Content-addressed disk cache of rendered segments with LRU eviction.
+    Entries are <key>.mp4 files; a hit refreshes the file's mtime, and
+    eviction removes the oldest mtimes first once the directory exceeds
+    max_bytes. Inserts are atomic, so a crash never leaves a partial entry.
+    """
+
+    def __init__(self, cache_dir=TEXT_SEGMENT_CACHE_DIR, max_mb=TEXT_SEGMENT_CACHE_MB):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key_for(self, company_text, font_path, template_path, encoder_settings):
+        return cache_key(
+            "text-segment-v1",
+            normalize_company_text(company_text),
+            file_digest(font_path),
+            file_digest(template_path),
+            " ".join(str(arg) for arg in encoder_settings),
+        )
+
+    def _entry_path(self, key):
+        return self.cache_dir / f"{key}.mp4"
+
+    def contains(self, key):
+        """Lookup without counting a hit or miss or refreshing the entry."""
+        return self._entry_path(key).exists()
+
+    def fetch(self, key, dest_path):
+        """Places the cached segment at dest_path. Returns False on a miss."""
+        entry = self._entry_path(key)
+        if not entry.exists():
+            self.misses += 1
+            return False
+        Path(dest_path).unlink(missing_ok=True)
+        _link_or_copy(entry, dest_path)
+        os.utime(entry)  # Mark as recently used
+        self.hits += 1
+        logging.info(f"Text segment cache hit: {key}")
+        return True
+
+    def insert(self, key, rendered_path):
+        """Adds a freshly rendered segment, then evicts down to the size limit."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with atomic_output(self._entry_path(key)) as tmp_path:
+            _link_or_copy(rendered_path, tmp_path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in self.cache_dir.glob("*.mp4"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # Evicted by another process
+            entries.append((stat.st_mtime, stat.st_size, entry))
+            total += stat.st_size
+
+        entries.sort()  # Least recently used first
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
+            self.evictions += 1
+
+    def log_stats(self, label):
+        """Logs and resets the counters, e.g. once per batch."""
+        lookups = self.hits + self.misses
+        if lookups:
+            logging.info(
+                f"Text segment cache {label}: {self.hits} hits, {self.misses} misses, "
+                f"{self.evictions} evictions ({self.hits / lookups:.0%} hit rate)"
+            )
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
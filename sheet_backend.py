@@ -0,0 +1,252 @@
+import collections
+import csv
+import logging
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from gspread.utils import a1_range_to_grid_range, a1_to_rowcol
+from sheets_client import SheetsClient
+
+SHEET_BACKEND = os.getenv("SHEET_BACKEND", "google")  # google | local (CSV file, no credentials or network)
+LOCAL_SHEET_PATH = Path(os.getenv("LOCAL_SHEET_PATH", "local_sheet.csv"))
+LOCAL_SHEET_LATENCY_MS = float(os.getenv("LOCAL_SHEET_LATENCY_MS", "0"))  # Simulated round trip per request
+LOCAL_SHEET_JITTER_MS = float(os.getenv("LOCAL_SHEET_JITTER_MS", "0"))  # ...plus up to this much random extra
+LOCAL_SHEET_QUOTA_PER_MINUTE = int(os.getenv("LOCAL_SHEET_QUOTA_PER_MINUTE", "0"))  # Requests beyond this fail with 429 (0 = no quota)
+LOCAL_SHEET_ERROR_RATE = float(os.getenv("LOCAL_SHEET_ERROR_RATE", "0"))  # Fraction of requests that fail with 503
+
+
+class SheetAPIError(Exception):
+    """A simulated Sheets API error; SheetsClient retries it by status_code like the real one."""
+
+    def __init__(self, status_code, message):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+
+
+def _trim(row):
+    row = list(row)
+    while row and not row[-1]:
+        row.pop()
+    return row
+
+
+def write_local_sheet(path, headers, rows):
+    """Creates (or replaces) a local sheet file, e.g. to load-test with generated rows."""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows([headers] + list(rows))
+    os.replace(tmp_path, path)
+
+
+class LocalWorksheet:
+    """
+    File-backed stand-in for the gspread worksheet, covering the calls the
+    pipeline makes: row_values, col_values, get_values, get_all_values,
+    batch_get, update_acell, update_cell, batch_update, resize, and the
+    id/spreadsheet/row_count/col_count metadata. The sheet is a CSV file,
+    re-read when another process changed it and replaced atomically on every
+    write. Each request can be given latency, a per-minute quota (429 when
+    exceeded) and a random 503 rate, so runs behave like the API under load.
+    """
+
+    def __init__(self, path=LOCAL_SHEET_PATH, latency_ms=LOCAL_SHEET_LATENCY_MS, jitter_ms=LOCAL_SHEET_JITTER_MS,
+                 quota_per_minute=LOCAL_SHEET_QUOTA_PER_MINUTE, error_rate=LOCAL_SHEET_ERROR_RATE):
+        self.path = Path(path)
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.quota_per_minute = quota_per_minute
+        self.error_rate = error_rate
+        self.id = 0
+        self.spreadsheet = SimpleNamespace(id=f"local:{self.path.resolve()}")
+        self.requests = collections.deque()  # Request times within the last minute, for the quota
+        self.cells = []
+        self.cols = 0
+        self.mtime = None
+        self._lock = threading.RLock()
+        with self._lock:
+            self._load()
+
+    # --- Storage ---
+    def _load(self):
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self.mtime:
+            return
+        with open(self.path, newline="", encoding="utf-8") as f:
+            self.cells = [list(row) for row in csv.reader(f)]
+        self.cols = max([self.cols] + [len(row) for row in self.cells])
+        self.mtime = mtime
+
+    def _save(self):
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows(_trim(row) for row in self.cells)
+        os.replace(tmp_path, self.path)
+        self.mtime = self.path.stat().st_mtime_ns
+
+    def _set(self, row, col, value):
+        while len(self.cells) < row:
+            self.cells.append([])
+        cells = self.cells[row - 1]
+        cells += [""] * (col - len(cells))
+        cells[col - 1] = str(value)
+        self.cols = max(self.cols, col)
+
+    # --- Simulated API behaviour ---
+    def _request(self):
+        if self.quota_per_minute:
+            with self._lock:
+                now = time.monotonic()
+                while self.requests and now - self.requests[0] >= 60:
+                    self.requests.popleft()
+                if len(self.requests) >= self.quota_per_minute:
+                    raise SheetAPIError(429, "Quota exceeded for 'Read/Write requests per minute per user'")
+                self.requests.append(now)
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        if self.error_rate and random.random() < self.error_rate:
+            raise SheetAPIError(503, "The service is currently unavailable")
+
+    # --- Metadata ---
+    @property
+    def row_count(self):
+        return max(len(self.cells), 1000)  # New Google sheets have a 1000-row grid
+
+    @property
+    def col_count(self):
+        return self.cols
+
+    # --- Reads ---
+    def _range(self, range_name):
+        with self._lock:
+            self._load()
+            if range_name is None:
+                return [_trim(row) for row in self.cells]
+            grid = a1_range_to_grid_range(range_name)
+            first_row = grid.get("startRowIndex", 0)
+            last_row = grid.get("endRowIndex", len(self.cells))
+            first_col = grid.get("startColumnIndex", 0)
+            last_col = grid.get("endColumnIndex", self.cols)
+            values = [_trim(row[first_col:last_col]) for row in self.cells[first_row:last_row]]
+        while values and not values[-1]:
+            values.pop()  # Like the API, trailing empty rows are left out
+        return values
+
+    def get_values(self, range_name=None, **kwargs):
+        self._request()
+        return self._range(range_name)
+
+    def get_all_values(self, **kwargs):
+        self._request()
+        return self._range(None)
+
+    def batch_get(self, ranges, **kwargs):
+        self._request()
+        return [self._range(range_name) for range_name in ranges]
+
+    def row_values(self, row, **kwargs):
+        self._request()
+        with self._lock:
+            self._load()
+            return _trim(self.cells[row - 1]) if row <= len(self.cells) else []
+
+    def col_values(self, col, **kwargs):
+        self._request()
+        with self._lock:
+            self._load()
+            return _trim([row[col - 1] if col <= len(row) else "" for row in self.cells])
+
+    # --- Writes ---
+    def update_acell(self, label, value):
+        row, col = a1_to_rowcol(label)
+        return self.update_cell(row, col, value)
+
+    def update_cell(self, row, col, value):
+        self._request()
+        with self._lock:
+            self._load()
+            self._set(row, col, value)
+            self._save()
+
+    def batch_update(self, data, **kwargs):
+        self._request()
+        with self._lock:
+            self._load()
+            for update in data:
+                grid = a1_range_to_grid_range(update["range"])
+                for row_offset, values in enumerate(update["values"]):
+                    for col_offset, value in enumerate(values):
+                        self._set(grid["startRowIndex"] + row_offset + 1, grid["startColumnIndex"] + col_offset + 1, value)
+            self._save()
+
+    def resize(self, rows=None, cols=None):
+        self._request()
+        with self._lock:
+            self._load()
+            if rows is not None:
+                del self.cells[rows:]
+            if cols is not None:
+                self.cells = [row[:cols] for row in self.cells]
+                self.cols = cols
+            self._save()
+
+
+class ConcurrentWriter:
+    """
+    Simulates another client editing the sheet while the pipeline runs (the
+    screenshot service filling 'Screenshot'): every interval seconds it fills
+    the first empty cell of column in a row that has data. Writes go straight
+    to the LocalWorksheet, outside the pipeline's rate limiter, like a
+    separate process would.
+    """
+
+    def __init__(self, worksheet, column, interval, value=lambda row: f"screenshots/row_{row}.png"):
+        self.worksheet = worksheet
+        self.column = column
+        self.interval = interval
+        self.value = value
+        self.filled = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        sheet = self.worksheet
+        while not self._stop.wait(self.interval):
+            with sheet._lock:
+                sheet._load()
+                empty = (
+                    row_number for row_number, row in enumerate(sheet.cells[1:], start=2)
+                    if any(row) and (len(row) < self.column or not row[self.column - 1])
+                )
+                row_number = next(empty, None)
+                if row_number is not None:
+                    sheet._set(row_number, self.column, self.value(row_number))
+                    sheet._save()
+                    self.filled += 1
+
+
+def open_worksheet(credentials_path, sheet_url, tab_name, backend=SHEET_BACKEND):
+    """
+    The work sheet for SHEET_BACKEND, always behind SheetsClient so rate
+    limiting and retries behave the same whichever backend answers.
+    """
+    if backend == "google":
+        return SheetsClient.open(credentials_path, sheet_url, tab_name)
+    if backend == "local":
+        logging.info(f"Using the local sheet {LOCAL_SHEET_PATH} instead of Google Sheets")
+        return SheetsClient(LocalWorksheet())
+    raise ValueError(f"Unknown SHEET_BACKEND {backend!r}; choose google or local")
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+from gspread.utils import rowcol_to_a1
+from asset_cache import ASSET_CACHE_DIR
+
+SHEET_MIRROR = os.getenv("SHEET_MIRROR", "true").lower() == "true"  # Serve row reads from a local SQLite copy of the sheet
+SHEET_MIRROR_PATH = Path(os.getenv("SHEET_MIRROR_PATH", str(ASSET_CACHE_DIR / "sheet_mirror.sqlite3")))
+SHEET_MIRROR_MAX_AGE = float(os.getenv("SHEET_MIRROR_MAX_AGE", "300"))  # Seconds a sync is trusted before a batch re-syncs (0 = every batch)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rows (
+    sheet TEXT NOT NULL,
+    row_number INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    status TEXT NOT NULL,  -- The status column's value ('Personal Video'), '' while pending
+    has_data INTEGER NOT NULL,
+    data TEXT NOT NULL,  -- JSON list of cell values
+    PRIMARY KEY (sheet, row_number)
+);
+CREATE INDEX IF NOT EXISTS rows_pending ON rows (sheet, status, has_data, row_number);
+CREATE TABLE IF NOT EXISTS sheets (
+    sheet TEXT PRIMARY KEY,
+    headers TEXT NOT NULL,
+    synced_at REAL NOT NULL
+);
+"""
+
+
+def row_hash(row_data):
+    # Trailing empty cells are not part of the content (the API trims them inconsistently)
+    trimmed = list(row_data)
+    while trimmed and not trimmed[-1].strip():
+        trimmed.pop()
+    return hashlib.sha1(json.dumps(trimmed).encode("utf-8")).hexdigest()
+
+
+class SheetMirror:
+    """
+    Local SQLite copy of the work sheet. sync() reads every row in a single
+    request and writes only rows whose content hash changed. After that, row
+    lookups, batches, the first-pending-row query and status updates are
+    local; refresh() re-syncs once the last sync is older than
+    SHEET_MIRROR_MAX_AGE, so a whole run costs one read per max-age window
+    instead of one per batch. Rows another host finished inside that window
+    can be rendered twice. The sheet stays the source of truth: results
+    still go out through the write buffer, and a status that never arrived
+    there is picked up on the next sync.
+    """
+
+    def __init__(self, worksheet, status_column, db_path=SHEET_MIRROR_PATH):
+        self.worksheet = worksheet
+        self.status_column = status_column
+        self.sheet = f"{worksheet.spreadsheet.id}:{worksheet.id}"
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(db_path))
+        self.db.executescript(SCHEMA)
+        self.headers = []
+        self.first_row = 2
+        self.synced_at = None  # time.monotonic() of the last sync
+
+    def close(self):
+        self.db.close()
+
+    def _rows_range(self, first_row):
+        # Open-ended, e.g. A2:F: every row from first_row down, the API leaves out trailing empty rows
+        last_column = rowcol_to_a1(first_row, len(self.headers)).rstrip("0123456789")
+        return f"{rowcol_to_a1(first_row, 1)}:{last_column}"
+
+    def sync(self, headers, first_row=2):
+        """Brings the mirror up to date with the sheet in one read; returns the number of rows that changed."""
+        started = time.perf_counter()
+        self.headers = list(headers)
+        self.first_row = first_row
+        values = self.worksheet.get_values(self._rows_range(first_row))
+        last_row = first_row + len(values) - 1
+
+        changed = 0
+        for offset, row_data in enumerate(values):
+            changed += self._store(first_row + offset, row_data)
+        self.db.execute("DELETE FROM rows WHERE sheet = ? AND row_number > ?", (self.sheet, last_row))
+        self.db.execute(
+            "INSERT OR REPLACE INTO sheets (sheet, headers, synced_at) VALUES (?, ?, ?)",
+            (self.sheet, json.dumps(self.headers), time.time()),
+        )
+        self.db.commit()
+        self.synced_at = time.monotonic()
+        logging.info(
+            f"Sheet mirror: {len(values)} rows read in one request, {changed} changed "
+            f"({time.perf_counter() - started:.1f}s)"
+        )
+        return changed
+
+    def refresh(self, max_age=SHEET_MIRROR_MAX_AGE):
+        """
+        Re-syncs when the last sync is older than max_age seconds, so batches
+        pick up rows finished or edited elsewhere without a read per batch.
+        Returns the number of rows that changed (0 when the mirror is fresh).
+        """
+        if self.synced_at is not None and time.monotonic() - self.synced_at < max_age:
+            return 0
+        return self.sync(self.headers, self.first_row)
+
+    def _store(self, row_number, row_data):
+        digest = row_hash(row_data)
+        current = self.db.execute(
+            "SELECT hash FROM rows WHERE sheet = ? AND row_number = ?", (self.sheet, row_number)
+        ).fetchone()
+        if current and current[0] == digest:
+            return 0
+        status_idx = self.headers.index(self.status_column)
+        status = row_data[status_idx].strip() if status_idx < len(row_data) else ""
+        self.db.execute(
+            "INSERT OR REPLACE INTO rows (sheet, row_number, hash, status, has_data, data) VALUES (?, ?, ?, ?, ?, ?)",
+            (self.sheet, row_number, digest, status, int(any(c.strip() for c in row_data)), json.dumps(list(row_data))),
+        )
+        return 1
+
+    def row(self, row_number):
+        found = self.db.execute(
+            "SELECT data FROM rows WHERE sheet = ? AND row_number = ?", (self.sheet, row_number)
+        ).fetchone()
+        return json.loads(found[0]) if found else []
+
+    def rows(self, first, last):
+        """Rows first..last like worksheet.get_values: missing rows are [], trailing ones are dropped."""
+        found = dict(self.db.execute(
+            "SELECT row_number, data FROM rows WHERE sheet = ? AND row_number BETWEEN ? AND ?",
+            (self.sheet, first, last),
+        ).fetchall())
+        result = [json.loads(found[n]) if n in found else [] for n in range(first, last + 1)]
+        while result and not any(c.strip() for c in result[-1]):
+            result.pop()
+        return result
+
+    def last_row(self):
+        found = self.db.execute("SELECT MAX(row_number) FROM rows WHERE sheet = ?", (self.sheet,)).fetchone()
+        return found[0] or 1
+
+    def first_pending_row(self):
+        """Sheet row number of the first non-empty row without a status, or None."""
+        found = self.db.execute(
+            "SELECT MIN(row_number) FROM rows WHERE sheet = ? AND status = '' AND has_data = 1", (self.sheet,)
+        ).fetchone()
+        return found[0]
+
+    def pending_rows(self, limit=None):
+        query = "SELECT row_number FROM rows WHERE sheet = ? AND status = '' AND has_data = 1 ORDER BY row_number"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        return [n for (n,) in self.db.execute(query, (self.sheet,))]
+
+    def set_status(self, row_number, value):
+        """Records a result locally; the sheet itself is updated by the write buffer."""
+        row_data = self.row(row_number)
+        status_idx = self.headers.index(self.status_column)
+        row_data += [""] * (status_idx + 1 - len(row_data))
+        row_data[status_idx] = value
+        self._store(row_number, row_data)
+        self.db.commit()
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import os
+import time
+
+SHEET_FLUSH_ROWS = int(os.getenv("SHEET_FLUSH_ROWS", "50"))  # Flush once this many cells are waiting
+SHEET_FLUSH_SECONDS = float(os.getenv("SHEET_FLUSH_SECONDS", "30"))  # ...or once the oldest has waited this long
+
+
+class SheetWriteBuffer:
+    """
+    Collects single-cell results (e.g. "Personal Video" links) and writes them
+    with one worksheet.batch_update per flush instead of one update_acell per
+    row. Flushes when SHEET_FLUSH_ROWS cells are pending, when the oldest
+    pending cell is SHEET_FLUSH_SECONDS old, and on close. Use it as an async
+    context manager so the final flush also happens on errors and Ctrl+C.
+    Later writes to the same cell replace earlier pending ones.
+    """
+
+    def __init__(self, worksheet, max_rows=SHEET_FLUSH_ROWS, max_seconds=SHEET_FLUSH_SECONDS):
+        self.worksheet = worksheet
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.pending = {}  # cell -> value, in insertion order
+        self.oldest = None
+        self._lock = asyncio.Lock()
+        self._timer = None
+
+    async def __aenter__(self):
+        self._timer = asyncio.create_task(self._flush_on_time())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def add(self, cell, value):
+        self.pending[cell] = value
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+        logging.info(f"Queued {cell} = {value} ({len(self.pending)} pending)")
+        if len(self.pending) >= self.max_rows:
+            await self.flush()
+
+    async def _flush_on_time(self):
+        while True:
+            await asyncio.sleep(min(self.max_seconds, 5))
+            if self.oldest is not None and time.monotonic() - self.oldest >= self.max_seconds:
+                await self.flush()
+
+    async def flush(self):
+        """Writes every pending cell in one batch_update. On failure the cells stay queued."""
+        async with self._lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+            oldest, self.oldest = self.oldest, None
+            data = [{"range": cell, "values": [[value]]} for cell, value in batch.items()]
+            written = False
+            try:
+                # SheetsClient rate-limits and retries; an error here means it gave up
+                await asyncio.to_thread(self.worksheet.batch_update, data, value_input_option="USER_ENTERED")
+                logging.info(f"Wrote {len(batch)} cells in one batch update")
+                written = True
+            except Exception as e:
+                logging.error(f"Batch update of {len(batch)} cells failed, keeping them queued: {e}")
+            finally:
+                if not written:
+                    # Put them back in front of anything queued meanwhile (also when cancelled); newer values win
+                    self.pending = {**batch, **self.pending}
+                    self.oldest = oldest if self.oldest is None else min(oldest, self.oldest)
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            try:
+                await self._timer
+            except asyncio.CancelledError:
+                pass
+            self._timer = None
+        await self.flush()
+        if self.pending:
+            logging.error(f"Could not write {len(self.pending)} cells at shutdown: {self.pending}")
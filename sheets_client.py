@@ -0,0 +1,207 @@
+import collections
+import concurrent.futures
+import logging
+import os
+import random
+import threading
+import time
+import gspread
+import requests
+from oauth2client.service_account import ServiceAccountCredentials
+
+# Google's default quota is 60 requests per minute per user; stay a little under it
+SHEETS_REQUESTS_PER_MINUTE = float(os.getenv("SHEETS_REQUESTS_PER_MINUTE", "55"))
+SHEETS_BURST = int(os.getenv("SHEETS_BURST", "10"))  # Requests that may go out back to back after a quiet spell
+SHEETS_MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", "8"))  # Attempts per call on 429/5xx/network errors
+SHEETS_BACKOFF_BASE = 2  # Seconds; the backoff cap doubles per attempt...
+SHEETS_BACKOFF_MAX = 64  # ...up to this
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+SCOPE = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+
+
+def backoff_delay(attempt, base=SHEETS_BACKOFF_BASE, cap=SHEETS_BACKOFF_MAX):
+    """Exponential backoff with full jitter, so callers that failed together do not retry together."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def status_code(error):
+    """HTTP status of a Sheets error: gspread's APIError, or a backend error with a status_code attribute."""
+    if isinstance(error, gspread.exceptions.APIError):
+        return error.response.status_code
+    return getattr(error, "status_code", None)
+
+
+def is_retryable(error):
+    if status_code(error) in RETRY_STATUS_CODES:
+        return True
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: holds up to `burst` tokens and refills at
+    rate_per_minute. acquire() blocks until a token is available and returns
+    how long it waited.
+    """
+
+    def __init__(self, rate_per_minute=SHEETS_REQUESTS_PER_MINUTE, burst=SHEETS_BURST):
+        self.rate = rate_per_minute / 60
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def drain(self):
+        """Called on a 429: the quota is spent, so nobody else should go out until it refills."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, 0.0)
+
+
+class SheetsClient:
+    """
+    The only way this project talks to the work sheet. Wraps a gspread
+    worksheet (or a sheet_backend stand-in) with the same method names, so
+    it can be passed wherever a worksheet was. Every request takes a token from a per-process bucket
+    sized to the per-minute quota, retries 429/5xx/network errors with
+    jittered exponential backoff, and identical reads that are already in
+    flight share one request. Calls, retries, coalesced reads and time spent
+    throttled are counted for log_stats().
+    """
+
+    def __init__(self, worksheet, bucket=None):
+        self._worksheet = worksheet
+        self.bucket = bucket or TokenBucket()
+        self.counters = collections.Counter()
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    @classmethod
+    def open(cls, credentials_path, sheet_url, tab_name, bucket=None):
+        """Authorizes with the service account and opens tab_name, with the same retry rules as every call."""
+        client = cls(None, bucket)
+        gc = client._request("authorize", lambda: gspread.authorize(
+            ServiceAccountCredentials.from_json_keyfile_name(credentials_path, SCOPE)
+        ))
+        spreadsheet = client._request("open_by_url", gc.open_by_url, sheet_url)
+        client._worksheet = client._request("worksheet", spreadsheet.worksheet, tab_name)
+        return client
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.counters[key] += amount
+
+    def _request(self, name, func, *args, **kwargs):
+        for attempt in range(SHEETS_MAX_RETRIES):
+            self._count("throttled_seconds", self.bucket.acquire())
+            self._count(f"calls.{name}")
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e) or attempt == SHEETS_MAX_RETRIES - 1:
+                    self._count("errors")
+                    raise
+                if status_code(e) == 429:
+                    self._count("quota_errors")
+                    self.bucket.drain()
+                wait_time = backoff_delay(attempt)
+                logging.warning(f"Sheets {name} failed: {e}. Retrying in {wait_time:.1f}s (attempt {attempt + 1})")
+                self._count("retries")
+                self._count("throttled_seconds", wait_time)
+                time.sleep(wait_time)
+
+    def _read(self, name, *args, **kwargs):
+        # Identical reads already in flight (e.g. two pollers, or a poll and a sync) share one request
+        key = repr((name, args, sorted(kwargs.items())))
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = concurrent.futures.Future()
+            else:
+                self.counters["coalesced"] += 1
+        if not owner:
+            return future.result()
+        try:
+            result = self._request(name, getattr(self._worksheet, name), *args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    # --- Worksheet metadata (loaded with the worksheet, no request) ---
+    @property
+    def id(self):
+        return self._worksheet.id
+
+    @property
+    def spreadsheet(self):
+        return self._worksheet.spreadsheet
+
+    @property
+    def col_count(self):
+        return self._worksheet.col_count
+
+    @property
+    def row_count(self):
+        return self._worksheet.row_count
+
+    # --- Reads ---
+    def row_values(self, row, **kwargs):
+        return self._read("row_values", row, **kwargs)
+
+    def col_values(self, col, **kwargs):
+        return self._read("col_values", col, **kwargs)
+
+    def get_values(self, range_name=None, **kwargs):
+        return self._read("get_values", range_name, **kwargs)
+
+    def get_all_values(self, **kwargs):
+        return self._read("get_all_values", **kwargs)
+
+    def batch_get(self, ranges, **kwargs):
+        return self._read("batch_get", list(ranges), **kwargs)
+
+    # --- Writes ---
+    def update_acell(self, label, value):
+        return self._request("update_acell", self._worksheet.update_acell, label, value)
+
+    def update_cell(self, row, col, value):
+        return self._request("update_cell", self._worksheet.update_cell, row, col, value)
+
+    def batch_update(self, data, **kwargs):
+        return self._request("batch_update", self._worksheet.batch_update, data, **kwargs)
+
+    def resize(self, rows=None, cols=None):
+        return self._request("resize", self._worksheet.resize, rows=rows, cols=cols)
+
+    def log_stats(self, label="Sheets"):
+        with self._lock:
+            counters = dict(self.counters)
+        calls = {k.split(".", 1)[1]: v for k, v in counters.items() if k.startswith("calls.")}
+        logging.info(
+            f"{label}: {sum(calls.values())} requests {calls}, {counters.get('retries', 0)} retries "
+            f"({counters.get('quota_errors', 0)} on quota), {counters.get('coalesced', 0)} coalesced reads, "
+            f"{counters.get('errors', 0)} failed, {counters.get('throttled_seconds', 0):.1f}s throttled"
+        )
@@ -0,0 +1,161 @@
+import asyncio
+import collections
+import logging
+from pathlib import Path
+from asset_cache import ASSET_CACHE_DIR, atomic_output, cache_key, file_digest
+from ffmpeg_runner import run_ffmpeg
+from render_graph import build_text_fanout_command
+
+_keyframe_cache = {}
+_template_locks = collections.defaultdict(asyncio.Lock)  # Cache key -> lock, one build per canonical template
+
+
+async def probe_keyframe_times(video_path):
+    """
+    Returns the sorted keyframe timestamps of the first video stream.
+    Reads packet flags only, nothing is decoded.
+    """
+    command = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=print_section=0",
+        str(video_path),
+    ]
+    result = await run_ffmpeg(command, capture_stdout=True)
+    times = []
+    for line in result.stdout.splitlines():
+        parts = line.strip().split(",")
+        if len(parts) >= 2 and "K" in parts[1] and parts[0] not in ("", "N/A"):
+            times.append(float(parts[0]))
+    return sorted(times)
+
+
+async def keyframe_times(video_path):
+    digest = file_digest(video_path)
+    if digest not in _keyframe_cache:
+        _keyframe_cache[digest] = await probe_keyframe_times(video_path)
+    return _keyframe_cache[digest]
+
+
+async def first_keyframe_after(video_path, t):
+    for keyframe_time in await keyframe_times(video_path):
+        if keyframe_time >= t - 0.001:
+            return keyframe_time
+    return None
+
+
+def _audio_source(audio_track):
+    """
+    Returns (inputs, args) for the soundtrack: the pre-encoded track as input 1,
+    stream-copied, or the template's own audio (encoded by codec_args).
+    """
+    if audio_track is None:
+        return [], ["-map", "0:a?"]
+    return ["-i", str(audio_track)], ["-map", "1:a", "-c:a", "copy"]
+
+
+async def ensure_canonical_template(template_path, codec_args, text_end, audio_track=None):
+    """
+    Returns the template re-encoded once with the per-row codec settings and a
+    keyframe forced at text_end. Stream-copying a tail from this file next to a
+    freshly encoded head is safe because both halves come from the same x264
+    settings (identical SPS/PPS), which is not true of the original template.
+    With audio_track its soundtrack is that pre-encoded track, copied.
+    """
+    audio_inputs, audio_args = _audio_source(audio_track)
+    key = cache_key("canonical-template-v1", file_digest(template_path), " ".join(codec_args), text_end, audio_track)
+    canonical_path = ASSET_CACHE_DIR / f"template_{key}.mp4"
+    if canonical_path.exists():
+        return canonical_path
+
+    # Every row of a batch awaits this at once on a cold cache; only the first builds
+    async with _template_locks[key]:
+        if canonical_path.exists():
+            return canonical_path
+        ASSET_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        logging.info(f"Building canonical template for smart cut: {canonical_path}")
+        with atomic_output(canonical_path) as tmp_path:
+            command = [
+                "ffmpeg",
+                "-y",
+                "-i", str(template_path),
+                *audio_inputs,
+                "-vf", "scale=1920:1080,format=yuv420p",
+                "-map", "0:v",
+                *audio_args,
+                *codec_args,
+                "-force_key_frames", str(text_end),  # Cut point right where the text ends
+                "-r", "30",
+                "-threads", "0",
+                str(tmp_path),
+            ]
+            await run_ffmpeg(command, stage="canonical_template")
+    return canonical_path
+
+
+async def render_smart_cut_text(template_path, drawtext, codec_args, text_end, output_path, audio_track=None):
+    """
+    Renders the text segment by re-encoding only [0, cut) with the drawtext
+    burned in and stream-copying [cut, end), where cut is the first keyframe at
+    or after text_end. Returns False when there is no usable cut point (the
+    caller should then re-encode the whole template).
+    With audio_track (see asset_cache.ensure_audio_track) both halves carry
+    that track stream-copied, so no audio is encoded for the row.
+    """
+    return await render_smart_cut_texts(template_path, [(drawtext, output_path)], codec_args, text_end, audio_track)
+
+
+async def render_smart_cut_texts(template_path, jobs, codec_args, text_end, audio_track=None):
+    """
+    Batch form of render_smart_cut_text: jobs is a list of (drawtext,
+    output_path). All heads come from one decode of the template (see
+    build_text_fanout_command) and the copied tail is cut once and shared.
+    Returns False when there is no usable cut point.
+    """
+    canonical_path = await ensure_canonical_template(template_path, codec_args, text_end, audio_track)
+    cut = await first_keyframe_after(canonical_path, text_end)
+    if cut is None:
+        logging.info(f"No keyframe after {text_end}s in {canonical_path}, smart cut not possible")
+        return False
+
+    output_paths = [Path(output_path) for _, output_path in jobs]
+    head_paths = [path.with_name(f"{path.stem}_head.mp4") for path in output_paths]
+    list_paths = [path.with_name(f"{path.stem}_parts.txt") for path in output_paths]
+    tail_path = output_paths[0].with_name(f"{output_paths[0].stem}_tail.mp4")
+    head_command = build_text_fanout_command(
+        template_path, [drawtext for drawtext, _ in jobs], head_paths, codec_args, audio_track, duration=cut
+    )
+    tail_command = [
+        "ffmpeg",
+        "-y",
+        "-ss", f"{cut:.6f}",  # Lands exactly on the keyframe
+        "-i", str(canonical_path),
+        "-c", "copy",  # No decode, no encode
+        "-avoid_negative_ts", "make_zero",
+        str(tail_path),
+    ]
+    try:
+        await run_ffmpeg(head_command, stage="text_head")
+        await run_ffmpeg(tail_command, stage="text_tail")
+        for head_path, list_path, output_path in zip(head_paths, list_paths, output_paths):
+            with open(list_path, "w") as file:
+                file.write(f"file '{head_path.resolve()}'\n")
+                file.write(f"file '{tail_path.resolve()}'\n")
+            join_command = [
+                "ffmpeg",
+                "-y",
+                "-f", "concat",
+                "-safe", "0",
+                "-i", str(list_path),
+                "-c", "copy",
+                str(output_path),
+            ]
+            await run_ffmpeg(join_command, stage="text_join")
+    finally:
+        for part in (*head_paths, *list_paths, tail_path):
+            if part.exists():
+                part.unlink()
+    logging.info(f"Smart-cut text segments: re-encoded {cut:.2f}s for {len(jobs)} outputs, copied the rest")
+    return True
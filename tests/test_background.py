@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip("cv2")
+from background import still_hold_filter, still_hold_input
+
+
+def test_still_hold_full_resolution():
+    assert still_hold_input("shot.jpg", 3) == ["-framerate", "30", "-i", "shot.jpg"]
+    assert still_hold_filter(3) == (
+        "crop=iw:'min(ih,1080)':0:0,"
+        "loop=loop=89:size=1:start=0,"
+        "setpts=N/(30*TB),"
+        "trim=end_frame=90,"
+        "scale=1920:1080,format=yuv420p"
+    )
+
+
+def test_still_hold_reduced_decode():
+    assert still_hold_input("shot.jpg", 3, scale=4)[:2] == ["-lowres", "2"]
+    assert still_hold_filter(3, scale=4).startswith("crop=iw:'min(ih,270)':0:0,")  # Same top 1080 rows, at 1/4 size
@@ -0,0 +1,26 @@
+from chunked_render import chunk_ranges, output_frame_count, plan_chunk_count
+
+
+def test_output_frame_count_rounds_each_segment():
+    assert output_frame_count([3.0, 31.0, 10.0], 30) == 90 + 930 + 300
+    assert output_frame_count([1.01, 1.01], 30) == 60  # Not round(2.02 * 30) == 61
+
+
+def test_plan_chunk_count_one_per_free_slot():
+    assert plan_chunk_count(1800, 30, 8) == 8
+
+
+def test_plan_chunk_count_respects_minimum_length():
+    assert plan_chunk_count(600, 30, 8) == 3  # 20 s of video, at least 6 s per chunk
+    assert plan_chunk_count(100, 30, 8) == 1
+
+
+def test_chunk_ranges_start_on_gop_boundaries():
+    ranges = chunk_ranges(1320, 4, gop_frames=60)
+    assert ranges == [(0, 300), (300, 660), (660, 960), (960, None)]
+    assert all(start % 60 == 0 for start, _ in ranges)
+
+
+def test_chunk_ranges_never_more_chunks_than_gops():
+    assert chunk_ranges(100, 8, gop_frames=60) == [(0, 60), (60, None)]
+    assert chunk_ranges(10, 4, gop_frames=60) == [(0, None)]
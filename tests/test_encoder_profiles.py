@@ -0,0 +1,29 @@
+import pytest
+from encoder_profiles import ENCODER_PROFILES, get_profile, template_overrides, x264_options
+
+
+def test_template_overrides():
+    assert template_overrides("NeedTextOverlay=delivery, Webinar = draft") == {
+        "NeedTextOverlay": "delivery",
+        "Webinar": "draft",
+    }
+
+
+def test_template_overrides_skips_malformed_items():
+    assert template_overrides("") == {}
+    assert template_overrides("NeedTextOverlay,=draft,,Webinar=draft") == {"Webinar": "draft"}
+
+
+def test_x264_options():
+    assert x264_options(ENCODER_PROFILES["archive"]) == {"crf": "16", "preset": "slow"}
+    assert x264_options(ENCODER_PROFILES["draft"]) == {"crf": "28", "preset": "veryfast"}
+
+
+def test_x264_options_rejects_hardware_profiles():
+    with pytest.raises(ValueError, match="qsv"):
+        x264_options(ENCODER_PROFILES["qsv"])
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError, match="Unknown encoder profile 'fast'"):
+        get_profile("fast")
@@ -0,0 +1,35 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+from generate_mask import robust_inliers, rolling_median
+
+
+def test_robust_inliers_rejects_outlier_box():
+    jitter = np.array([0, 2, -1, 3, -2, 1, 0, -3, 2, -1], dtype=float)[:, None]
+    boxes = np.array([[100, 100, 300, 400]], dtype=float) + jitter
+    boxes = np.vstack([boxes, [[800, 120, 1000, 420]]])  # A false detection on one frame
+    inliers = robust_inliers(boxes, k=3.0)
+    assert inliers[:-1].all()
+    assert not inliers[-1]
+
+
+def test_robust_inliers_keeps_still_speaker():
+    boxes = np.tile([100.0, 100.0, 300.0, 400.0], (8, 1))  # MAD of zero
+    assert robust_inliers(boxes, k=3.0).all()
+
+
+def test_robust_inliers_keeps_everything_when_nothing_survives():
+    boxes = np.array([[0, 0, 10, 10], [100, 100, 110, 110]], dtype=float)
+    assert robust_inliers(boxes, k=0.5).tolist() == [True, True]
+
+
+def test_rolling_median_removes_spike():
+    values = np.array([10, 10, 10, 90, 10, 10, 10], dtype=float)
+    assert rolling_median(values, window=5).tolist() == [10] * 7
+
+
+def test_rolling_median_short_input_unchanged():
+    values = np.array([1.0, 5.0])
+    assert rolling_median(values, window=5) is values
+
@@ -0,0 +1,31 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+from pyav_backend import alpha_composite, fit_audio
+
+
+def test_fit_audio_trims_to_frame_count():
+    samples = np.arange(2 * 5000, dtype=np.float32).reshape(2, 5000)
+    fitted = fit_audio(samples, 2)  # 2 frames at 30 fps = 3200 samples at 48 kHz
+    assert fitted.shape == (2, 3200)
+    assert np.array_equal(fitted, samples[:, :3200])
+
+
+def test_fit_audio_pads_with_silence():
+    samples = np.ones((2, 1000), dtype=np.float32)
+    fitted = fit_audio(samples, 3)
+    assert fitted.shape == (2, 4800)
+    assert np.all(fitted[:, :1000] == 1)
+    assert np.all(fitted[:, 1000:] == 0)
+
+
+def test_fit_audio_empty_track():
+    assert fit_audio(np.zeros((2, 0), dtype=np.float32), 30).shape == (2, 48000)
+
+
+def test_alpha_composite_clips_to_frame():
+    dst = np.zeros((4, 4, 3), dtype=np.uint8)
+    overlay = np.full((2, 2, 4), 255, dtype=np.uint8)
+    alpha_composite(dst, overlay, 3, -1)  # Only the bottom-left pixel of the overlay lands in the frame
+    assert dst[0, 3].tolist() == [255, 255, 255]
+    assert dst.sum() == 3 * 255
@@ -0,0 +1,97 @@
+from render_graph import build_single_pass_command, first_segment_duration, static_audio_segments, write_audio_concat_list
+
+
+def single_pass_command(**kwargs):
+    return build_single_pass_command(
+        ["-framerate", "30", "-i", "shot.jpg"],
+        "loop=loop=89:size=1:start=0",
+        "base.mp4",
+        "mask.png",
+        "393",
+        "700",
+        "10",
+        "10",
+        "NeedTextOverlay.mp4",
+        "drawtext=text='Prepared For\\: Acme'",
+        "last_explanation.mp4",
+        "out.mp4",
+        **kwargs,
+    )
+
+
+def filter_graph(command):
+    return command[command.index("-filter_complex") + 1]
+
+
+def test_first_segment_duration_is_the_longer_input():
+    assert first_segment_duration(3.0, 42.5) == 42.5
+    assert first_segment_duration(60.0, 42.5) == 60.0
+
+
+def test_first_segment_duration_unknown():
+    assert first_segment_duration(None, 42.5) is None
+    assert first_segment_duration(3.0, None) is None
+
+
+def test_speaker_audio_fitted_to_segment_duration():
+    graph = filter_graph(single_pass_command(segment_duration=42.5))
+    assert "[1:a] apad,atrim=end=42.5,asetpts=PTS-STARTPTS,aresample=48000" in graph
+    assert "[v0][a0][v1][a1][v2][a2] concat=n=3:v=1:a=1 [outv][outa]" in graph
+
+
+def test_speaker_audio_untouched_without_duration():
+    graph = filter_graph(single_pass_command())
+    assert "apad" not in graph
+    assert "[1:a] aresample=48000" in graph
+
+
+def test_inputs_without_speaker_asset():
+    command = single_pass_command()
+    graph = filter_graph(command)
+    assert "alphamerge [circle]" in graph
+    assert "[3:v] scale=1920:1080" in graph  # Text template after base video and mask
+    assert "[4:v] scale=1920:1080" in graph
+
+
+def test_inputs_with_speaker_asset():
+    command = single_pass_command(speaker_asset_path="speaker.mkv")
+    graph = filter_graph(command)
+    assert "mask.png" not in command
+    assert "[1:v] null [circle];" in graph
+    assert "[2:v] scale=1920:1080" in graph
+    assert "[3:v] scale=1920:1080" in graph
+
+
+def test_audio_list_is_stream_copied():
+    command = single_pass_command(speaker_asset_path="speaker.mkv", audio_list_path="out_audio.txt", segment_duration=42.5)
+    graph = filter_graph(command)
+    assert "concat=n=3:v=1:a=0 [outv]" in graph
+    assert "[1:a]" not in graph
+    assert command[command.index("out_audio.txt") - 5:command.index("out_audio.txt")] == ["-f", "concat", "-safe", "0", "-i"]
+    assert command[command.index("-map", command.index("-map") + 1):][:4] == ["-map", "4:a", "-c:a", "copy"]
+
+
+def test_frame_range_is_video_only():
+    command = single_pass_command(frame_range=(120, 240), gop_frames=60)
+    graph = filter_graph(command)
+    assert "[full] trim=start_frame=120:end_frame=240,setpts=PTS-STARTPTS [outv]" in graph
+    assert "-an" in command
+    assert command[command.index("-g") + 1] == "60"
+
+
+def test_last_frame_range_is_open_ended():
+    graph = filter_graph(single_pass_command(frame_range=(240, None)))
+    assert "[full] trim=start_frame=240,setpts=PTS-STARTPTS [outv]" in graph
+
+
+def test_static_audio_outpoints(tmp_path):
+    list_path = tmp_path / "out_audio.txt"
+    segments = static_audio_segments(tmp_path / "speaker.m4a", tmp_path / "template.m4a", tmp_path / "tail.m4a", 42.5, 31.0)
+    write_audio_concat_list(list_path, segments)
+    assert list_path.read_text().splitlines() == [
+        f"file '{tmp_path / 'speaker.m4a'}'",
+        "outpoint 42.500000",  # Segment 1's real length, not the background's
+        f"file '{tmp_path / 'template.m4a'}'",
+        "outpoint 31.000000",
+        f"file '{tmp_path / 'tail.m4a'}'",  # Last track is not cut
+    ]
@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip("cv2")
+from screenshot_loader import ScreenshotTooLargeError, proxy_scale_for
+
+
+@pytest.mark.parametrize(
+    "height, scale",
+    [
+        (180, 1),  # 1920x180x3 fits in 1 MB at full resolution
+        (700, 2),
+        (2900, 4),
+        (11000, 8),
+    ],
+)
+def test_proxy_scale_for_smallest_scale_in_budget(height, scale):
+    assert proxy_scale_for(1920, height, budget_mb=1) == scale
+
+
+def test_proxy_scale_for_default_budget_keeps_normal_pages_full_size():
+    assert proxy_scale_for(1920, 8000) == 1
+
+
+def test_proxy_scale_for_rejects_pages_over_budget_at_eighth_scale():
+    with pytest.raises(ScreenshotTooLargeError, match="STRIP_MEMORY_MB=1"):
+        proxy_scale_for(1920, 20000, budget_mb=1)
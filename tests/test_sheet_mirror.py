@@ -0,0 +1,46 @@
+import pytest
+
+pytest.importorskip("gspread")
+from sheet_backend import LocalWorksheet, write_local_sheet
+from sheet_mirror import SheetMirror
+from sheets_client import SheetsClient
+
+HEADERS = ["Website", "Company", "Screenshot", "Personal Video"]
+
+
+@pytest.fixture
+def sheet(tmp_path):
+    rows = [[f"https://example{n}.com", f"Company {n}", "", ""] for n in range(300)]
+    rows[1][3] = "done.mp4"
+    write_local_sheet(tmp_path / "sheet.csv", HEADERS, rows)
+    client = SheetsClient(LocalWorksheet(tmp_path / "sheet.csv"))
+    mirror = SheetMirror(client, "Personal Video", db_path=tmp_path / "mirror.sqlite3")
+    yield client, mirror
+    mirror.close()
+
+
+def test_sync_reads_the_sheet_once(sheet):
+    client, mirror = sheet
+    assert mirror.sync(HEADERS) == 300
+    assert sum(count for key, count in client.counters.items() if key.startswith("calls.")) == 1
+    assert mirror.rows(2, 4)[2] == ["https://example2.com", "Company 2"]  # Trailing empty cells dropped, like the API
+    assert mirror.pending_rows(limit=3) == [2, 4, 5]  # Row 3 already has a video
+
+
+def test_refresh_only_when_stale(sheet):
+    client, mirror = sheet
+    mirror.sync(HEADERS)
+    assert mirror.refresh(max_age=300) == 0
+    assert client.counters["calls.get_values"] == 1
+    client.update_acell("D2", "other-host.mp4")
+    assert mirror.refresh(max_age=0) == 1  # Only the edited row is rewritten
+    assert client.counters["calls.get_values"] == 2
+    assert mirror.first_pending_row() == 4
+
+
+def test_sync_drops_rows_removed_from_the_sheet(sheet, tmp_path):
+    client, mirror = sheet
+    mirror.sync(HEADERS)
+    write_local_sheet(tmp_path / "sheet.csv", HEADERS, [["https://example0.com", "Company 0", "", ""]])
+    mirror.sync(HEADERS)
+    assert mirror.last_row() == 2
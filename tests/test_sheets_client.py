@@ -0,0 +1,60 @@
+import pytest
+
+pytest.importorskip("gspread")
+import sheets_client
+from sheets_client import TokenBucket, backoff_delay
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(sheets_client.time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(sheets_client.time, "sleep", fake.sleep)
+    return fake
+
+
+def test_bucket_allows_burst_then_waits_for_refill(clock):
+    bucket = TokenBucket(rate_per_minute=60, burst=3)
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.acquire() == pytest.approx(1.0)  # One token per second
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+
+def test_bucket_refills_up_to_capacity(clock):
+    bucket = TokenBucket(rate_per_minute=60, burst=2)
+    bucket.acquire()
+    bucket.acquire()
+    clock.now += 3600
+    assert [bucket.acquire() for _ in range(2)] == [0.0, 0.0]
+    assert bucket.acquire() == pytest.approx(1.0)
+
+
+def test_drain_empties_the_bucket(clock):
+    bucket = TokenBucket(rate_per_minute=30, burst=10)
+    bucket.drain()
+    assert bucket.acquire() == pytest.approx(2.0)  # 30 per minute: one token every 2 s
+
+
+def test_backoff_cap_doubles_per_attempt(monkeypatch):
+    monkeypatch.setattr(sheets_client.random, "uniform", lambda low, high: high)
+    assert [backoff_delay(attempt) for attempt in range(7)] == [2, 4, 8, 16, 32, 64, 64]
+
+
+def test_backoff_full_jitter(monkeypatch):
+    calls = []
+    monkeypatch.setattr(sheets_client.random, "uniform", lambda low, high: calls.append((low, high)) or low)
+    assert backoff_delay(3, base=1, cap=100) == 0
+    assert calls == [(0, 8)]
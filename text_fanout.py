@@ -0,0 +1,39 @@
+import logging
+import os
+import subprocess
+import time
+from ffmpeg_runner import run_ffmpeg
+from render_graph import build_text_fanout_command
+from smart_cut import render_smart_cut_texts
+
+# Render a batch's text segments from one template decode. Only pipelines with a separate text pass use it
+# (RENDER_PIPELINE=three_step, NoWebPersonalvideowithmerging.py); single/chunked draw the text inside their own graph
+TEXT_FANOUT = os.getenv("TEXT_FANOUT", "true").lower() == "true"
+TEXT_FANOUT_MAX = int(os.getenv("TEXT_FANOUT_MAX", "8"))  # Outputs per decode; more saves decode, but one bad row fails the group
+
+
+async def render_text_batch(template_path, jobs, codec_args, text_end, audio_track=None, smart_cut=True):
+    """
+    Renders the text segment of every (drawtext, output_path) job, up to
+    TEXT_FANOUT_MAX outputs per ffmpeg run, each run decoding the template
+    once. Returns the output paths that were rendered; a group whose run
+    fails is logged and left out, so its rows can fall back to their own
+    per-row text pass.
+    """
+    rendered = []
+    for start in range(0, len(jobs), TEXT_FANOUT_MAX):
+        group = jobs[start:start + TEXT_FANOUT_MAX]
+        started = time.perf_counter()
+        try:
+            done = smart_cut and await render_smart_cut_texts(template_path, group, codec_args, text_end, audio_track)
+            if not done:
+                command = build_text_fanout_command(
+                    template_path, [drawtext for drawtext, _ in group], [path for _, path in group], codec_args, audio_track
+                )
+                await run_ffmpeg(command, stage="text_fanout")
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            logging.warning(f"Text fan-out of {len(group)} segments failed, rendering them per row: {e}")
+            continue
+        rendered += [path for _, path in group]
+        logging.info(f"Text fan-out: {len(group)} segments from one decode in {time.perf_counter() - started:.1f}s")
+    return rendered